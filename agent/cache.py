@@ -2,10 +2,14 @@
 Redis Cache Module for Travel Planning Agent
 Provides caching utilities to improve API performance
 """
+import copy
 import json
 import os
 import hashlib
+import threading
+import time
 import redis
+from collections import OrderedDict
 from typing import Any, Optional, Callable
 from functools import wraps
 import logging
@@ -319,10 +323,86 @@ def cache_key_for_cities() -> str:
     return "cities:list"
 
 
-def cache_key_for_plan(city: str, days: int, spots: list) -> str:
-    """Generate a specific cache key for an itinerary plan."""
-    spots_hash = hashlib.md5(json.dumps(sorted(spots)).encode()).hexdigest()[:8]
-    return f"plan:{city}:{days}:{spots_hash}"
+def data_version_for_spots(spots: list) -> str:
+    """
+    Short fingerprint of a city's spot data (a list of spot dicts).
+    Any edit to the data changes it, which invalidates cached plans.
+    """
+    payload = json.dumps(spots, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(payload.encode()).hexdigest()[:12]
+
+
+def cache_key_for_plan(city: str, days: int, spots: list, modes: Optional[list] = None,
+                       weights: Optional[list] = None, data_version: str = "",
+                       visits: Optional[int] = None) -> str:
+    """
+    Generate a specific cache key for an itinerary plan.
+
+    The request is canonicalized first: spot ids are sorted, weights are
+    expected already normalized (they are rounded here), and the city is
+    lower-cased, so equivalent requests share one key. `visits` is set when
+    the spots are candidates of which only that many are planned.
+    """
+    canonical = {
+        'spots': sorted(spots),
+        'modes': list(modes or []),
+        'weights': [round(float(w), 4) for w in (weights or [])],
+    }
+    if visits is not None:
+        canonical['visits'] = visits
+    request_hash = hashlib.md5(json.dumps(canonical, ensure_ascii=False).encode()).hexdigest()[:16]
+    return f"plan:{city.lower()}:{days}:{data_version}:{request_hash}"
+
+
+class PlanCache:
+    """
+    Cache for full plan comparison payloads.
+
+    Uses Redis when it is enabled so every worker shares hits; otherwise
+    keeps a bounded in-process LRU so popular plans are still served
+    without re-running the search.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        if cache.enabled and cache.redis_client:
+            return cache.get(key)
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any, ttl: int = 3600) -> bool:
+        if cache.enabled and cache.redis_client:
+            return cache.set(key, value, ttl)
+
+        with self._lock:
+            self._local[key] = (time.time() + ttl, copy.deepcopy(value))
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+        return True
+
+    def clear(self) -> None:
+        if cache.enabled and cache.redis_client:
+            cache.clear_pattern('plan:*')
+        with self._lock:
+            self._local.clear()
+
+
+plan_cache = PlanCache(max_entries=int(os.environ.get('PLAN_CACHE_MAX_ENTRIES', 256)))
+
 
 def cache_key_for_places(identifier: str) -> str:
     """Generate cache key for Google Places API responses."""
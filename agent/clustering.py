@@ -0,0 +1,91 @@
+"""
+Balanced spatial clustering of spots, used to split a trip into compact days.
+"""
+import math
+from typing import List
+
+import numpy as np
+
+# Lloyd iterations before giving up on convergence
+MAX_ITERATIONS = 25
+
+
+def project(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Equirectangular projection to planar km coordinates, shape (n, 2)."""
+    lat0 = math.radians(float(np.mean(lats))) if len(lats) else 0.0
+    return np.column_stack((lons * math.cos(lat0) * 111.0, lats * 111.0))
+
+
+def _kmeans_plus_plus(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centers = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        d2 = np.min(((points[:, None, :] - np.array(centers)[None, :, :]) ** 2).sum(axis=2), axis=1)
+        total = d2.sum()
+        if total <= 0:
+            centers.append(points[rng.integers(len(points))])
+        else:
+            centers.append(points[rng.choice(len(points), p=d2 / total)])
+    return np.array(centers)
+
+
+def _balanced_assign(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Assign points to their closest centers subject to balanced sizes:
+    every cluster gets floor(n/k) or ceil(n/k) points.
+    """
+    n, k = len(points), len(centers)
+    small, extra = divmod(n, k)
+    capacity = np.full(k, small)
+    big_left = extra  # clusters allowed to take one more point
+
+    d2 = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    order = np.argsort(d2, axis=None, kind="stable")
+
+    labels = np.full(n, -1)
+    sizes = np.zeros(k, dtype=int)
+    assigned = 0
+    for flat in order:
+        p, c = divmod(int(flat), k)
+        if labels[p] != -1:
+            continue
+        if sizes[c] < capacity[c]:
+            pass
+        elif sizes[c] == capacity[c] and big_left > 0 and capacity[c] == small:
+            capacity[c] += 1
+            big_left -= 1
+        else:
+            continue
+        labels[p] = c
+        sizes[c] += 1
+        assigned += 1
+        if assigned == n:
+            break
+    return labels
+
+
+def balanced_kmeans(lats: np.ndarray, lons: np.ndarray, k: int, seed: int = 0) -> List[List[int]]:
+    """
+    Split points into k geographically compact groups of (almost) equal size.
+    Returns the point indices of every group; groups may be empty when k > n.
+    """
+    n = len(lats)
+    if k <= 0:
+        return []
+    if n == 0:
+        return [[] for _ in range(k)]
+    if k >= n:
+        return [[i] for i in range(n)] + [[] for _ in range(k - n)]
+
+    rng = np.random.default_rng(seed)
+    points = project(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+    centers = _kmeans_plus_plus(points, k, rng)
+
+    labels = _balanced_assign(points, centers)
+    for _ in range(MAX_ITERATIONS):
+        centers = np.array([points[labels == c].mean(axis=0) for c in range(k)])
+        new_labels = _balanced_assign(points, centers)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    return [np.flatnonzero(labels == c).tolist() for c in range(k)]
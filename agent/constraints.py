@@ -1,11 +1,12 @@
 import math
 import random
 from copy import deepcopy
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
 from agent.models import Spot, DayPlan, Itinerary
 from agent.geometry import distance, TransportMode, travel_cost_minutes
+from agent.travel_matrix import TravelMatrix
 
 @dataclass
 class ScoreConfig:
@@ -59,7 +60,8 @@ def finalize_itinerary_distances(itinerary: Itinerary) -> None:
         day.total_distance_km = round(total, 2)
 
 
-def try_move_one_spot(itin: Itinerary) -> Itinerary:
+def try_move_one_spot(itin: Itinerary, rng: Optional[random.Random] = None) -> Itinerary:
+    rng = rng or random
     new_itin = deepcopy(itin)
     days = new_itin.days
 
@@ -67,10 +69,10 @@ def try_move_one_spot(itin: Itinerary) -> Itinerary:
     if not from_candidates:
         return new_itin
 
-    src = random.choice(from_candidates)
-    dst = random.choice([d for d in days if d.day != src.day])
+    src = rng.choice(from_candidates)
+    dst = rng.choice([d for d in days if d.day != src.day])
 
-    idx = random.randrange(len(src.spots))
+    idx = rng.randrange(len(src.spots))
     moved = src.spots.pop(idx)
     dst.spots.append(moved)
 
@@ -80,18 +82,19 @@ def try_move_one_spot(itin: Itinerary) -> Itinerary:
     return new_itin
 
 
-def try_swap_spots_between_days(itin: Itinerary) -> Itinerary:
+def try_swap_spots_between_days(itin: Itinerary, rng: Optional[random.Random] = None) -> Itinerary:
+    rng = rng or random
     new_itin = deepcopy(itin)
     days = new_itin.days
     if len(days) < 2:
         return new_itin
 
-    d1, d2 = random.sample(days, 2)
+    d1, d2 = rng.sample(days, 2)
     if not d1.spots or not d2.spots:
         return new_itin
 
-    i = random.randrange(len(d1.spots))
-    j = random.randrange(len(d2.spots))
+    i = rng.randrange(len(d1.spots))
+    j = rng.randrange(len(d2.spots))
 
     d1.spots[i], d2.spots[j] = d2.spots[j], d1.spots[i]
 
@@ -109,7 +112,7 @@ def plan_itinerary_soft_constraints(
     mode: TransportMode,
     trials: int = 200,
 ) -> Tuple[Itinerary, float, List[str]]:
-    random.seed(0)
+    rng = random.Random(0)
 
     base = build_initial_itinerary(city, spots, days)
     best = base
@@ -117,10 +120,10 @@ def plan_itinerary_soft_constraints(
 
     current = base
     for _ in range(trials):
-        if random.random() < 0.6:
-            candidate = try_move_one_spot(current)
+        if rng.random() < 0.6:
+            candidate = try_move_one_spot(current, rng)
         else:
-            candidate = try_swap_spots_between_days(current)
+            candidate = try_swap_spots_between_days(current, rng)
 
         candidate_score, candidate_reasons = score_itinerary(candidate, cfg, mode)
 
@@ -133,19 +136,32 @@ def plan_itinerary_soft_constraints(
     return best, best_score, best_reasons
 
 
-def score_itinerary(itinerary: Itinerary, cfg: ScoreConfig, mode: TransportMode) -> Tuple[float, List[str]]:
+def _day_travel_minutes(spots: List[Spot], mode: TransportMode, matrix: Optional[TravelMatrix]) -> float:
+    if matrix is not None:
+        return matrix.path_minutes(matrix.indices_of(spots))
+    travel_minutes = 0.0
+    for i in range(len(spots) - 1):
+        travel_minutes += travel_cost_minutes(spots[i], spots[i + 1], mode)
+    return travel_minutes
+
+
+def score_itinerary(
+    itinerary: Itinerary,
+    cfg: ScoreConfig,
+    mode: TransportMode,
+    matrix: Optional[TravelMatrix] = None,
+) -> Tuple[float, List[str]]:
     """
     Score the itinerary based on the configuration.
     Returns score and list of reasons for penalties.
+    When a TravelMatrix for `mode` is given, leg times are looked up in it.
     """
     reasons = []
     score = 0.0
 
     for day in itinerary.days:
         # Calculate travel time
-        travel_minutes = 0.0
-        for i in range(len(day.spots) - 1):
-            travel_minutes += travel_cost_minutes(day.spots[i], day.spots[i + 1], mode)
+        travel_minutes = _day_travel_minutes(day.spots, mode, matrix)
 
         # Check max daily minutes
         max_min = cfg.max_daily_minutes[mode]
@@ -164,6 +180,142 @@ def score_itinerary(itinerary: Itinerary, cfg: ScoreConfig, mode: TransportMode)
     return score, reasons
 
 
+class IncrementalScorer:
+    """
+    Scores neighbourhood moves by re-evaluating only the days they touch.
+
+    Works on the planner's compact state: one list of spot indices (rows of
+    `matrix`) per day. Per-day travel minutes and penalties are cached;
+    `evaluate` returns the score delta of replacing some days without
+    building reason strings, and `commit` adopts the change. Use
+    score_itinerary on the final itinerary to get the reasons.
+    """
+
+    # no state can score lower than this
+    lower_bound = 0.0
+
+    def __init__(
+        self,
+        day_paths: List[List[int]],
+        cfg: ScoreConfig,
+        mode: TransportMode,
+        matrix: TravelMatrix,
+    ):
+        self.cfg = cfg
+        self.mode = mode
+        self.matrix = matrix
+        self.max_minutes = cfg.max_daily_minutes[mode]
+
+        self.day_minutes: List[float] = []
+        self.day_penalties: List[float] = []
+        for path in day_paths:
+            minutes = matrix.path_minutes(path)
+            self.day_minutes.append(minutes)
+            self.day_penalties.append(self.day_penalty(len(path), minutes))
+
+    @property
+    def score(self) -> float:
+        return sum(self.day_penalties, 0.0)
+
+    @property
+    def penalty(self) -> float:
+        """What score_itinerary reports for the current state."""
+        return self.score
+
+    def day_penalty(self, n_spots: int, travel_minutes: float) -> float:
+        penalty = 0.0
+        if travel_minutes > self.max_minutes:
+            penalty += (travel_minutes - self.max_minutes) * self.cfg.exceed_minute_penalty
+        if n_spots < self.cfg.min_spots_per_day:
+            penalty += self.cfg.one_spot_day_penalty
+        return penalty
+
+    def evaluate(self, changes: Dict[int, List[int]]) -> Tuple[float, Dict[int, Tuple[float, float]]]:
+        """
+        Score delta of replacing the days in `changes` (day index -> new path)
+        against the cached state. Returns the delta and the per-day
+        (minutes, penalty) updates to pass to `commit`.
+        """
+        delta = 0.0
+        updates: Dict[int, Tuple[float, float]] = {}
+        for d, path in changes.items():
+            minutes = self.matrix.path_minutes(path)
+            penalty = self.day_penalty(len(path), minutes)
+            delta += penalty - self.day_penalties[d]
+            updates[d] = (minutes, penalty)
+        return delta, updates
+
+    def commit(self, updates: Dict[int, Tuple[float, float]]) -> None:
+        for d, (minutes, penalty) in updates.items():
+            self.day_minutes[d] = minutes
+            self.day_penalties[d] = penalty
+
+
+class PrizeCollectingScorer(IncrementalScorer):
+    """
+    IncrementalScorer for plans that visit only some of the candidate spots.
+
+    Every visited spot k earns `weight * prizes[k]`, which is subtracted
+    from the penalties, so the search trades travel time against skipping
+    attractive spots. Each travel minute also costs `travel_weight`, so that
+    among equally attractive choices the compact ones win even when no day
+    is over its limit. `score` is the search objective; `penalty` leaves
+    out the prizes and travel weight, so it is what score_itinerary reports.
+    """
+
+    def __init__(
+        self,
+        day_paths: List[List[int]],
+        cfg: ScoreConfig,
+        mode: TransportMode,
+        matrix: TravelMatrix,
+        prizes: List[float],
+        weight: float,
+        travel_weight: float = 0.0,
+    ):
+        self.prizes = list(prizes)
+        self.weight = weight
+        self.travel_weight = travel_weight
+        super().__init__(day_paths, cfg, mode, matrix)
+        self.day_prizes: List[float] = [self.path_prize(path) for path in day_paths]
+
+        visits = sum(len(path) for path in day_paths)
+        self.lower_bound = -weight * sum(sorted(self.prizes, reverse=True)[:visits])
+
+    @property
+    def penalty(self) -> float:
+        # rounded so that a plan within every limit reports exactly 0
+        return round(sum(self.day_penalties, 0.0) - self.travel_weight * sum(self.day_minutes, 0.0), 6)
+
+    @property
+    def score(self) -> float:
+        return sum(self.day_penalties, 0.0) - self.weight * sum(self.day_prizes, 0.0)
+
+    def day_penalty(self, n_spots: int, travel_minutes: float) -> float:
+        return super().day_penalty(n_spots, travel_minutes) + self.travel_weight * travel_minutes
+
+    def path_prize(self, path: List[int]) -> float:
+        prizes = self.prizes
+        return sum((prizes[k] for k in path), 0.0)
+
+    def evaluate(self, changes: Dict[int, List[int]]) -> Tuple[float, Dict[int, Tuple[float, float, float]]]:
+        delta = 0.0
+        updates: Dict[int, Tuple[float, float, float]] = {}
+        for d, path in changes.items():
+            minutes = self.matrix.path_minutes(path)
+            penalty = self.day_penalty(len(path), minutes)
+            prize = self.path_prize(path)
+            delta += penalty - self.day_penalties[d] - self.weight * (prize - self.day_prizes[d])
+            updates[d] = (minutes, penalty, prize)
+        return delta, updates
+
+    def commit(self, updates: Dict[int, Tuple[float, float, float]]) -> None:
+        for d, (minutes, penalty, prize) in updates.items():
+            self.day_minutes[d] = minutes
+            self.day_penalties[d] = penalty
+            self.day_prizes[d] = prize
+
+
 # Debugging helper functions
 def debug_score_itinerary(itinerary: Itinerary, cfg: ScoreConfig, mode: TransportMode):
     score, reasons = score_itinerary(itinerary, cfg, mode)
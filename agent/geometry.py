@@ -1,12 +1,12 @@
-import math
-from agent.models import Spot
 from enum import Enum
 
-def  distance(a: Spot, b: Spot) -> float:
-    lat_avg = math.radians((a.lat + b.lat) / 2)
-    dlat = a.lat - b.lat
-    dlon = (a.lon - b.lon) * math.cos(lat_avg)
-    return math.sqrt(dlat**2 + dlon**2) * 111
+import numpy as np
+
+from agent.models import Spot
+
+# Mean Earth radius in km
+EARTH_RADIUS_KM = 6371.0088
+
 
 class TransportMode(str, Enum):
     WALK = "walk"
@@ -14,30 +14,78 @@ class TransportMode(str, Enum):
     TAXI = "taxi"
 
 
-def distance(a: Spot, b: Spot) -> float:
+def _haversine_km(lat1, lon1, lat2, lon2):
     """
-    Rough distance in km.
+    Great-circle distance in km. Works on scalars and on NumPy arrays
+    (with the usual broadcasting rules).
     """
-    return ((a.lat - b.lat) ** 2 + (a.lon - b.lon) ** 2) ** 0.5 * 111
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
 
 
-def travel_cost_minutes(a: Spot, b: Spot, mode: TransportMode) -> float:
+def distances_from(lat: float, lon: float, lats, lons) -> np.ndarray:
     """
-    Travel cost in minutes depending on transport mode.
+    Distance (km) from one point to every point of `lats`/`lons`, shape (n,).
     """
-    km = distance(a, b)
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    return _haversine_km(lat, lon, lats, lons)
+
+
+def pairwise_distances(lats_a, lons_a, lats_b, lons_b) -> np.ndarray:
+    """
+    Distance (km) between every point of set A and every point of set B,
+    shape (len(A), len(B)).
+    """
+    lats_a = np.asarray(lats_a, dtype=float)[:, None]
+    lons_a = np.asarray(lons_a, dtype=float)[:, None]
+    lats_b = np.asarray(lats_b, dtype=float)[None, :]
+    lons_b = np.asarray(lons_b, dtype=float)[None, :]
+    return _haversine_km(lats_a, lons_a, lats_b, lons_b)
 
-    if mode == TransportMode.WALK:
-        speed_kmh = 4.5
-        return (km / speed_kmh) * 60
 
-    if mode == TransportMode.TRANSIT:
-        speed_kmh = 20.0
-        wait_time = 5.0
-        return (km / speed_kmh) * 60 + wait_time
+def distance_matrix(lats, lons) -> np.ndarray:
+    """
+    Symmetric (n, n) distance matrix (km) of one point set, zero diagonal.
+    """
+    km = pairwise_distances(lats, lons, lats, lons)
+    # keep the matrix exactly symmetric regardless of rounding
+    km = np.minimum(km, km.T)
+    np.fill_diagonal(km, 0.0)
+    return km
 
-    if mode == TransportMode.TAXI:
-        speed_kmh = 30.0
-        return (km / speed_kmh) * 60
 
-    raise ValueError(f"Unknown transport mode: {mode}")
+def distance(a: Spot, b: Spot) -> float:
+    """
+    Great-circle distance between two spots in km.
+    """
+    return float(_haversine_km(a.lat, a.lon, b.lat, b.lon))
+
+
+# (speed in km/h, fixed wait in minutes) per transport mode
+_MODE_SPEED_AND_WAIT = {
+    TransportMode.WALK: (4.5, 0.0),
+    TransportMode.TRANSIT: (20.0, 5.0),
+    TransportMode.TAXI: (30.0, 0.0),
+}
+
+
+def mode_speed_and_wait(mode: TransportMode) -> tuple:
+    """
+    Average speed (km/h) and fixed wait time (minutes) of a transport mode.
+    """
+    try:
+        return _MODE_SPEED_AND_WAIT[mode]
+    except KeyError:
+        raise ValueError(f"Unknown transport mode: {mode}")
+
+
+def travel_cost_minutes(a: Spot, b: Spot, mode: TransportMode) -> float:
+    """
+    Travel cost in minutes depending on transport mode.
+    """
+    km = distance(a, b)
+    speed_kmh, wait_time = mode_speed_and_wait(mode)
+    return (km / speed_kmh) * 60 + wait_time
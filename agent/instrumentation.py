@@ -0,0 +1,114 @@
+"""
+Optional instrumentation for planning runs.
+
+A PlanTrace collects per-phase wall times, counters (e.g. accepted and
+rejected search moves) and a score-vs-iteration trace. Code that can be
+traced takes a `trace` argument defaulting to NULL_TRACE, whose methods do
+nothing, so an untraced run pays one no-op call per phase. The search
+loops keep their counts in locals and only hand them over once at the end.
+
+Traces of work done elsewhere (a pool worker, one transport mode) are
+attached as named children, giving a tree that serializes with to_dict().
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Points kept in a score trace; later points replace the tail so the final
+# state is always present
+MAX_TRACE_POINTS = 500
+
+
+class PlanTrace:
+    """Timers, counters and a score trace for one planning run."""
+
+    enabled = True
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.points: List[List[float]] = []
+        self.children: Dict[str, "PlanTrace"] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the wall time of the enclosed block to phase `name` (ms)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def point(self, iteration: int, score: float) -> None:
+        """Record the score reached after `iteration` search moves."""
+        entry = [iteration, round((time.perf_counter() - self._start) * 1000, 3), score]
+        if len(self.points) >= MAX_TRACE_POINTS:
+            self.points[-1] = entry
+        else:
+            self.points.append(entry)
+
+    def child(self, name: str) -> "PlanTrace":
+        """Trace for a named sub-task, created on first use."""
+        child = self.children.get(name)
+        if child is None:
+            child = PlanTrace()
+            self.children[name] = child
+        return child
+
+    def attach(self, name: str, child: "PlanTrace") -> None:
+        """Adopt a trace collected elsewhere (e.g. returned by a pool worker)."""
+        self.children[name] = child
+
+    def to_dict(self) -> dict:
+        data = {
+            'timings_ms': {k: round(v, 3) for k, v in self.timings.items()},
+            'counters': dict(self.counters),
+        }
+        if self.points:
+            data['score_trace'] = {'columns': ['iteration', 'elapsed_ms', 'score'], 'points': self.points}
+        if self.children:
+            data['children'] = {name: child.to_dict() for name, child in self.children.items()}
+        return data
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTrace:
+    """Stand-in used when tracing is off; every method is a no-op."""
+
+    enabled = False
+    _phase = _NullPhase()
+
+    def phase(self, name: str) -> _NullPhase:
+        return self._phase
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def point(self, iteration: int, score: float) -> None:
+        pass
+
+    def child(self, name: str) -> "_NullTrace":
+        return self
+
+    def attach(self, name: str, child) -> None:
+        pass
+
+    def to_dict(self) -> Optional[dict]:
+        return None
+
+
+NULL_TRACE = _NullTrace()
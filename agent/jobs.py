@@ -0,0 +1,416 @@
+"""
+Background jobs for CPU-heavy planning requests.
+
+Submitting a job returns its id straight away; a bounded set of worker
+threads runs the job's handler while the web workers keep serving cheap
+endpoints. Job records (status, latest progress, result) live in a
+pluggable backend, selected with PLAN_JOB_BACKEND:
+
+- auto:   redis when Redis is reachable, else memory (the default)
+- redis:  records and queue in Redis, so every web worker can answer
+          status polls and pick up queued jobs
+- memory: records and queue in this process; status polls only work when
+          they reach the same process, i.e. with a single web worker
+- inline: a local stand-in that runs each job synchronously on submit,
+          for tests and scripts that want no threads
+
+A running job holds a lease that its worker renews every JOB_LEASE / 3
+seconds. A job still marked running after its lease ran out belonged to a
+worker that died; the next status poll fails it.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+from redis.exceptions import WatchError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a finished job (and its result) stays available
+JOB_TTL = int(os.environ.get('PLAN_JOB_TTL', 3600))
+
+# Worker threads per process
+JOB_WORKERS = int(os.environ.get('PLAN_JOB_WORKERS', 2))
+
+# Queued or running jobs accepted per queue before submit() refuses more
+JOB_MAX_PENDING = int(os.environ.get('PLAN_JOB_MAX_PENDING', 50))
+
+# Seconds a running job's lease lasts without being renewed
+JOB_LEASE = float(os.environ.get('PLAN_JOB_LEASE', 60))
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when too many jobs are already waiting."""
+
+
+class JobFailed(Exception):
+    """
+    Raised by a handler to fail its job with a client-facing reason and
+    HTTP status code.
+    """
+
+    def __init__(self, reason: str, status_code: int = 500, message: str = "Error"):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.message = message
+
+
+_handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+_local = threading.local()
+
+
+def register_handler(kind: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+    """Register the function that runs jobs of `kind` (it gets the payload)."""
+    _handlers[kind] = handler
+
+
+def current_job() -> Optional["JobContext"]:
+    """The job the calling worker thread is running, if any."""
+    return getattr(_local, 'job', None)
+
+
+class JobContext:
+    """Handle given to a running job so it can publish progress."""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self.queue = queue
+        self.id = job_id
+
+    def report(self, progress: Dict[str, Any]) -> None:
+        self.queue._update(self.id, progress=progress)
+
+
+class JobQueue(ABC):
+    """
+    Common job bookkeeping; backends provide storage and dispatch by
+    implementing every abstract method.
+    """
+
+    backend = "base"
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self.pending_count() >= JOB_MAX_PENDING:
+            raise JobQueueFull(f"More than {JOB_MAX_PENDING} jobs are waiting")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._save({
+            'id': job_id,
+            'kind': kind,
+            'status': JobStatus.QUEUED.value,
+            'progress': None,
+            'created_at': now,
+            'updated_at': now,
+        }, payload)
+        self._dispatch(job_id)
+        logger.info(f"Submitted {kind} job {job_id} ({self.backend})")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job record (including its result once done), or None."""
+        record = self._load(job_id)
+        if record is not None and record['status'] == JobStatus.RUNNING.value and not self._has_lease(job_id):
+            logger.warning(f"Job {job_id} lost its worker")
+            # the worker may still finish it in the meantime; don't overwrite that
+            self._update(job_id, only_if=JobStatus.RUNNING.value, status=JobStatus.FAILED.value, error={
+                'reason': "The worker running this job stopped", 'code': 500, 'message': "Job error",
+            })
+            record = self._load(job_id)
+        return record
+
+    def _run(self, job_id: str) -> None:
+        record = self._load(job_id)
+        payload = self._load_payload(job_id)
+        if record is None or payload is None:
+            logger.warning(f"Job {job_id} expired before it ran")
+            return
+
+        # the lease is taken before the job shows as running and dropped after it finished
+        self._renew_lease(job_id)
+        stop_renewing = threading.Event()
+
+        def renew():
+            while not stop_renewing.wait(JOB_LEASE / 3):
+                self._renew_lease(job_id)
+
+        renewer = threading.Thread(target=renew, name=f"job-lease-{job_id[:8]}", daemon=True)
+        renewer.start()
+        self._update(job_id, status=JobStatus.RUNNING.value)
+        _local.job = JobContext(self, job_id)
+        start = time.time()
+        try:
+            result = _handlers[record['kind']](payload)
+        except JobFailed as e:
+            self._update(job_id, status=JobStatus.FAILED.value, error={
+                'reason': e.reason, 'code': e.status_code, 'message': e.message,
+            })
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self._update(job_id, status=JobStatus.FAILED.value, error={
+                'reason': str(e), 'code': 500, 'message': "Job error",
+            })
+        else:
+            self._update(job_id, status=JobStatus.DONE.value, result=result)
+        finally:
+            _local.job = None
+            stop_renewing.set()
+            renewer.join()
+            self._drop_lease(job_id)
+            logger.info(f"Job {job_id} finished in {time.time() - start:.2f}s")
+
+    # ----- backend interface -----
+
+    @abstractmethod
+    def pending_count(self) -> int:
+        ...
+
+    @abstractmethod
+    def _save(self, record: Dict[str, Any], payload: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _load_payload(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _update(self, job_id: str, only_if: Optional[str] = None, **fields) -> None:
+        """Set `fields` on the record, atomically; with `only_if`, only while it has that status."""
+
+    @abstractmethod
+    def _dispatch(self, job_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def _renew_lease(self, job_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def _has_lease(self, job_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _drop_lease(self, job_id: str) -> None:
+        ...
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs kept and run in this process on a bounded thread pool."""
+
+    backend = "memory"
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        self._leases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="plan-job")
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(
+                1 for r in self._records.values()
+                if r['status'] in (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+            )
+
+    def _expire(self) -> None:
+        # oldest first; only finished jobs expire
+        cutoff = time.time() - JOB_TTL
+        for job_id, record in list(self._records.items()):
+            if record['updated_at'] >= cutoff:
+                break
+            if record['status'] in (JobStatus.DONE.value, JobStatus.FAILED.value):
+                del self._records[job_id]
+                self._payloads.pop(job_id, None)
+
+    def _save(self, record, payload):
+        with self._lock:
+            self._expire()
+            self._records[record['id']] = record
+            self._payloads[record['id']] = payload
+
+    def _load(self, job_id):
+        with self._lock:
+            record = self._records.get(job_id)
+            return dict(record) if record is not None else None
+
+    def _load_payload(self, job_id):
+        with self._lock:
+            return self._payloads.get(job_id)
+
+    def _update(self, job_id, only_if=None, **fields):
+        with self._lock:
+            record = self._records.get(job_id)
+            if record is None or (only_if is not None and record['status'] != only_if):
+                return
+            record.update(fields, updated_at=time.time())
+            self._records.move_to_end(job_id)
+            if fields.get('status') in (JobStatus.DONE.value, JobStatus.FAILED.value):
+                self._payloads.pop(job_id, None)
+
+    def _dispatch(self, job_id):
+        self._executor.submit(self._run, job_id)
+
+    def _renew_lease(self, job_id):
+        with self._lock:
+            self._leases[job_id] = time.time() + JOB_LEASE
+
+    def _has_lease(self, job_id):
+        with self._lock:
+            return self._leases.get(job_id, 0.0) > time.time()
+
+    def _drop_lease(self, job_id):
+        with self._lock:
+            self._leases.pop(job_id, None)
+
+
+class InlineJobQueue(MemoryJobQueue):
+    """Local stand-in: runs every job synchronously inside submit()."""
+
+    backend = "inline"
+
+    def __init__(self):
+        self._records = OrderedDict()
+        self._payloads = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _dispatch(self, job_id):
+        self._run(job_id)
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Job records and the queue live in Redis; every process running this
+    backend contributes `max_workers` threads that pop queued jobs.
+    """
+
+    backend = "redis"
+    QUEUE_KEY = "jobs:queue"
+    # running job ids, scored by when their lease runs out
+    RUNNING_KEY = "jobs:running"
+
+    def __init__(self, client, max_workers: int = JOB_WORKERS):
+        self.client = client
+        # a blocking pop must return well before the client's socket times out
+        socket_timeout = client.connection_pool.connection_kwargs.get('socket_timeout')
+        self._pop_timeout = 5 if socket_timeout is None else max(0.1, socket_timeout / 2)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"plan-job-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def pending_count(self) -> int:
+        # running jobs whose lease ran out belonged to a dead worker
+        self.client.zremrangebyscore(self.RUNNING_KEY, '-inf', time.time())
+        return int(self.client.llen(self.QUEUE_KEY)) + int(self.client.zcard(self.RUNNING_KEY))
+
+    def _save(self, record, payload):
+        self.client.setex(self._key(record['id']), JOB_TTL, json.dumps(record, ensure_ascii=False))
+        self.client.setex(self._key(record['id']) + ":payload", JOB_TTL, json.dumps(payload, ensure_ascii=False))
+
+    def _load(self, job_id):
+        value = self.client.get(self._key(job_id))
+        return json.loads(value) if value else None
+
+    def _load_payload(self, job_id):
+        value = self.client.get(self._key(job_id) + ":payload")
+        return json.loads(value) if value else None
+
+    def _update(self, job_id, only_if=None, **fields):
+        # the worker running a job and status polls failing it after its lease
+        # ran out can write the same record; WATCH makes the read-modify-write
+        # start over when another write got in between
+        key = self._key(job_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    value = pipe.get(key)
+                    record = json.loads(value) if value else None
+                    if record is None or (only_if is not None and record['status'] != only_if):
+                        return
+                    record.update(fields, updated_at=time.time())
+                    pipe.multi()
+                    pipe.setex(key, JOB_TTL, json.dumps(record, ensure_ascii=False))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def _dispatch(self, job_id):
+        self.client.lpush(self.QUEUE_KEY, job_id)
+
+    def _renew_lease(self, job_id):
+        self.client.set(self._key(job_id) + ":lease", 1, px=int(JOB_LEASE * 1000))
+        self.client.zadd(self.RUNNING_KEY, {job_id: time.time() + JOB_LEASE})
+
+    def _has_lease(self, job_id):
+        return bool(self.client.exists(self._key(job_id) + ":lease"))
+
+    def _drop_lease(self, job_id):
+        self.client.delete(self._key(job_id) + ":lease")
+        self.client.zrem(self.RUNNING_KEY, job_id)
+
+    def _work(self):
+        while True:
+            try:
+                item = self.client.brpop(self.QUEUE_KEY, timeout=self._pop_timeout)
+            except Exception as e:
+                logger.error(f"Job queue unavailable: {e}")
+                time.sleep(5)
+                continue
+            if item:
+                self._run(item[1])
+
+
+def _memory_queue(reason: str) -> MemoryJobQueue:
+    logger.warning(f"{reason}; using in-process jobs, which only work with a single web worker")
+    return MemoryJobQueue()
+
+
+def create_job_queue(backend: Optional[str] = None) -> JobQueue:
+    """
+    Build the job queue for `backend` (default: PLAN_JOB_BACKEND, else
+    auto). auto and redis use Redis when it is enabled and reachable and
+    fall back to memory otherwise.
+    """
+    backend = (backend or os.environ.get('PLAN_JOB_BACKEND', 'auto')).lower()
+    if backend in ('auto', 'redis'):
+        from agent.cache import get_cache_client
+        client = get_cache_client()
+        if client is not None:
+            return RedisJobQueue(client)
+        return _memory_queue("Redis is unavailable for plan jobs")
+    if backend == 'inline':
+        return InlineJobQueue()
+    if backend != 'memory':
+        return _memory_queue(f"Unknown PLAN_JOB_BACKEND '{backend}'")
+    return _memory_queue("PLAN_JOB_BACKEND=memory")
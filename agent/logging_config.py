@@ -34,6 +34,8 @@ class JSONFormatter(logging.Formatter):
             log_obj["request_id"] = record.request_id
         if hasattr(record, 'duration'):
             log_obj["duration_ms"] = record.duration
+        if hasattr(record, 'plan_trace'):
+            log_obj["plan_trace"] = record.plan_trace
         
         return json.dumps(log_obj)
 
@@ -185,6 +187,20 @@ def log_performance(logger, threshold_ms=1000):
     return decorator
 
 
+def log_plan_trace(logger, trace, context=None):
+    """
+    Log a planning trace (PlanTrace.to_dict()) with its top-level phase
+    timings in the message; the full trace goes to the JSON log.
+    """
+    if not trace:
+        return
+    timings = ", ".join(f"{name}={ms:.1f}ms" for name, ms in trace.get('timings_ms', {}).items())
+    log_data = {"plan_trace": trace}
+    if context:
+        log_data.update(context)
+    logger.info(f"Plan trace: {timings}", extra=log_data)
+
+
 # Usage example
 if __name__ == "__main__":
     # Setup logger
@@ -29,6 +29,11 @@ class NearbyShop(BaseModel):
     address: Optional[str] = None
 
 
+# Spot fields only shown to users; planning and ranking never read them,
+# so bulk spot data can keep them aside (see agent.spot_store)
+DETAIL_FIELDS = ("description", "nearby_foods", "nearby_shops")
+
+
 class Spot(BaseModel):
     name: str
     lat: float
@@ -59,6 +64,20 @@ class Spot(BaseModel):
         }
 
 
+# One fields-set object shared by all constructed spots instead of one
+# set per instance
+_SPOT_FIELDS = set(Spot.model_fields)
+
+
+def construct_spot(**fields) -> Spot:
+    """
+    A Spot from already validated values, skipping validation, for bulk
+    data that was validated when it was written (e.g. compiled snapshots).
+    Fields that are not given default to None.
+    """
+    return Spot.model_construct(_fields_set=_SPOT_FIELDS, **fields)
+
+
 class DayPlan(BaseModel):
     day: int
     spots: List[Spot]
@@ -0,0 +1,136 @@
+"""
+Shared process pool for CPU-bound planning work.
+
+Planning searches are pure Python and CPU-bound, so threads do not help;
+this module keeps one lazily created ProcessPoolExecutor per process that
+the planner and the web app submit work to. The pool is sized once, from
+PLANNER_WORKERS; callers that want to use only part of it submit through
+a TaskLimiter rather than asking for a pool of their own size.
+"""
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait as wait_futures
+from multiprocessing.managers import SyncManager
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_manager: Optional[SyncManager] = None
+_lock = threading.Lock()
+
+
+def default_worker_count() -> int:
+    """Worker count from PLANNER_WORKERS, falling back to the CPU count."""
+    configured = os.environ.get('PLANNER_WORKERS')
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            logger.warning(f"Invalid PLANNER_WORKERS value: {configured}")
+    return os.cpu_count() or 1
+
+
+def _mp_context():
+    """Start method for pool workers: forkserver where available, else spawn."""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            workers = default_worker_count()
+            # the pool is started from threaded web workers; forking those
+            # can copy a held lock into the child, so start from a server
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+            logger.info(f"Started planning process pool with {workers} workers")
+        return _pool
+
+
+def shutdown_process_pool(wait: bool = True) -> None:
+    """Shut the shared pool down (a new one is created on next use)."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+        _pool = None
+
+
+class TaskLimiter:
+    """
+    Runs one caller's tasks on the shared pool with at most `limit` of them
+    queued or running at a time (no limit for None).
+
+    `tasks` yields (key, fn, args, kwargs) tuples and is consumed lazily:
+    tasks are submitted as earlier ones finish, so a caller can act on the
+    first results before later tasks have even been submitted.
+    """
+
+    def __init__(self, tasks: Iterable[Tuple[Hashable, Callable, tuple, dict]], limit: Optional[int] = None):
+        self.pool = get_process_pool()
+        self._tasks = iter(tasks)
+        self._limit = limit
+        self._running: Dict[Future, Hashable] = {}
+        self._top_up()
+
+    def _top_up(self) -> None:
+        while self._limit is None or len(self._running) < self._limit:
+            task = next(self._tasks, None)
+            if task is None:
+                return
+            key, fn, args, kwargs = task
+            self._running[self.pool.submit(fn, *args, **kwargs)] = key
+
+    @property
+    def pending(self) -> bool:
+        """Whether tasks are still running or waiting to be submitted."""
+        return bool(self._running)
+
+    def wait(self, timeout: Optional[float] = None) -> List[Tuple[Hashable, Future]]:
+        """
+        Wait up to `timeout` seconds for running tasks to finish and return
+        the (key, future) pairs of those that did, after submitting the
+        tasks that take their place.
+        """
+        done, _ = wait_futures(self._running, timeout=timeout, return_when=FIRST_COMPLETED)
+        finished = [(self._running.pop(f), f) for f in done]
+        self._top_up()
+        return finished
+
+    def as_completed(self) -> Iterator[Tuple[Hashable, Future]]:
+        """(key, future) pairs of every task, in order of completion."""
+        while self._running:
+            yield from self.wait()
+
+    def cancel(self) -> None:
+        """Drop the tasks not submitted yet and cancel queued ones."""
+        self._tasks = iter(())
+        for f in self._running:
+            f.cancel()
+
+
+def get_manager() -> SyncManager:
+    """
+    Shared multiprocessing manager, started on first use. Its queues can be
+    passed to pool tasks so workers can report back while they run.
+    """
+    global _manager
+    with _lock:
+        if _manager is None:
+            _manager = _mp_context().Manager()
+            logger.info("Started planning progress manager")
+        return _manager
+
+
+def shutdown_manager() -> None:
+    """Stop the shared manager (a new one is started on next use)."""
+    global _manager
+    with _lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
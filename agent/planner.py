@@ -1,17 +1,41 @@
 import math
 import random
-from copy import deepcopy
-from typing import List, Tuple
+import time
+from dataclasses import dataclass
+from enum import Enum
+from concurrent.futures.process import BrokenProcessPool
+from queue import Empty
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from agent.models import Spot, DayPlan, Itinerary
-from agent.constraints import ScoreConfig, score_itinerary
+from agent.constraints import ScoreConfig, IncrementalScorer, PrizeCollectingScorer, score_itinerary
 from agent.geometry import distance
 from agent.geometry import TransportMode
-
-def nearest_neighbor_path(spots: List[Spot]) -> List[Spot]:
+from agent.travel_matrix import DistanceMatrix, TravelMatrix
+from agent.routing import DEFAULT_NEIGHBORS, RouteOptimizer
+from agent.clustering import balanced_kmeans
+from agent.spatial import GridIndex
+from agent.parallel import TaskLimiter, get_manager, shutdown_process_pool
+from agent.instrumentation import NULL_TRACE, PlanTrace
+
+def nearest_neighbor_path(spots: List[Spot], matrix: Optional[TravelMatrix] = None) -> List[Spot]:
     if not spots:
         return []
 
+    if matrix is not None:
+        idx = matrix.indices_of(spots)
+        rows = matrix.km_rows
+        unvisited_pos = list(range(len(spots)))
+        order = [unvisited_pos.pop(0)]
+        while unvisited_pos:
+            row = rows[idx[order[-1]]]
+            nxt = min(unvisited_pos, key=lambda p: row[idx[p]])
+            order.append(nxt)
+            unvisited_pos.remove(nxt)
+        return [spots[p] for p in order]
+
     unvisited = spots[:]
     path = [unvisited.pop(0)]
 
@@ -24,78 +48,534 @@ def nearest_neighbor_path(spots: List[Spot]) -> List[Spot]:
     return path
 
 
-def build_initial_itinerary(city: str, spots: List[Spot], days: int) -> Itinerary:
-    spots_sorted = sorted(spots, key=lambda s: (s.lon, s.lat))
+class InitialItinerary(str, Enum):
+    ROUND_ROBIN = "round_robin"
+    CLUSTER = "cluster"
 
-    chunks: List[List[Spot]] = [[] for _ in range(days)]
-    for i, s in enumerate(spots_sorted):
-        chunks[i % days].append(s)
 
-    day_plans: List[DayPlan] = []
-    for i in range(days):
-        ordered = nearest_neighbor_path(chunks[i])
-        day_plans.append(
-            DayPlan(day=i + 1, spots=ordered, total_distance_km=0.0)
-        )
+def _initial_day_paths(
+    spots: List[Spot],
+    days: int,
+    matrix: TravelMatrix,
+    router: Optional[RouteOptimizer] = None,
+    initial: InitialItinerary = InitialItinerary.ROUND_ROBIN,
+    seed: int = 0,
+) -> List[List[int]]:
+    """
+    Split spot indices into days, each in nearest-neighbour order (then
+    2-opt/Or-opt improved when a router is given).
 
-    return Itinerary(city=city, days=day_plans)
+    ROUND_ROBIN deals lon-sorted spots across days; CLUSTER groups them into
+    geographically compact days of balanced size with k-means seeded with
+    `seed`, so every day holds at least floor(n / days) spots.
+    """
+    if InitialItinerary(initial) == InitialItinerary.CLUSTER:
+        chunks = balanced_kmeans(matrix.lats, matrix.lons, days, seed=seed)
+        # stable day order: west to east, like the round-robin split
+        chunks.sort(key=lambda c: float(matrix.lons[c].mean()) if c else math.inf)
+    else:
+        order = sorted(range(len(spots)), key=lambda i: (spots[i].lon, spots[i].lat))
+
+        chunks: List[List[int]] = [[] for _ in range(days)]
+        for i, k in enumerate(order):
+            chunks[i % days].append(k)
+
+    paths = [matrix.nearest_neighbor_order(chunk) for chunk in chunks]
+    if router is not None:
+        paths = [router.improve(path) for path in paths]
+    return paths
+
+
+def _materialize_itinerary(
+    city: str, spots: List[Spot], day_paths: List[List[int]], matrix: TravelMatrix
+) -> Itinerary:
+    """Build the pydantic Itinerary for a compact per-day index state."""
+    return Itinerary(
+        city=city,
+        days=[
+            DayPlan(
+                day=i + 1,
+                spots=[spots[k] for k in path],
+                total_distance_km=round(matrix.path_km(path), 2),
+            )
+            for i, path in enumerate(day_paths)
+        ],
+    )
+
+
+def build_initial_itinerary(
+    city: str,
+    spots: List[Spot],
+    days: int,
+    matrix: Optional[TravelMatrix] = None,
+    initial: InitialItinerary = InitialItinerary.ROUND_ROBIN,
+) -> Itinerary:
+    if matrix is None:
+        # only distances are needed here, so any mode will do
+        matrix = TravelMatrix(spots, TransportMode.WALK)
+    day_paths = _initial_day_paths(spots, days, matrix, initial=initial)
+    return _materialize_itinerary(city, spots, day_paths, matrix)
 
-from agent.models import Itinerary
-from agent.geometry import distance
+
+def build_clustered_itinerary(
+    city: str, spots: List[Spot], days: int, matrix: Optional[TravelMatrix] = None
+) -> Itinerary:
+    """Initial itinerary made of geographically compact, balanced days."""
+    return build_initial_itinerary(city, spots, days, matrix, InitialItinerary.CLUSTER)
 
 
-def finalize_itinerary_distances(itinerary: Itinerary) -> None:
+def finalize_itinerary_distances(itinerary: Itinerary, matrix: Optional[TravelMatrix] = None) -> None:
     """
     Compute and store total distance for each day.
     This should be called ONCE after the best itinerary is selected.
     """
     for day in itinerary.days:
-        total = 0.0
-        for i in range(len(day.spots) - 1):
-            total += distance(day.spots[i], day.spots[i + 1])
+        if matrix is not None:
+            total = matrix.path_km(matrix.indices_of(day.spots))
+        else:
+            total = 0.0
+            for i in range(len(day.spots) - 1):
+                total += distance(day.spots[i], day.spots[i + 1])
         day.total_distance_km = round(total, 2)
 
 
-def try_move_one_spot(itin: Itinerary) -> Itinerary:
-    new_itin = deepcopy(itin)
-    days = new_itin.days
+def _steered_day(
+    spot: int,
+    exclude: int,
+    rng: random.Random,
+    neighbours: Optional[List[List[int]]],
+    day_of: Optional[List[int]],
+) -> Optional[int]:
+    """
+    A day other than `exclude` that holds one of the nearest neighbours of
+    `spot`, chosen in proportion to how many it holds; None when no such
+    day exists or the move is not steered this time.
+    """
+    if neighbours is None or day_of is None or rng.random() >= STEER_PROBABILITY:
+        return None
+    days = [d for d in (day_of[k] for k in neighbours[spot]) if d >= 0 and d != exclude]
+    return rng.choice(days) if days else None
+
+
+def _move_one_spot(
+    day_paths: List[List[int]],
+    router: RouteOptimizer,
+    rng: random.Random,
+    neighbours: Optional[List[List[int]]] = None,
+    day_of: Optional[List[int]] = None,
+) -> Dict[int, List[int]]:
+    """
+    Move a random spot to another day, drawing from `rng`. Returns the new
+    paths of the touched days only; `day_paths` itself is left untouched.
+
+    Given nearest-neighbour lists and the day of every spot (see
+    _MoveProposer), the destination is usually a day that already holds a
+    neighbour of the spot, instead of any day across the city.
+    """
+    from_candidates = [i for i, p in enumerate(day_paths) if len(p) >= 2]
+    if not from_candidates or len(day_paths) < 2:
+        return {}
+
+    src_i = rng.choice(from_candidates)
+    src = day_paths[src_i]
+    idx = rng.randrange(len(src))
+
+    dst_i = _steered_day(src[idx], src_i, rng, neighbours, day_of)
+    if dst_i is None:
+        dst_i = rng.choice([i for i in range(len(day_paths)) if i != src_i])
+
+    # repair both routes locally instead of rebuilding them
+    return {
+        src_i: router.remove(src, idx),
+        dst_i: router.insert(day_paths[dst_i], src[idx]),
+    }
+
+
+def _swap_spots_between_days(
+    day_paths: List[List[int]],
+    router: RouteOptimizer,
+    rng: random.Random,
+    neighbours: Optional[List[List[int]]] = None,
+    day_of: Optional[List[int]] = None,
+) -> Dict[int, List[int]]:
+    """
+    Swap two random spots of different days. Returns the new paths of the
+    touched days only; `day_paths` itself is left untouched.
+
+    Steered like _move_one_spot: the other day usually holds a neighbour of
+    the first spot, and the spot sent back is preferably a neighbour of
+    some spot of the first day.
+    """
+    if len(day_paths) < 2:
+        return {}
+
+    i1, i2 = rng.sample(range(len(day_paths)), 2)
+    p1 = day_paths[i1]
+    if not p1:
+        return {}
+    i = rng.randrange(len(p1))
+
+    steered = _steered_day(p1[i], i1, rng, neighbours, day_of)
+    if steered is not None:
+        i2 = steered
+    p2 = day_paths[i2]
+    if not p2:
+        return {}
+
+    j = None
+    if steered is not None:
+        back = [k for k in neighbours[rng.choice(p1)] if day_of[k] == i2]
+        if back:
+            j = p2.index(rng.choice(back))
+    if j is None:
+        j = rng.randrange(len(p2))
 
-    from_candidates = [d for d in days if len(d.spots) >= 2]
-    if not from_candidates:
-        return new_itin
+    # each day loses one spot and gains the other's, repaired in place
+    return {
+        i1: router.insert(p1[:i] + p1[i + 1:], p2[j]),
+        i2: router.insert(p2[:j] + p2[j + 1:], p1[i]),
+    }
 
-    src = random.choice(from_candidates)
-    dst = random.choice([d for d in days if d.day != src.day])
 
-    idx = random.randrange(len(src.spots))
-    moved = src.spots.pop(idx)
-    dst.spots.append(moved)
+class SearchStrategy(str, Enum):
+    HILL_CLIMB = "hill_climb"
+    ANNEAL = "anneal"
 
-    src.spots = nearest_neighbor_path(src.spots)
-    dst.spots = nearest_neighbor_path(dst.spots)
 
-    return new_itin
+# Default wall-clock budget for the annealing strategy
+DEFAULT_TIME_BUDGET_MS = 300.0
+
+# Annealing temperatures, relative to the one-spot-day penalty
+ANNEAL_START_TEMPERATURE = 1.0
+ANNEAL_END_TEMPERATURE = 0.001
+
+# Shortest gap between two intermediate results passed to on_improvement
+DEFAULT_IMPROVEMENT_INTERVAL_MS = 200.0
+
+
+# Nearest neighbours kept per spot for steering search moves
+MOVE_NEIGHBOURS = DEFAULT_NEIGHBORS
+
+# Share of moves and swaps sent to a day holding a neighbour of the moved
+# spot; the rest pick the other day uniformly so the search can still leave
+# a neighbourhood
+STEER_PROBABILITY = 0.9
+
+
+# Large-instance planning: only some of the candidate spots are visited.
+# Candidates searched over per planned visit
+CANDIDATE_POOL_FACTOR = 8
+
+# Nearest candidates that make up the neighbourhood of a candidate
+CANDIDATE_NEIGHBOURS = 8
+
+# Penalty points the most attractive candidate is worth
+DEFAULT_PRIZE_WEIGHT = 30.0
+
+# Penalty points per travel minute, so compact days win among equally
+# attractive choices
+SELECTION_TRAVEL_WEIGHT = 0.02
+
+# Share of search moves that exchange a visited spot for an unvisited one
+EXCHANGE_PROBABILITY = 0.5
+
+
+@dataclass
+class CandidateSelection:
+    """
+    Visit only `visits` of the spots given to the planner. `prizes` holds
+    one attractiveness value per spot (any non-negative scale); visiting the
+    most attractive one is worth `prize_weight` penalty points, so the
+    search trades travel time against skipping good spots.
+    """
+    visits: int
+    prizes: Sequence[float]
+    prize_weight: float = DEFAULT_PRIZE_WEIGHT
+
+
+def narrow_candidates(
+    spots: Sequence[Spot],
+    prizes: Sequence[float],
+    visits: int,
+    pool_size: Optional[int] = None,
+    neighbours: int = CANDIDATE_NEIGHBOURS,
+) -> List[int]:
+    """
+    Indices of the spots worth searching over when only `visits` of them
+    will be planned: the `visits` most attractive spots, then those in the
+    most attractive neighbourhoods, `pool_size` (default visits *
+    CANDIDATE_POOL_FACTOR) in total. Neighbourhoods come from a grid index,
+    so this stays cheap for thousands of spots.
+    """
+    n = len(spots)
+    if pool_size is None:
+        pool_size = visits * CANDIDATE_POOL_FACTOR
+    if n <= pool_size:
+        return list(range(n))
+
+    prizes = np.maximum(np.asarray(prizes, dtype=float), 0.0)
+    index = GridIndex([s.lat for s in spots], [s.lon for s in spots])
+    near, km = index.neighbor_lists(neighbours)
+
+    # neighbours count less the further away they are, relative to the
+    # typical distance to a spot's nearest neighbours
+    finite = km[np.isfinite(km)]
+    scale = max(float(np.median(finite)), 0.1) if finite.size else 1.0
+    weights = np.exp(-km / scale)
+    local = prizes + (weights * np.where(near >= 0, prizes[near], 0.0)).sum(axis=1)
+
+    chosen = list(np.argsort(-prizes, kind="stable")[:visits])
+    taken = set(chosen)
+    for k in np.argsort(-local, kind="stable"):
+        if len(chosen) >= pool_size:
+            break
+        if k not in taken:
+            chosen.append(k)
+            taken.add(k)
+    return sorted(int(k) for k in chosen)
+
+
+def _initial_selection_paths(
+    matrix: TravelMatrix,
+    days: int,
+    router: RouteOptimizer,
+    prizes: List[float],
+    visits: int,
+    seed: int = 0,
+) -> List[List[int]]:
+    """The `visits` most attractive candidates, split into compact days (k-means seeded with `seed`)."""
+    chosen = sorted(range(len(prizes)), key=lambda k: (-prizes[k], k))[:visits]
+    chunks = [
+        [chosen[i] for i in chunk]
+        for chunk in balanced_kmeans(matrix.lats[chosen], matrix.lons[chosen], days, seed=seed)
+    ]
+    chunks.sort(key=lambda c: float(matrix.lons[c].mean()) if c else math.inf)
+    return [router.improve(matrix.nearest_neighbor_order(chunk)) for chunk in chunks]
+
+
+def _exchange_spot(
+    day_paths: List[List[int]],
+    router: RouteOptimizer,
+    rng: random.Random,
+    neighbours: List[List[int]],
+    day_of: Optional[List[int]] = None,
+) -> Dict[int, List[int]]:
+    """
+    Replace a random visited spot with an unvisited candidate close to some
+    spot of the same day, which can also pull a stray spot of the day
+    towards the rest. Returns the new path of the touched day only.
+    """
+    d = rng.randrange(len(day_paths))
+    path = day_paths[d]
+    if not path:
+        return {}
+    pos = rng.randrange(len(path))
+    if day_of is None:
+        visited = {k for p in day_paths for k in p}
+        options = [k for k in neighbours[rng.choice(path)] if k not in visited]
+    else:
+        options = [k for k in neighbours[rng.choice(path)] if day_of[k] < 0]
+    if not options:
+        return {}
+    return {d: router.insert(router.remove(path, pos), rng.choice(options))}
+
+
+class _MoveProposer:
+    """
+    Proposes random search moves over per-day index paths: moving a spot to
+    another day, swapping two spots of different days and, when `exchange`
+    is set, exchanging a visited spot for an unvisited candidate.
+
+    With nearest-neighbour lists, moves are steered towards days that
+    already hold a neighbour of the moved spot, so far fewer of them send a
+    spot across the city only to be rejected. `day_of` maps every spot to
+    its day (-1 when unvisited); accepted moves must go through apply() to
+    keep it in sync.
+
+    All randomness comes from `rng`, which the search loops also use for
+    their own draws, so a run depends on its seed alone.
+    """
+
+    def __init__(
+        self,
+        day_paths: List[List[int]],
+        size: int,
+        rng: random.Random,
+        neighbours: Optional[List[List[int]]] = None,
+        exchange: bool = False,
+    ):
+        self.rng = rng
+        self.neighbours = neighbours
+        self.exchange = exchange and neighbours is not None
+        self.day_of = [-1] * size
+        for d, path in enumerate(day_paths):
+            for k in path:
+                self.day_of[k] = d
+
+    def __call__(self, day_paths: List[List[int]], router: RouteOptimizer) -> Dict[int, List[int]]:
+        rng = self.rng
+        if self.exchange and rng.random() < EXCHANGE_PROBABILITY:
+            return _exchange_spot(day_paths, router, rng, self.neighbours, self.day_of)
+        if rng.random() < 0.6:
+            return _move_one_spot(day_paths, router, rng, self.neighbours, self.day_of)
+        return _swap_spots_between_days(day_paths, router, rng, self.neighbours, self.day_of)
+
+    def apply(self, day_paths: List[List[int]], changes: Dict[int, List[int]]) -> None:
+        day_of = self.day_of
+        # spots dropped by an exchange end up unvisited
+        for d in changes:
+            for k in day_paths[d]:
+                day_of[k] = -1
+        for d, path in changes.items():
+            day_paths[d] = path
+            for k in path:
+                day_of[k] = d
+
+
+class _QueuedImprovements:
+    """
+    on_improvement callback of a pool task: puts (tag, itinerary, score,
+    objective) on a manager queue. The search objective travels along so
+    that the receiving process can rank results of different starts even
+    when their reported scores tie.
+    """
 
+    def __init__(self, queue, tag):
+        self.queue = queue
+        self.tag = tag
 
-def try_swap_spots_between_days(itin: Itinerary) -> Itinerary:
-    new_itin = deepcopy(itin)
-    days = new_itin.days
-    if len(days) < 2:
-        return new_itin
+    def __call__(self, itinerary: Itinerary, score: float, objective: float) -> None:
+        self.queue.put((self.tag, itinerary, score, objective))
 
-    d1, d2 = random.sample(days, 2)
-    if not d1.spots or not d2.spots:
-        return new_itin
 
-    i = random.randrange(len(d1.spots))
-    j = random.randrange(len(d2.spots))
+class _ImprovementReporter:
+    """
+    Passes new best states of a search to `on_improvement(itinerary, score)`,
+    at most once per `interval_ms`. Bests found sooner are skipped: a later
+    one supersedes them, and the planner returns the final result anyway.
 
-    d1.spots[i], d2.spots[j] = d2.spots[j], d1.spots[i]
+    `score` is the scorer's penalty, i.e. what score_itinerary reports,
+    which for candidate selection is not the objective the search improves.
+    """
 
-    d1.spots = nearest_neighbor_path(d1.spots)
-    d2.spots = nearest_neighbor_path(d2.spots)
+    def __init__(self, on_improvement, interval_ms, city, spots, matrix, scorer):
+        self.on_improvement = on_improvement
+        self.interval = interval_ms / 1000.0
+        self.city = city
+        self.spots = spots
+        self.matrix = matrix
+        self.scorer = scorer
+        self.last_sent = -math.inf
+
+    def __call__(self, day_paths: List[List[int]], objective: float) -> None:
+        # called right after the scorer adopted `day_paths`, so its penalty is theirs
+        now = time.perf_counter()
+        if now - self.last_sent < self.interval:
+            return
+        self.last_sent = now
+        itinerary = _materialize_itinerary(self.city, self.spots, day_paths, self.matrix)
+        if isinstance(self.on_improvement, _QueuedImprovements):
+            self.on_improvement(itinerary, self.scorer.penalty, objective)
+        else:
+            self.on_improvement(itinerary, self.scorer.penalty)
+
+
+def _hill_climb(
+    day_paths: List[List[int]],
+    scorer: IncrementalScorer,
+    router: RouteOptimizer,
+    moves: _MoveProposer,
+    trials: int,
+    report: Optional[Callable[[List[List[int]], float], None]] = None,
+    trace=NULL_TRACE,
+) -> List[List[int]]:
+    """Fixed number of trials, accepting strict improvements only."""
+    tracing = trace.enabled
+    accepted = 0
+    for iteration in range(trials):
+        changes = moves(day_paths, router)
+
+        # only the touched days can change the score
+        delta, updates = scorer.evaluate(changes)
+
+        if delta < 0:
+            moves.apply(day_paths, changes)
+            scorer.commit(updates)
+            accepted += 1
+            if report is not None:
+                report(day_paths, scorer.score)
+            if tracing:
+                trace.point(iteration + 1, scorer.score)
+
+    trace.count('iterations', trials)
+    trace.count('accepted', accepted)
+    trace.count('rejected', trials - accepted)
+    return day_paths
+
+
+def _anneal(
+    day_paths: List[List[int]],
+    scorer: IncrementalScorer,
+    router: RouteOptimizer,
+    moves: _MoveProposer,
+    cfg: ScoreConfig,
+    time_budget_ms: float,
+    report: Optional[Callable[[List[List[int]], float], None]] = None,
+    trace=NULL_TRACE,
+) -> List[List[int]]:
+    """
+    Simulated annealing until the wall-clock deadline; returns the best state seen.
 
-    return new_itin
+    Worse moves are accepted with probability exp(-delta / T), where T cools
+    geometrically with the fraction of the time budget used, so the schedule
+    adapts to however many iterations fit in the budget.
+    """
+    rng = moves.rng
+    scale = max(cfg.one_spot_day_penalty, 1.0)
+    t_start = ANNEAL_START_TEMPERATURE * scale
+    t_ratio = ANNEAL_END_TEMPERATURE / ANNEAL_START_TEMPERATURE
+
+    start = time.perf_counter()
+    budget = time_budget_ms / 1000.0
+
+    best_paths = [p[:] for p in day_paths]
+    best_score = current_score = scorer.score
+
+    tracing = trace.enabled
+    iterations = accepted = uphill = 0
+    while best_score > scorer.lower_bound:
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            break
+        temperature = t_start * t_ratio ** (elapsed / budget)
+
+        changes = moves(day_paths, router)
+        delta, updates = scorer.evaluate(changes)
+        iterations += 1
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            moves.apply(day_paths, changes)
+            scorer.commit(updates)
+            current_score += delta
+            accepted += 1
+            if delta > 0:
+                uphill += 1
+
+            if current_score < best_score - 1e-9:
+                # resync to avoid drift from accumulated deltas
+                current_score = scorer.score
+                best_score = current_score
+                best_paths = [p[:] for p in day_paths]
+                if report is not None:
+                    report(best_paths, best_score)
+                if tracing:
+                    trace.point(iterations, best_score)
+
+    trace.count('iterations', iterations)
+    trace.count('accepted', accepted)
+    trace.count('accepted_uphill', uphill)
+    trace.count('rejected', iterations - accepted)
+    return best_paths
 
 
 def plan_itinerary_soft_constraints(
@@ -105,30 +585,429 @@ def plan_itinerary_soft_constraints(
     cfg: ScoreConfig,
     mode: TransportMode,
     trials: int = 200,
+    strategy: SearchStrategy = SearchStrategy.HILL_CLIMB,
+    time_budget_ms: Optional[float] = None,
+    seed: int = 0,
+    distances: Optional[DistanceMatrix] = None,
+    initial: InitialItinerary = InitialItinerary.CLUSTER,
+    on_improvement: Optional[Callable[[Itinerary, float], None]] = None,
+    improvement_interval_ms: float = DEFAULT_IMPROVEMENT_INTERVAL_MS,
+    trace=NULL_TRACE,
+    selection: Optional[CandidateSelection] = None,
 ) -> Tuple[Itinerary, float, List[str]]:
+    """
+    Plan an itinerary for one transport mode.
 
-    random.seed(0)
+    The search starts from compact clustered days by default;
+    initial=ROUND_ROBIN restores the lon-sorted round-robin start.
 
-    base = build_initial_itinerary(city, spots, days)
-    best = base
-    best_score, best_reasons = score_itinerary(best, cfg, mode)
+    strategy=HILL_CLIMB runs `trials` random moves and keeps strict
+    improvements. strategy=ANNEAL ignores `trials` and anneals until
+    `time_budget_ms` (default DEFAULT_TIME_BUDGET_MS) has elapsed, returning
+    the best itinerary found so far.
 
-    current = base
-    for _ in range(trials):
-        if random.random() < 0.6:
-            candidate = try_move_one_spot(current)
-        else:
-            candidate = try_swap_spots_between_days(current)
+    Pass a DistanceMatrix built over `spots` to share geometry across modes.
+
+    All random draws, including the k-means start of the clustered days,
+    are seeded with `seed` and private to the run, so the result depends on
+    the inputs alone, however many other plans run in the same process at
+    the same time; multistart searches therefore also start apart.
+
+    `on_improvement(itinerary, score)` is called with the starting itinerary
+    and then with new best itineraries as the search finds them, at most
+    once per `improvement_interval_ms`, so callers can show a usable plan
+    long before the search ends.
 
-        candidate_score, candidate_reasons = score_itinerary(candidate, cfg, mode)
+    Pass a PlanTrace as `trace` to collect phase timings, move counters and
+    the score-vs-iteration trace of the search.
 
-        if candidate_score < best_score:
-            best = candidate
-            best_score = candidate_score
-            best_reasons = candidate_reasons
-            current = candidate
+    With a `selection` for fewer visits than there are spots, the spots are
+    candidates: the search starts from the most attractive ones and also
+    exchanges visited spots for unvisited nearby candidates, so large
+    candidate sets (see narrow_candidates) only cost per-move work on the
+    planned visits. The returned score, like the one passed to
+    `on_improvement`, is still the plain penalty score.
+    """
+    # a private generator per run: concurrent plans in one process neither
+    # share nor disturb each other's random state
+    rng = random.Random(seed)
+
+    # every leg the search looks at comes out of this one matrix
+    with trace.phase('distances'):
+        if distances is None:
+            distances = DistanceMatrix(spots)
+        matrix = distances.for_mode(mode)
+
+    # the search works on per-day lists of spot indices; pydantic objects
+    # are only built once, for the winner
+    selecting = selection is not None and 0 < selection.visits < len(spots)
+    with trace.phase('initial'):
+        # one set of nearest-neighbour lists serves the route repairs and
+        # the steering of moves, for every mode sharing `distances`
+        neighbours = distances.neighbor_lists(MOVE_NEIGHBOURS)
+        router = RouteOptimizer(matrix, neighbors=neighbours)
+        if selecting:
+            top = max(max(selection.prizes), 0.0) or 1.0
+            prizes = [max(p, 0.0) / top for p in selection.prizes]
+            day_paths = _initial_selection_paths(matrix, days, router, prizes, selection.visits, seed)
+            scorer = PrizeCollectingScorer(
+                day_paths, cfg, mode, matrix, prizes, selection.prize_weight, SELECTION_TRAVEL_WEIGHT,
+            )
+        else:
+            day_paths = _initial_day_paths(spots, days, matrix, router, initial, seed)
+            scorer = IncrementalScorer(day_paths, cfg, mode, matrix)
+        moves = _MoveProposer(day_paths, len(spots), rng, neighbours, exchange=selecting)
+    trace.point(0, scorer.score)
+
+    report = None
+    if on_improvement is not None:
+        report = _ImprovementReporter(on_improvement, improvement_interval_ms, city, spots, matrix, scorer)
+        report(day_paths, scorer.score)
+
+    with trace.phase('search'):
+        if SearchStrategy(strategy) == SearchStrategy.ANNEAL:
+            budget = DEFAULT_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+            day_paths = _anneal(day_paths, scorer, router, moves, cfg, budget, report, trace)
+        else:
+            day_paths = _hill_climb(day_paths, scorer, router, moves, trials, report, trace)
 
-    # finalize distances so consumers can show per-day totals
-    finalize_itinerary_distances(best)
+    # exact visiting order for small days, now that their spots are settled
+    with trace.phase('route_finish'):
+        day_paths = [router.finish(path) for path in day_paths]
+
+    # materialize also finalizes distances so consumers can show per-day totals
+    with trace.phase('materialize'):
+        best = _materialize_itinerary(city, spots, day_paths, matrix)
+    with trace.phase('score'):
+        best_score, best_reasons = score_itinerary(best, cfg, mode, matrix)
 
     return best, best_score, best_reasons
+
+
+def _run_start(
+    city: str,
+    spots: List[Spot],
+    days: int,
+    cfg: ScoreConfig,
+    mode: TransportMode,
+    trials: int,
+    strategy: SearchStrategy,
+    time_budget_ms: Optional[float],
+    seed: int,
+    distances: Optional[DistanceMatrix] = None,
+    improvements=None,
+    improvement_interval_ms: float = DEFAULT_IMPROVEMENT_INTERVAL_MS,
+    selection: Optional[CandidateSelection] = None,
+    trace=NULL_TRACE,
+) -> Tuple[Itinerary, float, List[str]]:
+    # top-level so it can be pickled into pool workers; `improvements` is a
+    # (manager queue, tag) pair that intermediate results are put on
+    on_improvement = _QueuedImprovements(*improvements) if improvements is not None else None
+    return plan_itinerary_soft_constraints(
+        city, spots, days, cfg, mode,
+        trials=trials, strategy=strategy, time_budget_ms=time_budget_ms, seed=seed,
+        distances=distances,
+        on_improvement=on_improvement, improvement_interval_ms=improvement_interval_ms,
+        trace=trace, selection=selection,
+    )
+
+
+def _run_start_traced(*args, **kwargs) -> Tuple[Tuple[Itinerary, float, List[str]], PlanTrace]:
+    # a worker's trace cannot be filled in remotely, so it travels back with the result
+    trace = PlanTrace()
+    with trace.phase('total'):
+        result = _run_start(*args, trace=trace, **kwargs)
+    return result, trace
+
+
+def pick_best_result(
+    results: List[Tuple[Itinerary, float, List[str]]]
+) -> Tuple[Itinerary, float, List[str]]:
+    """Lowest score wins; ties go to the shorter total distance, then the earlier start."""
+    def key(item):
+        i, (itinerary, score, _) = item
+        return (round(score, 6), sum(d.total_distance_km for d in itinerary.days), i)
+
+    return min(enumerate(results), key=key)[1]
+
+
+def plan_itinerary_multistart(
+    city: str,
+    spots: List[Spot],
+    days: int,
+    cfg: ScoreConfig,
+    mode: TransportMode,
+    starts: int = 4,
+    max_workers: Optional[int] = None,
+    trials: int = 200,
+    strategy: SearchStrategy = SearchStrategy.HILL_CLIMB,
+    time_budget_ms: Optional[float] = None,
+    base_seed: int = 0,
+    distances: Optional[DistanceMatrix] = None,
+    trace=NULL_TRACE,
+    selection: Optional[CandidateSelection] = None,
+) -> Tuple[Itinerary, float, List[str]]:
+    """
+    Run `starts` independent searches (seeds base_seed .. base_seed+starts-1)
+    on the shared process pool and return the best result.
+
+    `trials` / `time_budget_ms` are the budget of each start; at most
+    `max_workers` starts use the pool at a time. With max_workers=1, a
+    single start, or when no pool can be used, the starts run one after
+    another in this process. A `trace` gets one child per start.
+    """
+    with trace.phase('distances'):
+        if distances is None:
+            distances = DistanceMatrix(spots)
+    args = [
+        (city, spots, days, cfg, mode, trials, strategy, time_budget_ms, base_seed + i, distances)
+        for i in range(max(1, starts))
+    ]
+
+    def run_serially():
+        return [
+            _run_start(*a, selection=selection, trace=trace.child(f"start_{i}"))
+            for i, a in enumerate(args)
+        ]
+
+    if len(args) == 1 or max_workers == 1:
+        return pick_best_result(run_serially())
+
+    try:
+        runner = _run_start_traced if trace.enabled else _run_start
+        pool = TaskLimiter(
+            ((i, runner, a, {'selection': selection}) for i, a in enumerate(args)), max_workers
+        )
+        finished = dict(pool.as_completed())
+        results = [finished[i].result() for i in range(len(args))]
+    except (BrokenProcessPool, OSError, NotImplementedError):
+        # e.g. no fork/semaphore support in this environment, or a worker died
+        shutdown_process_pool(wait=False)
+        results = run_serially()
+    else:
+        if trace.enabled:
+            for i, (_, child) in enumerate(results):
+                trace.attach(f"start_{i}", child)
+            results = [result for result, _ in results]
+
+    return pick_best_result(results)
+
+
+def plan_modes_concurrently(
+    city: str,
+    spots: List[Spot],
+    days: int,
+    cfg: ScoreConfig,
+    modes: List[TransportMode],
+    starts: int = 1,
+    max_workers: Optional[int] = None,
+    trials: int = 200,
+    strategy: SearchStrategy = SearchStrategy.HILL_CLIMB,
+    time_budget_ms: Optional[float] = None,
+    on_mode_done: Optional[Callable[[TransportMode, object], None]] = None,
+    distances: Optional[DistanceMatrix] = None,
+    on_improvement: Optional[Callable[[TransportMode, Itinerary, float], None]] = None,
+    improvement_interval_ms: float = DEFAULT_IMPROVEMENT_INTERVAL_MS,
+    trace=NULL_TRACE,
+    selection: Optional[CandidateSelection] = None,
+) -> Dict[TransportMode, object]:
+    """
+    Plan several transport modes in parallel on the shared process pool.
+
+    Every (mode, start) pair is its own pool task, at most `max_workers` of
+    them at a time; distances are computed once here and each mode derives
+    its travel times from them. Returns,
+    per mode, either the (itinerary, score, reasons) tuple of its best start
+    or the exception that made it fail. `on_mode_done(mode, outcome)` is
+    called in this process as each mode finishes, i.e. in order of completion.
+
+    `on_improvement(mode, itinerary, score)` receives intermediate results
+    from the workers (throttled to one per `improvement_interval_ms` per
+    task, and only ones that beat the mode's best so far on the search
+    objective) until the mode is done.
+
+    A `trace` gets one child per mode (per start of a mode when starts > 1),
+    collected in the workers.
+    """
+    starts = max(1, starts)
+    with trace.phase('distances'):
+        if distances is None:
+            distances = DistanceMatrix(spots)
+    runner = _run_start_traced if trace.enabled else _run_start
+
+    improvements = None
+    if on_improvement is not None:
+        try:
+            improvements = get_manager().Queue()
+        except (OSError, EOFError):
+            # intermediate results are a nicety; plan without them
+            improvements = None
+
+    # submitted lazily, so the first modes to finish are reported while
+    # later ones still wait for a slot
+    pool = TaskLimiter((
+        ((mode, i), runner,
+         (city, spots, days, cfg, mode, trials, strategy, time_budget_ms, i, distances,
+          (improvements, mode) if improvements is not None else None, improvement_interval_ms),
+         {'selection': selection})
+        for mode in modes for i in range(starts)
+    ), max_workers)
+
+    collected: Dict[TransportMode, dict] = {mode: {} for mode in modes}
+    outcomes: Dict[TransportMode, object] = {}
+    best_seen: Dict[TransportMode, float] = {}
+
+    def forward_improvements():
+        while True:
+            try:
+                mode, itinerary, score, objective = improvements.get_nowait()
+            except Empty:
+                return
+            # ranked on the search objective: with candidate selection the
+            # reported penalty is mostly 0 while the plan still improves
+            if mode not in outcomes and objective < best_seen.get(mode, math.inf):
+                best_seen[mode] = objective
+                on_improvement(mode, itinerary, score)
+
+    poll = improvement_interval_ms / 1000.0 if improvements is not None else None
+    while pool.pending:
+        done = pool.wait(timeout=poll)
+        if improvements is not None:
+            # results queued before a task returned are forwarded before its outcome
+            forward_improvements()
+        for (mode, i), f in done:
+            if mode in outcomes:
+                continue  # another start of this mode already failed
+            try:
+                result = f.result()
+            except BrokenProcessPool:
+                shutdown_process_pool(wait=False)
+                raise
+            except Exception as e:
+                outcomes[mode] = e
+            else:
+                if trace.enabled:
+                    result, child = result
+                    if starts == 1:
+                        trace.attach(mode.value, child)
+                    else:
+                        trace.child(mode.value).attach(f"start_{i}", child)
+                collected[mode][i] = result
+                if len(collected[mode]) == starts:
+                    outcomes[mode] = pick_best_result([collected[mode][k] for k in range(starts)])
+            if mode in outcomes and on_mode_done is not None:
+                on_mode_done(mode, outcomes[mode])
+
+    return outcomes
+
+
+@dataclass
+class PlanSpec:
+    """
+    One itinerary request of a batch: plan `spots` over `days` for every
+    mode. plan_batch fills in `distances` when it is not given.
+    """
+    city: str
+    spots: List[Spot]
+    days: int
+    modes: List[TransportMode]
+    distances: Optional[DistanceMatrix] = None
+    selection: Optional[CandidateSelection] = None
+
+
+def _share_distances(specs: Sequence[PlanSpec]) -> None:
+    """Give every spec a DistanceMatrix, one per distinct spot set."""
+    by_spots: Dict[tuple, DistanceMatrix] = {}
+    for spec in specs:
+        key = tuple((s.name, s.lat, s.lon) for s in spec.spots)
+        if spec.distances is None:
+            spec.distances = by_spots.get(key)
+            if spec.distances is None:
+                spec.distances = DistanceMatrix(spec.spots)
+        by_spots.setdefault(key, spec.distances)
+
+
+def _plan_batch_serially(specs, cfg, starts, trials, strategy, time_budget_ms):
+    for index, spec in enumerate(specs):
+        outcomes: Dict[TransportMode, object] = {}
+        for mode in spec.modes:
+            try:
+                outcomes[mode] = pick_best_result([
+                    _run_start(spec.city, spec.spots, spec.days, cfg, mode,
+                               trials, strategy, time_budget_ms, i, spec.distances,
+                               selection=spec.selection)
+                    for i in range(starts)
+                ])
+            except Exception as e:
+                outcomes[mode] = e
+        yield index, outcomes
+
+
+def plan_batch(
+    specs: Sequence[PlanSpec],
+    cfg: ScoreConfig,
+    starts: int = 1,
+    max_workers: Optional[int] = None,
+    trials: int = 200,
+    strategy: SearchStrategy = SearchStrategy.HILL_CLIMB,
+    time_budget_ms: Optional[float] = None,
+) -> Iterator[Tuple[int, Dict[TransportMode, object]]]:
+    """
+    Plan many specs on the shared process pool, yielding (spec index,
+    outcomes) as each spec finishes, i.e. in order of completion.
+
+    Outcomes are what plan_modes_concurrently returns: per mode, the best
+    (itinerary, score, reasons) tuple or the exception that made it fail.
+    Specs over the same spot set share one DistanceMatrix. At most
+    `max_workers` tasks use the pool at a time, submitted as earlier ones
+    finish; with max_workers=1, or when no pool can be used, specs run one
+    after another in this process.
+    """
+    specs = list(specs)
+    starts = max(1, starts)
+    _share_distances(specs)
+
+    if max_workers == 1:
+        yield from _plan_batch_serially(specs, cfg, starts, trials, strategy, time_budget_ms)
+        return
+
+    try:
+        pool = TaskLimiter((
+            ((index, mode, i), _run_start,
+             (spec.city, spec.spots, spec.days, cfg, mode,
+              trials, strategy, time_budget_ms, i, spec.distances),
+             {'selection': spec.selection})
+            for index, spec in enumerate(specs)
+            for mode in dict.fromkeys(spec.modes)
+            for i in range(starts)
+        ), max_workers)
+    except (BrokenProcessPool, OSError, NotImplementedError):
+        shutdown_process_pool(wait=False)
+        yield from _plan_batch_serially(specs, cfg, starts, trials, strategy, time_budget_ms)
+        return
+
+    collected = [{mode: {} for mode in spec.modes} for spec in specs]
+    outcomes: List[Dict[TransportMode, object]] = [{} for _ in specs]
+    try:
+        for index, spec in enumerate(specs):
+            if not spec.modes:
+                yield index, {}
+        for (index, mode, i), f in pool.as_completed():
+            if mode in outcomes[index]:
+                continue  # another start of this mode already failed
+            try:
+                collected[index][mode][i] = f.result()
+            except BrokenProcessPool:
+                shutdown_process_pool(wait=False)
+                raise
+            except Exception as e:
+                outcomes[index][mode] = e
+            else:
+                if len(collected[index][mode]) == starts:
+                    runs = collected[index][mode]
+                    outcomes[index][mode] = pick_best_result([runs[k] for k in range(starts)])
+            if len(outcomes[index]) == len(collected[index]):
+                yield index, outcomes[index]
+    finally:
+        # the consumer may stop early; don't leave queued work behind
+        pool.cancel()
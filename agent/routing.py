@@ -0,0 +1,397 @@
+"""
+Intra-day route improvement: 2-opt and Or-opt local search over a TravelMatrix.
+
+Routes are open paths (the traveller does not return to the first spot), so
+reversals at either end are allowed and the start spot is free. Routes of up
+to EXACT_MAX_SPOTS spots are solved optimally with a Held-Karp dynamic
+program; longer ones are improved with local search, where small routes are
+searched exhaustively and longer ones only consider moves that make a spot
+adjacent to one of its k nearest neighbours.
+"""
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.models import Itinerary
+from agent.geometry import TransportMode
+from agent.travel_matrix import TravelMatrix
+
+# Candidate neighbours kept per spot
+DEFAULT_NEIGHBORS = 10
+
+# Routes up to this many spots are searched exhaustively
+FULL_SEARCH_MAX_SPOTS = 12
+
+# Longest segment Or-opt tries to relocate
+OR_OPT_MAX_SEGMENT = 3
+
+# Finished routes up to this many spots get the exact (Held-Karp) visiting order
+EXACT_MAX_SPOTS = 9
+
+# Inside the search loop the exact solver is only used for routes this small,
+# where it costs about as much as local search; for bigger ones its higher
+# per-move cost buys fewer search moves than it is worth.
+SEARCH_EXACT_MAX_SPOTS = 4
+
+# Exact routes remembered per optimizer before the memo is reset
+EXACT_CACHE_SIZE = 50000
+
+_EPS = 1e-9
+
+
+def nearest_neighbor_lists(matrix: TravelMatrix, k: int = DEFAULT_NEIGHBORS) -> List[List[int]]:
+    """For every spot, the indices of its k nearest other spots (closest first)."""
+    n = len(matrix)
+    if n <= 1:
+        return [[] for _ in range(n)]
+    k = min(k, n - 1)
+    km = matrix.km.copy()
+    np.fill_diagonal(km, np.inf)
+    nearest = np.argpartition(km, k - 1, axis=1)[:, :k]
+    rows = np.arange(n)[:, None]
+    order = np.argsort(km[rows, nearest], axis=1)
+    return nearest[rows, order].tolist()
+
+
+_LAYERS: Dict[int, List[Tuple[np.ndarray, np.ndarray]]] = {}
+
+
+def _subset_layers(n: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    For every subset size s >= 2, the s-subset bitmasks of n items and, per
+    mask and item j, the mask with j removed.
+    """
+    layers = _LAYERS.get(n)
+    if layers is None:
+        masks = np.arange(1 << n)
+        bits = 1 << np.arange(n)
+        counts = ((masks[:, None] & bits[None, :]) != 0).sum(axis=1)
+        layers = []
+        for size in range(2, n + 1):
+            layer = masks[counts == size]
+            layers.append((layer, layer[:, None] ^ bits[None, :]))
+        _LAYERS[n] = layers
+    return layers
+
+
+def exact_open_path(km: np.ndarray, nodes: Sequence[int]) -> List[int]:
+    """
+    Shortest open path through `nodes` (any start, any end) by Held-Karp
+    dynamic programming over subsets, O(2^n * n^2) but vectorized per
+    subset size. Meant for small n only.
+    """
+    nodes = list(nodes)
+    n = len(nodes)
+    if n <= 1:
+        return nodes
+    idx = np.array(nodes)
+    d_t = km[idx[None, :], idx[:, None]]  # d_t[j, i] = km[i -> j]
+
+    # cost[mask, j]: shortest path visiting exactly `mask` and ending at j
+    cost = np.full((1 << n, n), np.inf)
+    cost[1 << np.arange(n), np.arange(n)] = 0.0
+    parent = np.zeros((1 << n, n), dtype=np.intp)
+
+    for masks, prev in _subset_layers(n):
+        # via[m, j, i]: reach i over the mask without j, then step to j;
+        # infinite whenever j is not in the mask, as nothing reached it yet
+        via = cost[prev] + d_t
+        best = via.argmin(axis=2)
+        parent[masks] = best
+        cost[masks] = np.take_along_axis(via, best[:, :, None], axis=2)[:, :, 0]
+
+    mask = (1 << n) - 1
+    end = int(cost[mask].argmin())
+    order = [end]
+    for _ in range(n - 1):
+        end, mask = int(parent[mask, end]), mask ^ (1 << end)
+        order.append(end)
+    return [nodes[i] for i in reversed(order)]
+
+
+class RouteOptimizer:
+    """
+    2-opt / Or-opt improvement of open routes given as lists of matrix indices.
+
+    Exact solutions are memoized by spot set, since the outer search keeps
+    revisiting the same small days: routes of up to `search_exact_max_spots`
+    spots are solved exactly during the search, and finish() solves routes
+    of up to `exact_max_spots` spots exactly once the search is over.
+    Longer routes use don't-look bits: only spots whose surroundings changed
+    are re-examined, so repairing a route after one insertion or removal
+    costs roughly O(k) per affected spot instead of a full O(n^2) rebuild.
+    """
+
+    def __init__(
+        self,
+        matrix: TravelMatrix,
+        neighbors: Optional[List[List[int]]] = None,
+        exact_max_spots: int = EXACT_MAX_SPOTS,
+        search_exact_max_spots: int = SEARCH_EXACT_MAX_SPOTS,
+    ):
+        self.matrix = matrix
+        self.rows = matrix.km_rows
+        self.neighbors = neighbors if neighbors is not None else nearest_neighbor_lists(matrix)
+        self.exact_max_spots = exact_max_spots
+        self.search_exact_max_spots = min(search_exact_max_spots, exact_max_spots)
+        self._exact: Dict[FrozenSet[int], List[int]] = {}
+
+    def length(self, path: Sequence[int]) -> float:
+        return self.matrix.path_km(path)
+
+    def solve_exact(self, path: Sequence[int]) -> List[int]:
+        """Optimal visiting order of the spots in `path` (memoized by spot set)."""
+        key = frozenset(path)
+        order = self._exact.get(key)
+        if order is None:
+            if len(self._exact) >= EXACT_CACHE_SIZE:
+                self._exact.clear()
+            order = exact_open_path(self.matrix.km, path)
+            self._exact[key] = order
+        return order[:]
+
+    def finish(self, path: Sequence[int]) -> List[int]:
+        """Final visiting order: exact for small routes, local search otherwise."""
+        if len(path) <= self.exact_max_spots:
+            return self.solve_exact(path)
+        return self.improve(path)
+
+    # ----- repair operators -----
+
+    def insert(self, path: List[int], k: int) -> List[int]:
+        """Cheapest insertion of spot `k` into `path`, then local repair around it."""
+        rows = self.rows
+        n = len(path)
+        if n == 0:
+            return [k]
+        if n + 1 <= self.search_exact_max_spots:
+            return self.solve_exact(path + [k])
+
+        # at the front / at the end / between two consecutive spots
+        best_pos, best_cost = 0, rows[k][path[0]]
+        end_cost = rows[path[-1]][k]
+        if end_cost < best_cost:
+            best_pos, best_cost = n, end_cost
+        for i in range(n - 1):
+            a, b = path[i], path[i + 1]
+            cost = rows[a][k] + rows[k][b] - rows[a][b]
+            if cost < best_cost:
+                best_pos, best_cost = i + 1, cost
+
+        new_path = path[:best_pos] + [k] + path[best_pos:]
+        return self.improve(new_path, _around(new_path, best_pos, best_pos))
+
+    def remove(self, path: List[int], pos: int) -> List[int]:
+        """Remove the spot at `pos`, then local repair around the gap."""
+        new_path = path[:pos] + path[pos + 1:]
+        if len(new_path) <= self.search_exact_max_spots:
+            return self.solve_exact(new_path)
+        return self.improve(new_path, _around(new_path, pos - 1, pos))
+
+    # ----- local search -----
+
+    def improve(self, path: Sequence[int], active: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        Apply improving 2-opt and Or-opt moves until none is left.
+
+        `active` lists the spots to start from (all of them by default); a
+        spot is re-activated whenever one of its route edges changes.
+        Routes small enough for the exact solver are solved optimally instead.
+        """
+        path = list(path)
+        if len(path) < 3:
+            return path
+        if len(path) <= self.search_exact_max_spots:
+            return self.solve_exact(path)
+
+        queue = list(path if active is None else active)
+        queued = set(queue)
+        while queue:
+            a = queue.pop()
+            queued.discard(a)
+            touched = self._two_opt_move(path, a) or self._or_opt_move(path, a)
+            if touched:
+                for t in touched + [a]:
+                    if t not in queued:
+                        queued.add(t)
+                        queue.append(t)
+        return path
+
+    def _candidates(self, path: List[int], a: int) -> Sequence[int]:
+        if len(path) <= FULL_SEARCH_MAX_SPOTS:
+            return path
+        return self.neighbors[a]
+
+    def _reversal_gain(self, path: List[int], i: int, j: int) -> float:
+        """Length saved by reversing path[i..j] (inclusive)."""
+        rows = self.rows
+        gain = 0.0
+        if i > 0:
+            prev = path[i - 1]
+            gain += rows[prev][path[i]] - rows[prev][path[j]]
+        if j < len(path) - 1:
+            nxt = path[j + 1]
+            gain += rows[path[j]][nxt] - rows[path[i]][nxt]
+        return gain
+
+    def _two_opt_move(self, path: List[int], a: int) -> List[int]:
+        """
+        Apply the best reversal that makes `a` adjacent to a candidate
+        neighbour. Returns the spots whose edges changed (empty if none).
+        """
+        pos = {k: p for p, k in enumerate(path)}
+        i = pos.get(a)
+        if i is None:
+            return []
+
+        best, best_gain = None, _EPS
+        for c in self._candidates(path, a):
+            j = pos.get(c)
+            if j is None or c == a:
+                continue
+            if j > i + 1:
+                moves = ((i + 1, j), (i, j - 1))
+            elif j < i - 1:
+                moves = ((j, i - 1), (j + 1, i))
+            else:
+                continue
+            for lo, hi in moves:
+                gain = self._reversal_gain(path, lo, hi)
+                if gain > best_gain:
+                    best, best_gain = (lo, hi), gain
+
+        if best is None:
+            return []
+        lo, hi = best
+        path[lo:hi + 1] = path[lo:hi + 1][::-1]
+        # interior edges keep their length; only the two ends changed
+        return _around(path, lo - 1, lo) + _around(path, hi, hi + 1)
+
+    def _or_opt_move(self, path: List[int], a: int) -> List[int]:
+        """
+        Apply the best relocation of a segment of up to OR_OPT_MAX_SEGMENT
+        spots starting or ending at `a`. Returns the spots whose edges
+        changed (empty if none).
+        """
+        n = len(path)
+        try:
+            p = path.index(a)
+        except ValueError:
+            return []
+
+        best, best_gain = None, _EPS
+        for seg_len in range(1, min(OR_OPT_MAX_SEGMENT, n - 1) + 1):
+            for i in {p, p - seg_len + 1}:
+                if i < 0 or i + seg_len > n:
+                    continue
+                move = self._best_segment_move(path, i, seg_len)
+                if move is not None and move[0] > best_gain:
+                    best_gain = move[0]
+                    best = (i, seg_len) + move[1:]
+
+        if best is None:
+            return []
+        i, seg_len, q, reverse = best
+        segment = path[i:i + seg_len]
+        if reverse:
+            segment.reverse()
+        if q < i:
+            path[:] = path[:q] + segment + path[q:i] + path[i + seg_len:]
+            new_lo, new_hi = q, q + seg_len - 1
+            gap = i + seg_len
+        else:
+            path[:] = path[:i] + path[i + seg_len:q] + segment + path[q:]
+            new_lo, new_hi = q - seg_len, q - 1
+            gap = i
+        touched = _around(path, new_lo - 1, new_hi + 1)
+        touched += _around(path, gap - 1, gap)
+        return touched
+
+    def _best_segment_move(self, path: List[int], i: int, seg_len: int) -> Optional[Tuple[float, int, bool]]:
+        """
+        Best relocation of path[i:i+seg_len] to the gap before path[q]
+        (q == len(path) meaning the end), as (gain, q, reversed?), or None
+        when no relocation shortens the route.
+        """
+        rows = self.rows
+        n = len(path)
+        j = i + seg_len
+        first, last = path[i], path[j - 1]
+        prev = path[i - 1] if i > 0 else None
+        nxt = path[j] if j < n else None
+
+        removal_gain = 0.0
+        if prev is not None:
+            removal_gain += rows[prev][first]
+        if nxt is not None:
+            removal_gain += rows[last][nxt]
+        if prev is not None and nxt is not None:
+            removal_gain -= rows[prev][nxt]
+        if removal_gain <= _EPS:
+            return None
+
+        if n <= FULL_SEARCH_MAX_SPOTS:
+            gaps = range(n + 1)
+        else:
+            pos = {k: p for p, k in enumerate(path)}
+            gaps = set()
+            for end in (first, last):
+                for c in self.neighbors[end]:
+                    q = pos.get(c)
+                    if q is not None:
+                        gaps.add(q)
+                        gaps.add(q + 1)
+
+        orientations = ((first, last, False),) if seg_len == 1 else ((first, last, False), (last, first, True))
+        best, best_gain = None, _EPS
+        for q in gaps:
+            if i <= q <= j:
+                continue  # inside or next to the segment itself
+            if q == 0:
+                y = path[0]
+                for head, tail, reverse in orientations:
+                    gain = removal_gain - rows[tail][y]
+                    if gain > best_gain:
+                        best_gain, best = gain, (gain, q, reverse)
+            elif q == n:
+                x = path[-1]
+                for head, tail, reverse in orientations:
+                    gain = removal_gain - rows[x][head]
+                    if gain > best_gain:
+                        best_gain, best = gain, (gain, q, reverse)
+            else:
+                x, y = path[q - 1], path[q]
+                row_x = rows[x]
+                base = row_x[y]
+                for head, tail, reverse in orientations:
+                    gain = removal_gain + base - row_x[head] - rows[tail][y]
+                    if gain > best_gain:
+                        best_gain, best = gain, (gain, q, reverse)
+        return best
+
+
+def _around(path: List[int], lo: int, hi: int) -> List[int]:
+    """Spots at positions lo..hi of `path`, clipped to the route."""
+    return path[max(lo, 0):max(hi + 1, 0)]
+
+
+def improve_itinerary_routes(
+    itinerary: Itinerary, matrix: Optional[TravelMatrix] = None
+) -> Itinerary:
+    """
+    Polish the visiting order of every day of `itinerary` in place (exact
+    for small days) and refresh per-day distances. Days keep the same spots.
+    """
+    if matrix is None:
+        all_spots = [s for day in itinerary.days for s in day.spots]
+        # only distances are needed here, so any mode will do
+        matrix = TravelMatrix(all_spots, TransportMode.WALK)
+
+    optimizer = RouteOptimizer(matrix)
+    for day in itinerary.days:
+        positions = matrix.indices_of(day.spots)
+        by_index = dict(zip(positions, day.spots))
+        path = optimizer.finish(positions)
+        day.spots = [by_index[k] for k in path]
+        day.total_distance_km = round(matrix.path_km(path), 2)
+    return itinerary
@@ -0,0 +1,230 @@
+"""
+Uniform grid index over spot coordinates.
+
+Points are projected to planar km (equirectangular around the mean
+latitude, like agent.clustering) and bucketed into square cells, so
+nearest-neighbour, radius and bounding-box queries only visit the cells
+around the query instead of every point. At city scale the projection error is negligible,
+and the index needs nothing beyond NumPy.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Points per cell the default cell size aims for
+TARGET_POINTS_PER_CELL = 4
+
+# Smallest default cell edge (km); keeps tiny or duplicate-heavy sets sane
+MIN_CELL_KM = 0.05
+
+# Planar km per degree of latitude
+KM_PER_DEGREE = 111.0
+
+
+class GridIndex:
+    """Nearest-neighbour and radius queries over a fixed set of points."""
+
+    def __init__(self, lats: Sequence[float], lons: Sequence[float], cell_km: Optional[float] = None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        n = len(self.lats)
+
+        lat0 = math.radians(float(self.lats.mean())) if n else 0.0
+        self._x_scale = math.cos(lat0) * KM_PER_DEGREE
+        self.points = self._project(self.lats, self.lons)
+
+        if cell_km is None:
+            cell_km = 1.0
+            if n:
+                span = self.points.max(axis=0) - self.points.min(axis=0)
+                area = float(max(span[0], MIN_CELL_KM) * max(span[1], MIN_CELL_KM))
+                cell_km = max(math.sqrt(area * TARGET_POINTS_PER_CELL / n), MIN_CELL_KM)
+        self.cell_km = float(cell_km)
+
+        cells = np.floor(self.points / self.cell_km).astype(np.int64)
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, (cx, cy) in enumerate(cells.tolist()):
+            buckets.setdefault((cx, cy), []).append(i)
+        self._cells = cells
+        self._buckets: Dict[Tuple[int, int], np.ndarray] = {
+            key: np.array(members, dtype=np.int64) for key, members in buckets.items()
+        }
+        if n:
+            self._cell_min = cells.min(axis=0)
+            self._cell_max = cells.max(axis=0)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _project(self, lats, lons) -> np.ndarray:
+        return np.column_stack((np.asarray(lons, dtype=float) * self._x_scale,
+                                np.asarray(lats, dtype=float) * KM_PER_DEGREE))
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        x, y = self._project([lat], [lon])[0]
+        return int(math.floor(x / self.cell_km)), int(math.floor(y / self.cell_km))
+
+    def _block(self, cx: int, cy: int, r: int) -> np.ndarray:
+        """Indices of every point in the (2r+1)^2 cells around (cx, cy)."""
+        # only the occupied part of the grid can hold anything
+        parts = [
+            self._buckets[key]
+            for gx in range(max(cx - r, int(self._cell_min[0])), min(cx + r, int(self._cell_max[0])) + 1)
+            for gy in range(max(cy - r, int(self._cell_min[1])), min(cy + r, int(self._cell_max[1])) + 1)
+            if (key := (gx, gy)) in self._buckets
+        ]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _scan_all(self, cx: int, cy: int, r: int) -> bool:
+        """
+        Whether a query from cell (cx, cy) should look at every point
+        rather than the cells within r: when it lies outside the occupied
+        cells (so rings would first cross empty ground) or the ring has
+        more cells than the grid has occupied ones. A vectorized scan of
+        all points is cheap next to walking that many cells.
+        """
+        outside = not (self._cell_min[0] <= cx <= self._cell_max[0] and self._cell_min[1] <= cy <= self._cell_max[1])
+        return outside or (2 * r + 1) ** 2 > len(self._buckets)
+
+    def _max_ring(self, cx: int, cy: int) -> int:
+        # ring radius that covers every occupied cell
+        return int(max(
+            abs(cx - self._cell_min[0]), abs(cx - self._cell_max[0]),
+            abs(cy - self._cell_min[1]), abs(cy - self._cell_max[1]),
+        ))
+
+    def nearest(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k points closest to (lat, lon), nearest first, as (indices, km).
+        Fewer when the index holds fewer points.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        query = self._project([lat], [lon])[0]
+        cx, cy = self._cell_of(lat, lon)
+        r, last = 1, self._max_ring(cx, cy)
+        while True:
+            if self._scan_all(cx, cy, r):
+                d = np.hypot(*(self.points - query).T)
+                order = np.argsort(d, kind="stable")[:k]
+                return order, d[order]
+            members = self._block(cx, cy, r)
+            if len(members) >= k:
+                d = np.hypot(*(self.points[members] - query).T)
+                order = np.argsort(d, kind="stable")[:k]
+                # anything outside the block is at least r cells away
+                if d[order[-1]] <= r * self.cell_km or r >= last:
+                    return members[order], d[order]
+            elif r >= last:
+                d = np.hypot(*(self.points[members] - query).T)
+                order = np.argsort(d, kind="stable")
+                return members[order], d[order]
+            r += 1
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Points within `radius_km` of (lat, lon), nearest first, as (indices, km)."""
+        if not len(self) or radius_km < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        query = self._project([lat], [lon])[0]
+        cx, cy = self._cell_of(lat, lon)
+        r = min(int(math.ceil(radius_km / self.cell_km)), self._max_ring(cx, cy))
+        members = np.arange(len(self)) if self._scan_all(cx, cy, r) else self._block(cx, cy, r)
+        d = np.hypot(*(self.points[members] - query).T)
+        keep = d <= radius_km
+        members, d = members[keep], d[keep]
+        order = np.argsort(d, kind="stable")
+        return members[order], d[order]
+
+    def in_bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Indices of the points inside a lat/lon box (edges included), ascending."""
+        if not len(self) or south > north or west > east:
+            return np.empty(0, dtype=np.int64)
+        (x0, y0), (x1, y1) = self._project([south, north], [west, east])
+        # only the occupied part of the grid can hold anything
+        cx0 = max(int(math.floor(x0 / self.cell_km)), int(self._cell_min[0]))
+        cx1 = min(int(math.floor(x1 / self.cell_km)), int(self._cell_max[0]))
+        cy0 = max(int(math.floor(y0 / self.cell_km)), int(self._cell_min[1]))
+        cy1 = min(int(math.floor(y1 / self.cell_km)), int(self._cell_max[1]))
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._buckets):
+            members = np.arange(len(self))
+        else:
+            parts = [
+                self._buckets[key]
+                for gx in range(cx0, cx1 + 1)
+                for gy in range(cy0, cy1 + 1)
+                if (key := (gx, gy)) in self._buckets
+            ]
+            if not parts:
+                return np.empty(0, dtype=np.int64)
+            members = np.concatenate(parts)
+        lats, lons = self.lats[members], self.lons[members]
+        keep = (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+        return np.sort(members[keep])
+
+    def pairs_within(self, radius_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Every pair of points at most `radius_km` apart, as (i, j, km) arrays
+        with i < j, ordered by i and then j.
+        """
+        if len(self) < 2 or radius_km < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        r = max(1, int(math.ceil(radius_km / self.cell_km)))
+        found_i, found_j, found_km = [], [], []
+        for (cx, cy), rows in self._buckets.items():
+            members = np.arange(len(self)) if self._scan_all(cx, cy, r) else self._block(cx, cy, r)
+            d = np.hypot(
+                self.points[rows, None, 0] - self.points[None, members, 0],
+                self.points[rows, None, 1] - self.points[None, members, 1],
+            )
+            a, b = np.nonzero((d <= radius_km) & (rows[:, None] < members[None, :]))
+            found_i.append(rows[a])
+            found_j.append(members[b])
+            found_km.append(d[a, b])
+        i, j, km = np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_km)
+        order = np.lexsort((j, i))
+        return i[order], j[order], km[order]
+
+    def neighbor_lists(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k nearest other points of every point, as (indices, km) arrays
+        of shape (n, k), nearest first. Rows are padded with -1 / inf when
+        there are fewer than k other points.
+
+        Points are handled a cell at a time, so each distance block covers
+        all points of one cell against the cells around it.
+        """
+        n = len(self)
+        k = max(0, k)
+        indices = np.full((n, k), -1, dtype=np.int64)
+        km = np.full((n, k), np.inf)
+        if n < 2 or k == 0:
+            return indices, km
+
+        want = min(k, n - 1)
+        for (cx, cy), rows in self._buckets.items():
+            r, last = 1, self._max_ring(cx, cy)
+            while True:
+                if self._scan_all(cx, cy, r):
+                    members, r = np.arange(n), last
+                else:
+                    members = self._block(cx, cy, r)
+                d = np.hypot(
+                    self.points[rows, None, 0] - self.points[None, members, 0],
+                    self.points[rows, None, 1] - self.points[None, members, 1],
+                )
+                d[rows[:, None] == members[None, :]] = np.inf  # not its own neighbour
+                if len(members) - 1 >= want:
+                    order = np.argsort(d, axis=1, kind="stable")[:, :want]
+                    kth = np.take_along_axis(d, order[:, -1:], axis=1)
+                    if r >= last or np.all(kth <= r * self.cell_km):
+                        break
+                elif r >= last:
+                    order = np.argsort(d, axis=1, kind="stable")[:, :want]
+                    break
+                r += 1
+            indices[rows, :want] = members[order]
+            km[rows, :want] = np.take_along_axis(d, order, axis=1)
+        return indices, km
@@ -0,0 +1,228 @@
+"""
+Compiled binary snapshots of city spot data.
+
+A snapshot holds the spots of one data/spots_<city>.json file in columns:
+float64 lat/lon, small integer category/duration/rating arrays and one
+deduplicated UTF-8 string table that the text columns index into. It is
+read through mmap and the columns are NumPy views of the mapping, so
+opening one parses nothing and the columns' pages are shared through the
+OS page cache. The Spot objects built from them (see spots()) are still
+per process.
+
+Layout (all sections 8-byte aligned, little endian):
+
+    MAGIC | uint64 header length | JSON header | column sections
+
+The header records the column offsets and dtypes, the category names,
+the data version of the spots and the size, mtime and MD5 of the source
+file, so a stale snapshot can be told apart from a current one.
+
+Build snapshots with scripts/compile_spot_snapshots.py.
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from agent.models import Spot, construct_spot
+
+MAGIC = b"SPOTSNP1"
+FORMAT_VERSION = 1
+
+# Ratings are stored in tenths; this marks a missing rating or duration
+MISSING = -1
+
+# Text fields kept in the string table; the nearby lists are stored as JSON
+TEXT_FIELDS = ("name", "description", "city")
+JSON_FIELDS = ("nearby_foods", "nearby_shops")
+
+_ALIGN = 8
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+class _StringTable:
+    """Deduplicating builder for the string table."""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.strings: List[bytes] = []
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return MISSING
+        i = self.index.get(value)
+        if i is None:
+            i = len(self.strings)
+            self.index[value] = i
+            self.strings.append(value.encode("utf-8"))
+        return i
+
+    def arrays(self):
+        lengths = np.fromiter((len(s) for s in self.strings), dtype=np.int64, count=len(self.strings))
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        return offsets, np.frombuffer(b"".join(self.strings), dtype=np.uint8)
+
+
+def write_snapshot(path: str, spots: Sequence[Spot], data_version: str, source: Dict[str, Any]) -> int:
+    """
+    Write `spots` as a snapshot to `path` (atomically, via a temporary
+    file). `source` describes the JSON file it was compiled from (size,
+    mtime_ns, md5). Returns the snapshot size in bytes.
+
+    Raises ValueError for ratings that are not whole tenths, which the
+    rating column cannot hold.
+    """
+    n = len(spots)
+    for s in spots:
+        if s.rating is not None and round(s.rating * 10) / 10 != s.rating:
+            raise ValueError(f"rating {s.rating} of {s.name!r} is not a whole tenth")
+    categories = sorted({s.category for s in spots})
+    category_ids = {c: i for i, c in enumerate(categories)}
+    table = _StringTable()
+
+    columns: Dict[str, np.ndarray] = {
+        "lat": np.array([s.lat for s in spots], dtype="<f8"),
+        "lon": np.array([s.lon for s in spots], dtype="<f8"),
+        "category": np.array([category_ids[s.category] for s in spots], dtype="<u2"),
+        "duration": np.array(
+            [MISSING if s.duration_minutes is None else s.duration_minutes for s in spots], dtype="<i4"
+        ),
+        "rating": np.array(
+            [MISSING if s.rating is None else int(round(s.rating * 10)) for s in spots], dtype="<i2"
+        ),
+    }
+    for name in TEXT_FIELDS:
+        columns[name] = np.array([table.add(getattr(s, name)) for s in spots], dtype="<i4")
+    for name in JSON_FIELDS:
+        columns[name] = np.array(
+            [table.add(None if getattr(s, name) is None else json.dumps(getattr(s, name), ensure_ascii=False))
+             for s in spots],
+            dtype="<i4",
+        )
+    columns["string_offsets"], columns["string_data"] = table.arrays()
+
+    # offsets are relative to the first section, so the header can be
+    # written without knowing its own length
+    layout, offset = {}, 0
+    for name, array in columns.items():
+        layout[name] = {"dtype": array.dtype.str, "count": int(array.size), "offset": offset}
+        offset += array.nbytes + _pad(array.nbytes)
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "count": n,
+        "categories": categories,
+        "data_version": data_version,
+        "source": source,
+        "columns": layout,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<Q", len(header)) + header
+    prefix += b"\0" * _pad(len(prefix))
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(prefix)
+        for array in columns.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * _pad(array.nbytes))
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+class SpotSnapshot:
+    """A snapshot file mapped into memory; columns are read-only array views."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # the mapping stays open for as long as any column view is alive
+        try:
+            self._read_header()
+        except (KeyError, TypeError, struct.error) as e:
+            raise ValueError(f"{path} is a corrupt spot snapshot: {e}") from e
+
+    def _read_header(self) -> None:
+        buf = self._mmap
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a spot snapshot")
+        (length,) = struct.unpack_from("<Q", buf, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(buf[start:start + length]))
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has unsupported snapshot format {header.get('format')}")
+
+        base = start + length + _pad(start + length)
+        self.count: int = header["count"]
+        self.categories: List[str] = header["categories"]
+        self.data_version: str = header["data_version"]
+        self.source: Dict[str, Any] = header["source"]
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.frombuffer(buf, dtype=np.dtype(col["dtype"]), count=col["count"], offset=base + col["offset"])
+            for name, col in header["columns"].items()
+        }
+        self.lats = self.columns["lat"]
+        self.lons = self.columns["lon"]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def string(self, i: int) -> Optional[str]:
+        """Entry `i` of the string table; None for MISSING."""
+        if i < 0:
+            return None
+        offsets = self.columns["string_offsets"]
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        return bytes(self.columns["string_data"][start:end]).decode("utf-8")
+
+    def details(self, row: int) -> Dict[str, Any]:
+        """The DETAIL_FIELDS of one row, decoded on demand."""
+        cols = self.columns
+        foods, shops = int(cols["nearby_foods"][row]), int(cols["nearby_shops"][row])
+        return {
+            "description": self.string(int(cols["description"][row])),
+            "nearby_foods": None if foods == MISSING else json.loads(self.string(foods)),
+            "nearby_shops": None if shops == MISSING else json.loads(self.string(shops)),
+        }
+
+    def spots(self, details: bool = True) -> List[Spot]:
+        """
+        Spot objects for every row. The data was validated when the snapshot
+        was compiled, so the models are constructed without validation.
+        With details=False the DETAIL_FIELDS are left unset (None) and
+        nothing but the core fields is decoded; see details().
+        """
+        cols = self.columns
+        strings = self.string
+        categories = self.categories
+        text = {name: cols[name].tolist() for name in TEXT_FIELDS + JSON_FIELDS}
+        lats, lons = cols["lat"].tolist(), cols["lon"].tolist()
+        category, duration, rating = cols["category"].tolist(), cols["duration"].tolist(), cols["rating"].tolist()
+
+        # repeated strings (city names) are decoded once
+        decoded: Dict[int, Optional[str]] = {}
+
+        def text_at(i: int) -> Optional[str]:
+            if i not in decoded:
+                decoded[i] = strings(i)
+            return decoded[i]
+
+        spots = []
+        for r in range(self.count):
+            spots.append(construct_spot(
+                name=text_at(text["name"][r]),
+                lat=lats[r],
+                lon=lons[r],
+                category=categories[category[r]],
+                duration_minutes=None if duration[r] == MISSING else duration[r],
+                rating=None if rating[r] == MISSING else rating[r] / 10,
+                city=text_at(text["city"][r]),
+                **(self.details(r) if details else {}),
+            ))
+        return spots
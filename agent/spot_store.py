@@ -0,0 +1,312 @@
+"""
+In-memory store of the bundled city spot data (data/spots_<city>.json).
+
+Reading, parsing and validating a city file costs far more than planning
+small trips (Berlin has 7,135 spots), so the store does it once per city,
+on first use or up front with preload(), and keeps the Spot objects, their
+coordinates as arrays and the data version fingerprint in memory, with a
+grid index (agent.spatial) over them built on the first spatial query.
+
+When a compiled snapshot of the file exists (see agent.spot_snapshot and
+scripts/compile_spot_snapshots.py) and was built from the current
+content, the spots come from the memory-mapped snapshot instead and the
+JSON is not parsed at all.
+
+Every lookup stats the file. When its mtime or size changed the file is
+hashed, and only when the content really differs is it loaded again, so
+edited data is picked up without a restart. A file that fails to load
+leaves the previous version in service.
+
+The Spot objects leave their DETAIL_FIELDS (descriptions and nearby POI
+lists, which planning never reads) unset; the city's SpotDetails holds
+them instead, read from the snapshot's string table when asked for, and
+client_dicts() puts them back for responses. This keeps presentation
+data out of the spots the planner works with, but it does not make the
+store itself smaller: every Spot is still built in each worker process,
+and without a snapshot the details stay in memory as before. The Spot
+objects are shared by all callers and must not be modified.
+"""
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.cache import data_version_for_spots
+from agent.models import DETAIL_FIELDS, Spot
+from agent.spatial import GridIndex
+from agent.spot_snapshot import SpotSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Visit length (minutes) for spots that don't give one, by category
+DEFAULT_DURATIONS = {
+    'outdoor': 60, 'indoor': 90, 'temple': 45,
+    'shopping': 60, 'museum': 90, 'food': 60, 'sightseeing': 90,
+}
+DEFAULT_DURATION = 60
+
+# Subdirectory of the data directory holding compiled snapshots
+SNAPSHOT_DIR = 'snapshots'
+
+
+def city_key(city: str) -> str:
+    """Normalized city name, as used in the data file names."""
+    return city.lower().replace(' ', '')
+
+
+def parse_spots(raw: bytes) -> List[Spot]:
+    """
+    Spot objects from the bytes of a city file, with default durations
+    filled in. Records that fail to load are skipped with a warning;
+    raises ValueError when the file is not a JSON list or no record loads.
+    """
+    records = json.loads(raw)
+    if not isinstance(records, list):
+        raise ValueError("spot data must be a JSON list")
+    spots = []
+    for i, data in enumerate(records):
+        try:
+            spot = Spot(**{k: v for k, v in data.items() if k in Spot.model_fields})
+            if spot.duration_minutes is None:
+                spot.duration_minutes = DEFAULT_DURATIONS.get(spot.category, DEFAULT_DURATION)
+        except Exception as e:
+            logger.warning(f"Skipping spot record {i}: {e}")
+            continue
+        spots.append(spot)
+    if records and not spots:
+        raise ValueError(f"none of the {len(records)} spot records could be loaded")
+    return spots
+
+
+def _spot_key(spot: Spot) -> Tuple[str, float, float]:
+    return (spot.name, spot.lat, spot.lon)
+
+
+class SpotDetails:
+    """The DETAIL_FIELDS of a city's spots, looked up by spot."""
+
+    def __init__(self, spots: Sequence[Spot], row_details: Callable[[int], Dict[str, Any]]):
+        self._spots = spots
+        self._row_details = row_details
+        self._rows: Optional[Dict[Tuple[str, float, float], int]] = None
+
+    def get(self, spot: Spot) -> Optional[Dict[str, Any]]:
+        """Details of `spot`, or None for a spot that is not in this data."""
+        if self._rows is None:
+            # built on first use; a race only builds it twice
+            rows: Dict[Tuple[str, float, float], int] = {}
+            for i, s in enumerate(self._spots):
+                rows.setdefault(_spot_key(s), i)
+            self._rows = rows
+        row = self._rows.get(_spot_key(spot))
+        return None if row is None else self._row_details(row)
+
+
+def _split_details(spots: List[Spot]) -> Callable[[int], Dict[str, Any]]:
+    """Move the DETAIL_FIELDS of freshly parsed spots aside; returns their lookup by row."""
+    columns = {name: [getattr(spot, name) for spot in spots] for name in DETAIL_FIELDS}
+    for spot in spots:
+        for name in DETAIL_FIELDS:
+            setattr(spot, name, None)
+    return lambda row: {name: column[row] for name, column in columns.items()}
+
+
+@dataclass(frozen=True)
+class CitySpots:
+    """One loaded version of a city file."""
+    city: str
+    path: str
+    spots: Tuple[Spot, ...]
+    data_version: str
+    content_hash: str
+    mtime_ns: int
+    size: int
+    lats: np.ndarray = field(repr=False, compare=False)
+    lons: np.ndarray = field(repr=False, compare=False)
+    details: SpotDetails = field(repr=False, compare=False)
+
+    def __len__(self) -> int:
+        return len(self.spots)
+
+    @functools.cached_property
+    def index(self) -> GridIndex:
+        """Spatial index over the spots, row i being spots[i]; built on first use."""
+        return GridIndex(self.lats, self.lons)
+
+
+class SpotStore:
+    """City spot data loaded once per process and reloaded when the file changes."""
+
+    def __init__(self, data_dir: str, snapshot_dir: Optional[str] = None):
+        self.data_dir = data_dir
+        self.snapshot_dir = snapshot_dir or os.path.join(data_dir, SNAPSHOT_DIR)
+        self._cities: Dict[str, CitySpots] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, city: str) -> str:
+        return os.path.join(self.data_dir, f"spots_{city_key(city)}.json")
+
+    def snapshot_path_for(self, city: str) -> str:
+        return os.path.join(self.snapshot_dir, f"spots_{city_key(city)}.snap")
+
+    def cities(self) -> List[str]:
+        """Keys of every city with a data file."""
+        try:
+            names = os.listdir(self.data_dir)
+        except OSError:
+            return []
+        return sorted(n[6:-5] for n in names if n.startswith('spots_') and n.endswith('.json'))
+
+    def get(self, city: str) -> Optional[CitySpots]:
+        """The current data of `city`, loading it if needed; None without a usable file."""
+        key = city_key(city)
+        path = self.path_for(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._cities.pop(key, None)
+            return None
+
+        entry = self._cities.get(key)
+        if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+            return entry
+
+        with self._lock:
+            # another thread may have reloaded it while we waited
+            entry = self._cities.get(key)
+            if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                return entry
+            return self._load(key, path, stat, entry)
+
+    def spots(self, city: str) -> List[Spot]:
+        """A new list of the city's (shared) spots; empty without data."""
+        entry = self.get(city)
+        return list(entry.spots) if entry is not None else []
+
+    def client_dicts(self, city: str, spots: Sequence[Spot]) -> List[Dict[str, Any]]:
+        """
+        Spot.to_dict() of each spot, with the DETAIL_FIELDS the store keeps
+        aside filled in. Spots from elsewhere (e.g. the Places API) are
+        passed through as they are.
+        """
+        dicts = [s.to_dict() for s in spots]
+        entry = self.get(city)
+        if entry is None:
+            return dicts
+        for spot, data in zip(spots, dicts):
+            details = entry.details.get(spot)
+            if details:
+                for name, value in details.items():
+                    if data.get(name) is None:
+                        data[name] = value
+        return dicts
+
+    def preload(self, cities: Optional[Iterable[str]] = None) -> int:
+        """Load `cities` (default: all) now rather than on first use; returns the spot count."""
+        total = 0
+        for city in (self.cities() if cities is None else cities):
+            entry = self.get(city)
+            if entry is not None:
+                total += len(entry)
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cities.clear()
+
+    def _snapshot(self, key: str, stat: os.stat_result,
+                  content_hash: Optional[str] = None) -> Optional[SpotSnapshot]:
+        """
+        The snapshot of `key` if it was compiled from the file as it is now:
+        same size and either the same mtime or, once the file has been
+        hashed, the same content.
+        """
+        path = self.snapshot_path_for(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            snapshot = SpotSnapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring spot snapshot {path}: {e}")
+            return None
+        source = snapshot.source
+        if source.get('size') != stat.st_size:
+            return None
+        if content_hash is None:
+            return snapshot if source.get('mtime_ns') == stat.st_mtime_ns else None
+        return snapshot if source.get('md5') == content_hash else None
+
+    def _load(self, key: str, path: str, stat: os.stat_result,
+              previous: Optional[CitySpots]) -> Optional[CitySpots]:
+        # an up-to-date snapshot spares reading and hashing the JSON
+        snapshot = self._snapshot(key, stat)
+        raw = None
+        if snapshot is not None:
+            content_hash = snapshot.source['md5']
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+            except OSError as e:
+                logger.error(f"Error reading spot data from {path}: {e}")
+                return previous
+            content_hash = hashlib.md5(raw).hexdigest()
+
+        if previous is not None and previous.content_hash == content_hash:
+            # touched or rewritten with the same content; nothing to load
+            entry = dataclasses.replace(previous, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        else:
+            if snapshot is None:
+                snapshot = self._snapshot(key, stat, content_hash)
+            if snapshot is not None:
+                spots = snapshot.spots(details=False)
+                entry = CitySpots(
+                    city=key,
+                    path=path,
+                    spots=tuple(spots),
+                    data_version=snapshot.data_version,
+                    content_hash=content_hash,
+                    mtime_ns=stat.st_mtime_ns,
+                    size=stat.st_size,
+                    lats=snapshot.lats,
+                    lons=snapshot.lons,
+                    details=SpotDetails(spots, snapshot.details),
+                )
+                source = snapshot.path
+            else:
+                try:
+                    spots = parse_spots(raw)
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Error loading spot data from {path}: {e}")
+                    if previous is None:
+                        return None
+                    # keep serving the old data, without retrying until the file changes again
+                    entry = dataclasses.replace(previous, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    self._cities[key] = entry
+                    return entry
+                data_version = data_version_for_spots([s.model_dump() for s in spots])
+                details = _split_details(spots)
+                entry = CitySpots(
+                    city=key,
+                    path=path,
+                    spots=tuple(spots),
+                    data_version=data_version,
+                    content_hash=content_hash,
+                    mtime_ns=stat.st_mtime_ns,
+                    size=stat.st_size,
+                    lats=np.array([s.lat for s in spots], dtype=float),
+                    lons=np.array([s.lon for s in spots], dtype=float),
+                    details=SpotDetails(spots, details),
+                )
+                source = path
+            logger.info(f"{'Reloaded' if previous else 'Loaded'} {len(entry)} spots for {key} from {source}")
+
+        self._cities[key] = entry
+        return entry
@@ -0,0 +1,159 @@
+"""
+Precomputed pairwise travel matrices for the planner.
+
+The planner evaluates the same spot-to-spot legs thousands of times per run.
+A DistanceMatrix computes every distance once per spot set, vectorized over
+the lat/lon arrays, and is shared by all transport modes. Each mode's
+TravelMatrix derives travel times from it with an affine transform
+(speed and fixed wait from agent.geometry), so the hot loops only do list
+lookups by integer spot id.
+
+The k nearest neighbours of every spot come from a grid index rather than
+the dense matrix, so they cost the same for every mode and are built once
+per DistanceMatrix.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.models import Spot
+from agent.geometry import TransportMode, distance_matrix, mode_speed_and_wait
+from agent.spatial import GridIndex
+
+
+def _spot_key(spot: Spot) -> Tuple[str, float, float]:
+    # Keyed by value rather than identity so deep copies of a spot
+    # resolve to the same row.
+    return (spot.name, spot.lat, spot.lon)
+
+
+def _path_sum(rows: List[List[float]], path: Sequence[int]) -> float:
+    return sum((rows[path[i]][path[i + 1]] for i in range(len(path) - 1)), 0.0)
+
+
+class DistanceMatrix:
+    """Mode-agnostic distance (km) between every pair of spots."""
+
+    def __init__(self, spots: Sequence[Spot], km: Optional[np.ndarray] = None):
+        self.spots: List[Spot] = list(spots)
+
+        self.lats = np.array([s.lat for s in self.spots], dtype=float)
+        self.lons = np.array([s.lon for s in self.spots], dtype=float)
+
+        if km is None:
+            km = distance_matrix(self.lats, self.lons)
+        self.km = km
+
+        # Python lists are much faster than ndarray scalar indexing inside
+        # the pure-Python search loops.
+        self.km_rows: List[List[float]] = self.km.tolist()
+
+        self._index: Dict[Tuple[str, float, float], int] = {}
+        for i, s in enumerate(self.spots):
+            self._index.setdefault(_spot_key(s), i)
+
+        self._modes: Dict[TransportMode, "TravelMatrix"] = {}
+        self._neighbors: Dict[int, List[List[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.spots)
+
+    def __getstate__(self):
+        # Only ship the array to pool workers; the rest is cheap to rebuild.
+        return {"spots": self.spots, "km": self.km}
+
+    def __setstate__(self, state):
+        self.__init__(state["spots"], state["km"])
+
+    def index_of(self, spot: Spot) -> int:
+        return self._index[_spot_key(spot)]
+
+    def indices_of(self, spots: Sequence[Spot]) -> List[int]:
+        index = self._index
+        return [index[_spot_key(s)] for s in spots]
+
+    def path_km(self, path: Sequence[int]) -> float:
+        return _path_sum(self.km_rows, path)
+
+    def neighbor_lists(self, k: int) -> List[List[int]]:
+        """
+        For every spot, the indices of its k nearest other spots (closest
+        first), from a grid index over the coordinates; cached per k.
+        """
+        lists = self._neighbors.get(k)
+        if lists is None:
+            near, _ = GridIndex(self.lats, self.lons).neighbor_lists(k)
+            lists = [[j for j in row if j >= 0] for row in near.tolist()]
+            self._neighbors[k] = lists
+        return lists
+
+    def for_mode(self, mode: TransportMode) -> "TravelMatrix":
+        """Travel-time view for `mode`, derived once and cached."""
+        matrix = self._modes.get(mode)
+        if matrix is None:
+            matrix = TravelMatrix(self, mode)
+            self._modes[mode] = matrix
+        return matrix
+
+
+class TravelMatrix:
+    """
+    Distance (km) and travel time (minutes) between every pair of spots for
+    one transport mode. Accepts either a spot list or a shared DistanceMatrix.
+    """
+
+    def __init__(self, spots_or_distances, mode: TransportMode):
+        if isinstance(spots_or_distances, DistanceMatrix):
+            distances = spots_or_distances
+        else:
+            distances = DistanceMatrix(spots_or_distances)
+        self.distances = distances
+        self.mode = mode
+
+        self.spots = distances.spots
+        self.lats = distances.lats
+        self.lons = distances.lons
+        self.km = distances.km
+        self.km_rows = distances.km_rows
+
+        speed_kmh, wait_minutes = mode_speed_and_wait(mode)
+        self.minutes = (self.km / speed_kmh) * 60 + wait_minutes
+        self.minutes_rows: List[List[float]] = self.minutes.tolist()
+
+    def __len__(self) -> int:
+        return len(self.spots)
+
+    def __getstate__(self):
+        return {"distances": self.distances, "mode": self.mode}
+
+    def __setstate__(self, state):
+        self.__init__(state["distances"], state["mode"])
+
+    def index_of(self, spot: Spot) -> int:
+        return self.distances.index_of(spot)
+
+    def indices_of(self, spots: Sequence[Spot]) -> List[int]:
+        return self.distances.indices_of(spots)
+
+    def path_km(self, path: Sequence[int]) -> float:
+        return _path_sum(self.km_rows, path)
+
+    def path_minutes(self, path: Sequence[int]) -> float:
+        return _path_sum(self.minutes_rows, path)
+
+    def nearest_neighbor_order(self, path: Sequence[int]) -> List[int]:
+        """Greedy nearest-neighbour visiting order starting from path[0]."""
+        if not path:
+            return []
+
+        rows = self.km_rows
+        unvisited = list(path)
+        order = [unvisited.pop(0)]
+
+        while unvisited:
+            row = rows[order[-1]]
+            nxt = min(unvisited, key=row.__getitem__)
+            order.append(nxt)
+            unvisited.remove(nxt)
+
+        return order
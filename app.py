@@ -1,22 +1,45 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_socketio import SocketIO, emit
-from agent.planner import plan_itinerary_soft_constraints
+from agent.planner import (
+    plan_itinerary_soft_constraints,
+    plan_itinerary_multistart,
+    plan_modes_concurrently,
+    plan_batch,
+    PlanSpec,
+    SearchStrategy,
+    CandidateSelection,
+    narrow_candidates,
+)
 from agent.geometry import TransportMode
 from agent.geometry import travel_cost_minutes, distance as geo_distance
 from agent.constraints import ScoreConfig
+from agent.travel_matrix import DistanceMatrix, TravelMatrix
 from agent.models import Spot
 from agent.explainer import weather_advice
-from agent.cache import cache, cache_key_for_spots, cache_key_for_cities, cache_key_for_plan
+from agent.cache import (
+    cache,
+    cache_key_for_spots,
+    cache_key_for_cities,
+    cache_key_for_plan,
+    data_version_for_spots,
+    plan_cache,
+)
 from agent.rate_limiter import rate_limit
-from agent.logging_config import setup_logging, log_request, log_error, log_performance
+from agent.jobs import create_job_queue, register_handler, current_job, JobFailed, JobQueueFull, JobStatus
+from agent.logging_config import setup_logging, log_request, log_error, log_performance, log_plan_trace
+from agent.instrumentation import NULL_TRACE, PlanTrace
 from agent.itinerary_storage import ItineraryStorage
 from agent.auth import AuthService
 from agent.user_profile import UserProfileService
 from agent.places_api import PlacesApiService
+from agent.spatial import GridIndex
+from agent.spot_store import SpotStore
 import jwt
 from functools import wraps
 from datetime import date
+from concurrent.futures.process import BrokenProcessPool
 import json
+import math
 import os
 import requests
 import traceback
@@ -39,6 +62,8 @@ storage = ItineraryStorage()
 auth_service = AuthService()
 user_profile_service = UserProfileService()
 places_api_service = PlacesApiService()
+# Bundled city data, parsed once per process and reloaded when a file changes
+spot_store = SpotStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
 
 app = Flask(__name__)
 app.logger = logger  # Replace Flask's default logger
@@ -59,6 +84,52 @@ socketio = SocketIO(
     engineio_logger=True
 )
 
+# Planner search settings: 'anneal' runs each mode for a fixed wall-clock
+# budget (predictable latency), 'hill_climb' runs a fixed number of trials.
+PLANNER_STRATEGY = SearchStrategy(os.environ.get('PLANNER_STRATEGY', SearchStrategy.ANNEAL.value))
+PLANNER_TIME_BUDGET_MS = float(os.environ.get('PLANNER_TIME_BUDGET_MS', 300))
+# Independent search restarts per mode, spread over the planning process pool
+# (PLANNER_WORKERS sets its size); 1 keeps planning in the request worker.
+PLANNER_STARTS = int(os.environ.get('PLANNER_STARTS', 1))
+# Plan the requested transport modes concurrently on the process pool
+PLANNER_PARALLEL_MODES = os.environ.get('PLANNER_PARALLEL_MODES', 'True').lower() == 'true'
+# When a user selects all spots or none, plan PLANNER_SPOTS_PER_DAY visits a
+# day chosen from the city's PLANNER_CANDIDATE_LIMIT most popular spots
+# (0 considers all of them); a larger limit trades latency for quality
+PLANNER_SPOTS_PER_DAY = int(os.environ.get('PLANNER_SPOTS_PER_DAY', 6))
+PLANNER_CANDIDATE_LIMIT = int(os.environ.get('PLANNER_CANDIDATE_LIMIT', 2000))
+# Cities with at most this many spots are planned with every spot, whatever the trip length
+PLANNER_ALL_SPOTS_MAX = int(os.environ.get('PLANNER_ALL_SPOTS_MAX', 20))
+# Minimum gap between intermediate itineraries streamed per mode while
+# planning (planning_improvement events); 0 disables them
+PLANNER_IMPROVEMENT_INTERVAL_MS = float(os.environ.get('PLANNER_IMPROVEMENT_INTERVAL_MS', 200))
+# Trace every plan request (phase timings, search counters, score traces),
+# log it and return it as `debug`; requests can also ask with "debug": true
+PLANNER_DEBUG = os.environ.get('PLANNER_DEBUG', 'False').lower() == 'true'
+# How long a computed plan comparison is reused for identical requests (seconds)
+PLAN_CACHE_TTL = int(os.environ.get('PLAN_CACHE_TTL', 3600))
+# Most plan specs accepted by one /api/plan_batch call
+PLAN_BATCH_MAX_SPECS = int(os.environ.get('PLAN_BATCH_MAX_SPECS', 50))
+# Spatial /api/spots queries: results of a `near` query without k or radius,
+# the most spots any spatial query returns and the largest radius (meters)
+SPOTS_NEAR_DEFAULT_K = int(os.environ.get('SPOTS_NEAR_DEFAULT_K', 20))
+SPOTS_QUERY_MAX_K = int(os.environ.get('SPOTS_QUERY_MAX_K', 1000))
+SPOTS_QUERY_MAX_RADIUS_M = float(os.environ.get('SPOTS_QUERY_MAX_RADIUS_M', 50000))
+# /api/spots pages: the largest limit= accepted, and how many spots a
+# streamed full listing encodes at a time
+SPOTS_PAGE_MAX_LIMIT = int(os.environ.get('SPOTS_PAGE_MAX_LIMIT', 500))
+SPOTS_STREAM_CHUNK = int(os.environ.get('SPOTS_STREAM_CHUNK', 500))
+# Spot fields a fields= projection may name
+SPOT_RESPONSE_FIELDS = frozenset(Spot.model_fields) | {'distance_m'}
+
+# Background plan jobs (/api/plan_jobs); PLAN_JOB_BACKEND picks auto, redis, memory or inline
+job_queue = create_job_queue()
+
+# Load every city's data at startup instead of on its first request (with
+# gunicorn --preload the workers then share it)
+if os.environ.get('SPOT_STORE_PRELOAD', 'False').lower() == 'true':
+    logger.info(f"Preloaded {spot_store.preload()} spots")
+
 # Request logging middleware
 @app.before_request
 def before_request():
@@ -103,17 +174,206 @@ def error_response(reason, status_code=400, message="Error"):
         "reason": reason
     }), status_code
 
-@log_performance(logger, threshold_ms=5000)
-def compare_transport_modes(city: str, spots: List[Spot], cfg: ScoreConfig, days: int = 3, weights: dict = None, session_id: str = None, transport_modes: List[str] = None) -> Dict:
+def _emit_planning_progress(session_id: Optional[str], payload: dict) -> None:
     """
-    Calculate itineraries for all transport modes and return comparison data.
-    Returns structured data with all modes and recommendation.
-    
-    Args:
-        session_id: Optional session ID for sending progress updates via WebSocket
-        transport_modes: Optional list of transport mode strings (e.g., ['walk', 'transit', 'taxi'])
+    Send a planning_progress event to the session room. Inside a plan job the
+    event carries the job id and is also recorded as the job's progress.
+    """
+    job = current_job()
+    if job is not None:
+        payload = dict(payload, job_id=job.id)
+        job.report(payload)
+    if session_id:
+        socketio.emit('planning_progress', payload, room=session_id)
+
+
+def _improvement_emitter(session_id: Optional[str], distances: Optional[DistanceMatrix]):
+    """
+    Callback sending each improved intermediate itinerary of a mode to the
+    session room as a planning_improvement event, or None when nobody
+    listens or streaming is disabled.
+    """
+    if not session_id or PLANNER_IMPROVEMENT_INTERVAL_MS <= 0:
+        return None
+    job = current_job()
+
+    def emit(mode: TransportMode, itinerary, score: float) -> None:
+        matrix = distances.for_mode(mode) if distances is not None else None
+        payload = {
+            'mode': mode.value,
+            'score': round(score, 2),
+            'itinerary': _build_mode_result(itinerary, score, [], mode, matrix)['itinerary'],
+        }
+        if job is not None:
+            payload['job_id'] = job.id
+        socketio.emit('planning_improvement', payload, room=session_id)
+
+    return emit
+
+
+def _plan_single_mode(city: str, spots: List[Spot], cfg: ScoreConfig, days: int, mode: TransportMode,
+                      distances: Optional[DistanceMatrix] = None, on_improvement=None, trace=NULL_TRACE,
+                      selection: Optional[CandidateSelection] = None):
+    """
+    Run the planner for one mode in this process (multi-start if configured).
+    `on_improvement(mode, itinerary, score)` gets intermediate results of
+    single-start runs.
+    """
+    if PLANNER_STARTS > 1:
+        return plan_itinerary_multistart(
+            city=city,
+            spots=spots,
+            days=days,
+            cfg=cfg,
+            mode=mode,
+            starts=PLANNER_STARTS,
+            trials=200,
+            strategy=PLANNER_STRATEGY,
+            time_budget_ms=PLANNER_TIME_BUDGET_MS,
+            distances=distances,
+            trace=trace,
+            selection=selection,
+        )
+    return plan_itinerary_soft_constraints(
+        city=city,
+        spots=spots,
+        days=days,
+        cfg=cfg,
+        mode=mode,
+        trials=200,
+        strategy=PLANNER_STRATEGY,
+        time_budget_ms=PLANNER_TIME_BUDGET_MS,
+        distances=distances,
+        on_improvement=(lambda itinerary, score: on_improvement(mode, itinerary, score)) if on_improvement else None,
+        improvement_interval_ms=PLANNER_IMPROVEMENT_INTERVAL_MS,
+        trace=trace,
+        selection=selection,
+    )
+
+
+def _plan_modes_serially(city, spots, cfg, days, modes, session_id=None, distances=None, trace=NULL_TRACE,
+                         selection=None) -> Dict:
+    """Plan modes one after another; returns mode -> result tuple or exception."""
+    outcomes = {}
+    total_modes = len(modes)
+    on_improvement = _improvement_emitter(session_id, distances)
+    for idx, mode in enumerate(modes):
+        # Send progress update
+        _emit_planning_progress(session_id, {
+            'progress': int((idx / total_modes) * 100),
+            'stage': f'正在计算 {mode.value.upper()} 模式...',
+            'current_mode': mode.value,
+            'total_modes': total_modes,
+            'completed_modes': idx
+        })
+
+        try:
+            outcomes[mode] = _plan_single_mode(city, spots, cfg, days, mode, distances, on_improvement,
+                                               trace.child(mode.value), selection)
+        except Exception as e:
+            outcomes[mode] = e
+    return outcomes
+
+
+def _plan_modes_in_parallel(city, spots, cfg, days, modes, session_id=None, distances=None, trace=NULL_TRACE,
+                            selection=None) -> Dict:
+    """
+    Plan all modes at once on the planning process pool; progress events are
+    sent as each mode finishes. Falls back to the serial path if the pool
+    is unavailable.
     """
-    # Use user-selected modes if provided, otherwise default to all modes
+    total_modes = len(modes)
+    completed = []
+
+    _emit_planning_progress(session_id, {
+        'progress': 0,
+        'stage': f'正在并行计算 {total_modes} 种出行模式...',
+        'current_mode': None,
+        'total_modes': total_modes,
+        'completed_modes': 0
+    })
+
+    def on_mode_done(mode, outcome):
+        completed.append(mode)
+        _emit_planning_progress(session_id, {
+            'progress': int((len(completed) / total_modes) * 100),
+            'stage': f'{mode.value.upper()} 模式计算完成',
+            'current_mode': mode.value,
+            'total_modes': total_modes,
+            'completed_modes': len(completed)
+        })
+
+    try:
+        return plan_modes_concurrently(
+            city, spots, days, cfg, modes,
+            starts=PLANNER_STARTS,
+            trials=200,
+            strategy=PLANNER_STRATEGY,
+            time_budget_ms=PLANNER_TIME_BUDGET_MS,
+            on_mode_done=on_mode_done,
+            distances=distances,
+            on_improvement=_improvement_emitter(session_id, distances),
+            improvement_interval_ms=PLANNER_IMPROVEMENT_INTERVAL_MS,
+            trace=trace,
+            selection=selection,
+        )
+    except (BrokenProcessPool, OSError, NotImplementedError) as e:
+        logger.warning(f"Parallel planning unavailable, planning modes serially: {e}")
+        return _plan_modes_serially(city, spots, cfg, days, modes, session_id, distances, trace, selection)
+
+
+def _build_mode_result(itinerary, score: float, reasons: List[str], mode: TransportMode,
+                       matrix: Optional[TravelMatrix] = None) -> Dict:
+    """Convert a planned itinerary into the per-mode payload of the comparison."""
+    # Convert itinerary to dict
+    itinerary_dict = []
+    for day in itinerary.days:
+        # compute total travel minutes for the day
+        if matrix is not None:
+            travel_minutes = matrix.path_minutes(matrix.indices_of(day.spots))
+        else:
+            travel_minutes = 0.0
+            for i in range(len(day.spots) - 1):
+                travel_minutes += travel_cost_minutes(day.spots[i], day.spots[i + 1], mode)
+
+        # ensure total distance exists (planner finalizes distances)
+        total_km = getattr(day, 'total_distance_km', None)
+
+        day_dict = {
+            "day": day.day,
+            "spots": spot_store.client_dicts(itinerary.city, day.spots),
+            "travel_minutes": round(travel_minutes, 1),
+            "total_distance_km": total_km,
+        }
+        itinerary_dict.append(day_dict)
+
+    mode_data = {
+        "score": round(score, 2),
+        "reasons": reasons,
+        "itinerary": itinerary_dict
+    }
+
+    # If there are no penalty reasons, add friendly summary benefits
+    if not mode_data.get('reasons'):
+        # summarize total distance and time across days
+        total_minutes = 0.0
+        total_km = 0.0
+        for d in itinerary_dict:
+            total_minutes += d.get('travel_minutes', 0) or 0
+            total_km += d.get('total_distance_km', 0) or 0
+
+        friendly_reasons = []
+        friendly_reasons.append(f"Estimated travel time: {round(total_minutes,1)} minutes")
+        friendly_reasons.append(f"Estimated travel distance: {round(total_km,2)} km")
+        friendly_reasons.append("Meets configured constraints; no penalties applied")
+        mode_data['reasons'] = friendly_reasons
+
+    return mode_data
+
+
+def _resolve_transport_modes(transport_modes: List[str] = None) -> List[TransportMode]:
+    """Use user-selected modes if provided, otherwise default to all modes."""
+    all_modes = [TransportMode.WALK, TransportMode.TRANSIT, TransportMode.TAXI]
     if transport_modes and isinstance(transport_modes, list) and len(transport_modes) > 0:
         mode_map = {
             'walk': TransportMode.WALK,
@@ -121,94 +381,94 @@ def compare_transport_modes(city: str, spots: List[Spot], cfg: ScoreConfig, days
             'taxi': TransportMode.TAXI
         }
         modes = [mode_map[mode] for mode in transport_modes if mode in mode_map]
-        if not modes:
-            # Fallback to all modes if invalid modes provided
-            modes = [TransportMode.WALK, TransportMode.TRANSIT, TransportMode.TAXI]
+        # Fallback to all modes if invalid modes provided
+        return modes or all_modes
+    return all_modes
+
+
+def _normalize_weights(weights: dict = None) -> tuple:
+    """Utility weights (time, distance, comfort) normalized to sum to 1."""
+    # weights: if provided, normalize; otherwise use defaults
+    if not weights:
+        w_time = 0.5
+        w_dist = 0.2
+        w_comf = 0.3
     else:
-        modes = [TransportMode.WALK, TransportMode.TRANSIT, TransportMode.TAXI]
+        try:
+            w_time = float(weights.get('time', 0.5))
+            w_dist = float(weights.get('distance', 0.2))
+            w_comf = float(weights.get('comfort', 0.3))
+        except Exception:
+            w_time, w_dist, w_comf = 0.5, 0.2, 0.3
+
+    # normalize to sum to 1
+    total_w = (w_time + w_dist + w_comf) or 1.0
+    return w_time / total_w, w_dist / total_w, w_comf / total_w
+
+
+@log_performance(logger, threshold_ms=5000)
+def compare_transport_modes(city: str, spots: List[Spot], cfg: ScoreConfig, days: int = 3, weights: dict = None, session_id: str = None, transport_modes: List[str] = None, trace=NULL_TRACE, selection: Optional[CandidateSelection] = None) -> Dict:
+    """
+    Calculate itineraries for all transport modes and return comparison data.
+    Returns structured data with all modes and recommendation.
+    
+    Args:
+        session_id: Optional session ID for sending progress updates via WebSocket
+        transport_modes: Optional list of transport mode strings (e.g., ['walk', 'transit', 'taxi'])
+        trace: Optional PlanTrace collecting phase timings, with one child per mode
+        selection: Optional CandidateSelection; `spots` are then candidates of which
+            only selection.visits are planned
+    """
+    modes = _resolve_transport_modes(transport_modes)
     
+    total_modes = len(modes)
+
+    # distances are computed once; every mode derives its travel times from them
+    with trace.phase('distances'):
+        distances = DistanceMatrix(spots)
+
+    with trace.phase('plan_modes'):
+        if PLANNER_PARALLEL_MODES and total_modes > 1:
+            outcomes = _plan_modes_in_parallel(city, spots, cfg, days, modes, session_id, distances, trace,
+                                               selection)
+        else:
+            outcomes = _plan_modes_serially(city, spots, cfg, days, modes, session_id, distances, trace,
+                                            selection)
+
+    with trace.phase('summarize'):
+        return _summarize_mode_outcomes(modes, outcomes, distances, weights)
+
+
+def _summarize_mode_outcomes(modes: List[TransportMode], outcomes: Dict, distances: DistanceMatrix,
+                             weights: dict = None) -> Dict:
+    """
+    Turn per-mode planning outcomes into the comparison payload: per-mode
+    results with utility scores, plus the recommended mode.
+    """
     results = {}
 
     best_mode = None
     best_score = float('inf')
     best_data = None
-    
-    total_modes = len(modes)
-
-    for idx, mode in enumerate(modes):
-        # Send progress update
-        if session_id:
-            socketio.emit('planning_progress', {
-                'progress': int((idx / total_modes) * 100),
-                'stage': f'正在计算 {mode.value.upper()} 模式...',
-                'current_mode': mode.value,
-                'total_modes': total_modes,
-                'completed_modes': idx
-            }, room=session_id)
-        
-        try:
-            itinerary, score, reasons = plan_itinerary_soft_constraints(
-                city=city,
-                spots=spots,
-                days=days,
-                cfg=cfg,
-                mode=mode,
-                trials=200,
-            )
 
-            # Convert itinerary to dict
-            itinerary_dict = []
-            for day in itinerary.days:
-                # compute total travel minutes for the day
-                travel_minutes = 0.0
-                for i in range(len(day.spots) - 1):
-                    travel_minutes += travel_cost_minutes(day.spots[i], day.spots[i + 1], mode)
-
-                # ensure total distance exists (planner finalizes distances)
-                total_km = getattr(day, 'total_distance_km', None)
-
-                day_dict = {
-                    "day": day.day,
-                    "spots": [spot.to_dict() for spot in day.spots],
-                    "travel_minutes": round(travel_minutes, 1),
-                    "total_distance_km": total_km,
-                }
-                itinerary_dict.append(day_dict)
-
-            mode_data = {
-                "score": round(score, 2),
-                "reasons": reasons,
-                "itinerary": itinerary_dict
+    for mode in modes:
+        outcome = outcomes[mode]
+        if isinstance(outcome, Exception):
+            app.logger.warning(f"Failed to plan itinerary for mode {mode.value}: {str(outcome)}")
+            results[mode.value] = {
+                "error": f"Failed to calculate: {str(outcome)}"
             }
+            continue
 
-            # If there are no penalty reasons, add friendly summary benefits
-            if not mode_data.get('reasons'):
-                # summarize total distance and time across days
-                total_minutes = 0.0
-                total_km = 0.0
-                for d in itinerary_dict:
-                    total_minutes += d.get('travel_minutes', 0) or 0
-                    total_km += d.get('total_distance_km', 0) or 0
-
-                friendly_reasons = []
-                friendly_reasons.append(f"Estimated travel time: {round(total_minutes,1)} minutes")
-                friendly_reasons.append(f"Estimated travel distance: {round(total_km,2)} km")
-                friendly_reasons.append("Meets configured constraints; no penalties applied")
-                mode_data['reasons'] = friendly_reasons
-
-            results[mode.value] = mode_data
-
-            # Track best mode (lowest score is better)
-            if score < best_score:
-                best_score = score
-                best_mode = mode
-                best_data = mode_data
+        itinerary, score, reasons = outcome
+        mode_data = _build_mode_result(itinerary, score, reasons, mode, distances.for_mode(mode))
+        results[mode.value] = mode_data
 
-        except Exception as e:
-            app.logger.warning(f"Failed to plan itinerary for mode {mode.value}: {str(e)}")
-            results[mode.value] = {
-                "error": f"Failed to calculate: {str(e)}"
-            }
+        # Track best mode (lowest score is better)
+        if score < best_score:
+            best_score = score
+            best_mode = mode
+            best_data = mode_data
 
     # Compute multi-dimensional utility (0-100) based on time, distance, comfort
     metrics = {}
@@ -276,24 +536,7 @@ def compare_transport_modes(city: str, spots: List[Spot], cfg: ScoreConfig, days
     dist_norm = normalize_list(dists, invert=True)
     rating_norm = normalize_list(ratings, invert=False)
 
-    # weights: if provided, normalize; otherwise use defaults
-    if not weights:
-        w_time = 0.5
-        w_dist = 0.2
-        w_comf = 0.3
-    else:
-        try:
-            w_time = float(weights.get('time', 0.5))
-            w_dist = float(weights.get('distance', 0.2))
-            w_comf = float(weights.get('comfort', 0.3))
-        except Exception:
-            w_time, w_dist, w_comf = 0.5, 0.2, 0.3
-
-    # normalize to sum to 1
-    total_w = (w_time + w_dist + w_comf) or 1.0
-    w_time /= total_w
-    w_dist /= total_w
-    w_comf /= total_w
+    w_time, w_dist, w_comf = _normalize_weights(weights)
 
     # attach utility_score to each mode
     for m_key, m_data in results.items():
@@ -484,49 +727,34 @@ def _convert_place_to_spot(place_details: Dict[str, Any], city: str) -> Optional
         # Add other fields as needed
     )
 
-def _load_spots_for_city(city: str) -> List[Spot]:
-    """ 
-    Loads spots for a given city, prioritizing Google Places API and falling back to static JSON files.
+def _load_city_spots(city: str) -> Tuple[List[Spot], str]:
+    """
+    Loads spots for a given city, prioritizing Google Places API and falling back to the
+    bundled data in the spot store. Returns the spots and the data version fingerprint.
     """
-    spots: List[Spot] = []
     # First, try to fetch from Places API (live data)
     try:
         spots = _fetch_spots_from_places_api(city)
         if spots:
             logger.info(f"Loaded {len(spots)} spots for {city} from Google Places API.")
-            return spots
+            return spots, data_version_for_spots([s.model_dump() for s in spots])
     except Exception as e:
         logger.warning(f"Failed to load spots from Google Places API for {city}: {e}")
 
-    # Fallback to static JSON if Places API fails or returns no spots
+    # Fallback to the bundled data if Places API fails or returns no spots;
+    # the store parsed it once and knows its version already
     logger.warning(f"Places API did not return spots for {city}. Attempting fallback to static JSON.")
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    path = os.path.join(base_dir, f"data/spots_{city.lower().replace(' ', '')}.json")
-    
-    if os.path.exists(path):
-        try:
-            with open(path, encoding="utf-8") as f:
-                raw_static_spots = json.load(f)
-            logger.warning(f"Loaded {len(raw_static_spots)} spots from static JSON for {city}")
-
-            # Re-apply defaults as in the original load_spots
-            default_durations = {
-                'outdoor': 60, 'indoor': 90, 'temple': 45,
-                'shopping': 60, 'museum': 90, 'food': 60, 'sightseeing': 90
-            }
-            for s_data in raw_static_spots:
-                spot_data = {k: v for k, v in s_data.items() if k in Spot.__annotations__}
-                spot = Spot(**spot_data)
-                if getattr(spot, 'duration_minutes', None) is None:
-                    spot.duration_minutes = default_durations.get(spot.category, 60)
-                spots.append(spot)
-        except Exception as e:
-            logger.error(f"Error loading static spots from {path}: {e}")
-            spots = [] # ensure spots is empty on error
-    else:
-        logger.warning(f"No static JSON file found for {city} at {path}")
-    
-    return spots
+    city_data = spot_store.get(city)
+    if city_data is None:
+        logger.warning(f"No static spot data found for {city} at {spot_store.path_for(city)}")
+        return [], ''
+    logger.info(f"Using {len(city_data)} static spots for {city}")
+    return list(city_data.spots), city_data.data_version
+
+
+def _load_spots_for_city(city: str) -> List[Spot]:
+    """Loads spots for a given city (see _load_city_spots)."""
+    return _load_city_spots(city)[0]
 
 
 def _fetch_spots_from_places_api(city: str, query: str = "points of interest") -> List[Spot]:
@@ -574,6 +802,200 @@ def _fetch_spots_from_places_api(city: str, query: str = "points of interest") -
     return spots_list
 
 
+def _parse_floats(value: str, count: int, name: str) -> List[float]:
+    parts = value.split(',')
+    try:
+        numbers = [float(p) for p in parts]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(x) for x in numbers):
+        raise ValueError(f"{name} must be {count} comma separated numbers")
+    return numbers
+
+
+def _parse_spatial_query(args) -> Optional[Dict[str, Any]]:
+    """
+    The spatial part of an /api/spots query, or None for a plain listing:
+    near=lat,lon with radius= (meters) and/or k=, or bbox=west,south,east,north
+    with an optional k=. Raises ValueError for invalid parameters.
+    """
+    near, bbox, radius, k = (args.get(name) for name in ('near', 'bbox', 'radius', 'k'))
+    if near is None and bbox is None:
+        if radius is not None or k is not None:
+            raise ValueError("radius and k need near or bbox")
+        return None
+    if near is not None and bbox is not None:
+        raise ValueError("near and bbox cannot be combined")
+
+    query: Dict[str, Any] = {'k': None}
+    if k is not None:
+        if not k.isdigit() or not 1 <= int(k) <= SPOTS_QUERY_MAX_K:
+            raise ValueError(f"k must be an integer from 1 to {SPOTS_QUERY_MAX_K}")
+        query['k'] = int(k)
+
+    if near is not None:
+        lat, lon = _parse_floats(near, 2, 'near')
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("near is not a valid lat,lon")
+        query['near'] = (lat, lon)
+        query['radius_m'] = None
+        if radius is not None:
+            query['radius_m'] = _parse_floats(radius, 1, 'radius')[0]
+            if not 0 <= query['radius_m'] <= SPOTS_QUERY_MAX_RADIUS_M:
+                raise ValueError(f"radius must be from 0 to {SPOTS_QUERY_MAX_RADIUS_M:g} meters")
+        elif query['k'] is None:
+            query['k'] = SPOTS_NEAR_DEFAULT_K
+    else:
+        if radius is not None:
+            raise ValueError("radius needs near")
+        west, south, east, north = _parse_floats(bbox, 4, 'bbox')
+        if south > north or west > east:
+            raise ValueError("bbox must be west,south,east,north")
+        query['bbox'] = (south, west, north, east)
+    return query
+
+
+def _query_spots(city: str, query: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Spot dicts matching a spatial query (see _parse_spatial_query), or None
+    when the city has no data. `near` results are nearest first with their
+    `distance_m`; bbox results are the most popular first. Bundled cities
+    are answered from the spot store's index; other cities index the
+    loaded spots for this request.
+    """
+    city_data = spot_store.get(city)
+    if city_data is not None:
+        spots, index = city_data.spots, city_data.index
+    else:
+        spots = _load_spots_for_city(city)
+        if not spots:
+            return None
+        index = GridIndex([s.lat for s in spots], [s.lon for s in spots])
+
+    limit = min(query['k'] or SPOTS_QUERY_MAX_K, SPOTS_QUERY_MAX_K)
+    if 'near' in query:
+        lat, lon = query['near']
+        if query['radius_m'] is None:
+            rows, km = index.nearest(lat, lon, limit)
+        else:
+            rows, km = index.within(lat, lon, query['radius_m'] / 1000)
+            rows, km = rows[:limit], km[:limit]
+        matches = [spots[i] for i in rows.tolist()]
+        dicts = spot_store.client_dicts(city, matches)
+        for data, d in zip(dicts, km.tolist()):
+            data['distance_m'] = round(d * 1000, 1)
+        return dicts
+
+    matches = [spots[i] for i in index.in_bbox(*query['bbox']).tolist()]
+    matches.sort(key=_calculate_popularity_score, reverse=True)
+    return spot_store.client_dicts(city, matches[:limit])
+
+
+class _SpotDicts:
+    """
+    Spot.to_dict()s of a list of spots, converted only for the slices
+    that are asked for (with the details the spot store keeps aside).
+    """
+
+    def __init__(self, city: str, spots: List[Spot]):
+        self.city = city
+        self.spots = spots
+
+    def __len__(self) -> int:
+        return len(self.spots)
+
+    def __getitem__(self, rows: slice) -> List[Dict[str, Any]]:
+        return spot_store.client_dicts(self.city, self.spots[rows])
+
+
+# city -> (data version, spots most popular first) of the last listing
+_popular_spots: Dict[str, Tuple[str, List[Spot]]] = {}
+
+
+def _spots_by_popularity(city: str) -> List[Spot]:
+    """The city's spots, most popular first; sorted once per data version."""
+    spots, data_version = _load_city_spots(city)
+    if not spots:
+        return []
+    ranked = _popular_spots.get(city.lower())
+    if ranked is None or ranked[0] != data_version:
+        spots.sort(key=_calculate_popularity_score, reverse=True)
+        ranked = _popular_spots[city.lower()] = (data_version, spots)
+    return ranked[1]
+
+
+def _parse_spot_page(args) -> Dict[str, Any]:
+    """
+    offset= (default 0), limit= (default: every spot) and fields= (comma
+    separated spot fields to return) of an /api/spots query. Raises
+    ValueError for invalid parameters.
+    """
+    offset, limit, fields = args.get('offset', '0'), args.get('limit'), args.get('fields')
+    if not offset.isdigit():
+        raise ValueError("offset must be a non-negative integer")
+    page: Dict[str, Any] = {'offset': int(offset), 'limit': None, 'fields': None}
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= SPOTS_PAGE_MAX_LIMIT:
+            raise ValueError(f"limit must be an integer from 1 to {SPOTS_PAGE_MAX_LIMIT}")
+        page['limit'] = int(limit)
+    if fields is not None:
+        names = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in names if f not in SPOT_RESPONSE_FIELDS]
+        if not names or unknown:
+            raise ValueError(f"fields must name spot fields, unknown: {', '.join(unknown) or '(none given)'}")
+        page['fields'] = names
+    return page
+
+
+def _project_spots(dicts: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if fields is None:
+        return dicts
+    return [{f: d[f] for f in fields if f in d} for d in dicts]
+
+
+def _page_envelope(city: str, spots, page: Dict[str, Any]) -> Tuple[Dict[str, Any], int, int]:
+    """The response data of a page of `spots` apart from the spots, and the page's rows."""
+    start = min(page['offset'], len(spots))
+    end = len(spots) if page['limit'] is None else min(start + page['limit'], len(spots))
+    return {
+        "city": city,
+        "total": len(spots),
+        "offset": start,
+        "next_offset": end if end < len(spots) else None,
+    }, start, end
+
+
+def _spot_page(city: str, spots, page: Dict[str, Any]) -> Dict[str, Any]:
+    """The response data of one page of `spots` (spot dicts or _SpotDicts)."""
+    data, start, end = _page_envelope(city, spots, page)
+    data["spots"] = _project_spots(spots[start:end], page['fields'])
+    return data
+
+
+def _stream_spot_listing(city: str, spots, page: Dict[str, Any], message: str) -> Response:
+    """
+    success_response() of the spots from page['offset'] on, with the same
+    data as _spot_page(), encoded and sent SPOTS_STREAM_CHUNK spots at a
+    time, so that neither the JSON body nor, for _SpotDicts, every spot
+    dict exists at once.
+    """
+    envelope, first, end = _page_envelope(city, spots, page)
+
+    def generate():
+        fields = ''.join(
+            f'{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}, ' for key, value in envelope.items()
+        )
+        yield ('{"status": "success", "message": ' + json.dumps(message, ensure_ascii=False)
+               + ', "data": {' + fields + '"spots": [')
+        for start in range(first, end, SPOTS_STREAM_CHUNK):
+            chunk = _project_spots(spots[start:min(start + SPOTS_STREAM_CHUNK, end)], page['fields'])
+            text = json.dumps(chunk, ensure_ascii=False)[1:-1]
+            yield text if start == first else ', ' + text
+        yield ']}}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
 @app.route('/api/spots/<city>', methods=['GET'])
 @rate_limit(limit=30, window=60)  # 30 requests per minute
 def get_spots(city):
@@ -581,77 +1003,72 @@ def get_spots(city):
     API endpoint to get all available spots for a city.
     Used for populating the spot selection UI.
     Uses Redis cache to improve performance.
+
+    Spatial queries (map viewports, "what's near here") return only the
+    matching spots and are not cached:
+        ?near=lat,lon&radius=<meters>&k=<n>   nearest first, with distance_m
+        ?bbox=west,south,east,north&k=<n>     most popular first
+
+    Any response can be paged with ?offset=<n>&limit=<n> and cut down with
+    ?fields=name,lat,lon. The data always carries total, offset and
+    next_offset (None on the last page). A listing without a limit is
+    streamed.
     """
     try:
+        try:
+            query = _parse_spatial_query(request.args)
+            page = _parse_spot_page(request.args)
+        except ValueError as e:
+            return error_response(str(e), 400, "Invalid spot query")
+        if query is not None:
+            dicts = _query_spots(city, query)
+            if dicts is None:
+                return error_response(f"No spot data found for city: {city}", 404, "City not found")
+            data = _spot_page(city, dicts, page)
+            return success_response(data, f"Found {len(data['spots'])} of {len(dicts)} spots for {city}")
+
         # Try to get from cache first
         cache_key = cache_key_for_spots(city)
         from agent.cache import get, set
         cached_spots = get(cache_key)
-        
+
         if cached_spots is not None:
             logger.debug(f"Spots for {city} loaded from cache, count={cached_spots.get('total', 0)}")
-            
-            # Convert cached dicts back to Spot objects
-            rehydrated_spots = [Spot(**s) for s in cached_spots['spots']]
-            return success_response({"city": city, "spots": [s.to_dict() for s in rehydrated_spots], "total": len(rehydrated_spots)}, f"Loaded {len(rehydrated_spots)} spots for {city} (cached)")
-        
-        # Load spots for the city using the consolidated function
-        spots = _load_spots_for_city(city)
+            # the stored dicts are served as they are
+            spots = cached_spots['spots']
+            source = " (cached)"
+        else:
+            ranked = _spots_by_popularity(city)
+            if not ranked:
+                return error_response(f"No spot data found for city: {city}", 404, "City not found")
+            spots = _SpotDicts(city, ranked)
+            source = ""
+            if cache.enabled:
+                # Cache the result for 12 hours
+                spots = spots[:]
+                set(cache_key, {"city": city, "spots": spots, "total": len(spots)}, ttl=43200)
+
+        if page['limit'] is None:
+            return _stream_spot_listing(city, spots, page, f"Loaded {len(spots)} spots for {city}{source}")
+        data = _spot_page(city, spots, page)
+        return success_response(data, f"Loaded {len(data['spots'])} of {len(spots)} spots for {city}{source}")
 
-        if not spots:
-            return error_response(f"No spot data found for city: {city}", 404, "City not found")
-        
-        # Calculate popularity score and sort
-        spots.sort(key=_calculate_popularity_score, reverse=True)
-        
-        result = {
-            "city": city,
-            "spots": [s.to_dict() for s in spots], # Convert to dicts for JSON serialization
-            "total": len(spots)
-        }
-        
-        # Cache the result for 12 hours
-        set(cache_key, result, ttl=43200)
-        
-        return success_response(result, f"Loaded {len(spots)} spots for {city}")
-    
     except Exception as e:
         logger.error(f"Error in get_spots for city {city}: {traceback.format_exc()}")
         return error_response(str(e), 500, "Failed to load spots from Google Places API")
 
-@app.route('/plan_itinerary', methods=['POST'])
-@rate_limit(limit=5, window=60)  # 5 requests per minute (expensive operation)
-def plan_itinerary():
-    """This function plans an itinerary"""
-    # Get request data
-    data = request.json
-    if not data:
-        return error_response("Request body must be JSON", 400, "Invalid request")
-
-    city = data.get('city')
-    start_date = data.get('start_date')
-    session_id = data.get('session_id')  # Get session ID from request
-    
-    logger.info(f"Planning itinerary for {city}, start_date={start_date}, days={data.get('days', 3)}")
-
-    # Test required parameters; return errors if missing
-    if not city:
-        return error_response("Missing required parameter: 'city'", 400, "Validation error")
-    if not start_date:
-        return error_response("Missing required parameter: 'start_date'", 400, "Validation error")
-
-    # Load spots for the city using the consolidated function
-    spots = _load_spots_for_city(city)
-
-    if not spots:
-        return error_response(f"No spot data found for city: {city}", 404, "City not found")
-    
-    # Store total available spots before filtering
+def _select_plan_spots(city: str, spots: List[Spot], selected_spots,
+                       days: int) -> Tuple[List[Spot], Optional[CandidateSelection]]:
+    """
+    Spots to plan with: the user's selection when it is a proper subset,
+    every spot of a city with at most PLANNER_ALL_SPOTS_MAX of them (or
+    no more than fit into the trip), otherwise candidates from the whole
+    city, of which the planner picks PLANNER_SPOTS_PER_DAY visits a day
+    (returned as the CandidateSelection). Empty when none of the selected
+    spots exist.
+    """
     total_available_spots = len(spots)
 
-    # Filter spots if user selected specific ones
-    selected_spots = data.get('selected_spots')
-
     # Check for 'all selected' or 'subset selected'
     is_subset_selected = False
     if selected_spots and isinstance(selected_spots, list):
@@ -661,31 +1078,52 @@ def plan_itinerary():
     if is_subset_selected:
         # Case: A subset of spots is selected. Filter the spots list.
         selected_names = set(selected_spots)
-        spots = [s for s in spots if s.name in selected_names]
-        
-        if not spots:
-            return error_response(
-                "None of the selected spots were found in the city data", 
-                400, 
-                "Validation error"
-            )
+        return [s for s in spots if s.name in selected_names], None
     
     # If is_subset_selected is False, it means either:
     # 1. selected_spots is falsy (None/empty list) -> "No spots selected"
     # 2. len(selected_spots) == total_available_spots -> "All spots selected"
-    # In both these cases, we apply intelligent filtering if the dataset is large (total_available_spots > 20).
-    is_all_or_none_selected = not is_subset_selected
+    # In both cases small cities are planned whole, and otherwise the
+    # planner chooses which spots to visit when there are more than fit
+    # into the trip.
+    visits = days * PLANNER_SPOTS_PER_DAY
+    if visits <= 0 or total_available_spots <= max(visits, PLANNER_ALL_SPOTS_MAX):
+        return spots, None
+
+    candidates = spots
+    if 0 < PLANNER_CANDIDATE_LIMIT < total_available_spots:
+        candidates = sorted(spots, key=_calculate_popularity_score, reverse=True)[:PLANNER_CANDIDATE_LIMIT]
+    prizes = [_calculate_popularity_score(s) for s in candidates]
+
+    # popular spots and popular neighbourhoods; the search picks from these
+    pool = narrow_candidates(candidates, prizes, visits)
+    logger.info(
+        f"Planning {visits} visits from {len(pool)} candidates "
+        f"({len(candidates)} of {total_available_spots} spots considered) for {city}"
+    )
+    return [candidates[i] for i in pool], CandidateSelection(visits, [prizes[i] for i in pool])
 
-    if is_all_or_none_selected and total_available_spots > 20:
-        # No spots or all spots selected - intelligent filtering for large datasets
-        # If there are too many spots, the itinerary planner might timeout or struggle.
-        # We select top 20 most popular spots based on rating and category weights
-        spots.sort(key=_calculate_popularity_score, reverse=True)
-        spots = spots[:20]
-        logger.info(f"Auto-selected top 20 most popular spots from {total_available_spots} available for {city}")
-    
-    # 配置评分标准
-    cfg = ScoreConfig(
+
+def _parse_plan_days(days_param) -> int:
+    days_int = int(days_param)
+    if days_int < 1 or days_int > 14:
+        raise ValueError('days must be between 1 and 14')
+    return days_int
+
+
+def _plan_cache_key(city: str, days: int, spots: List[Spot], transport_modes, weights, data_version: str,
+                    selection: Optional[CandidateSelection] = None) -> str:
+    return cache_key_for_plan(
+        city, days, [s.name for s in spots],
+        modes=[m.value for m in _resolve_transport_modes(transport_modes)],
+        weights=_normalize_weights(weights),
+        data_version=data_version,
+        visits=selection.visits if selection is not None else None,
+    )
+
+
+def _default_score_config() -> ScoreConfig:
+    return ScoreConfig(
         max_daily_minutes={
             TransportMode.WALK: 240,
             TransportMode.TRANSIT: 300,
@@ -696,51 +1134,30 @@ def plan_itinerary():
         min_spots_per_day=2,
     )
 
-    # 计算所有模式的比较数据；支持用户选择天数
-    days_param = data.get('days', 3)
-    try:
-        days_int = int(days_param)
-        if days_int < 1 or days_int > 14:
-            raise ValueError('days must be between 1 and 14')
-    except Exception as e:
-        return error_response(str(e), 400, 'Invalid days value')
 
-    # Send initial progress
-    if session_id:
-        socketio.emit('planning_progress', {
-            'progress': 5,
-            'stage': 'Start Planning Itinerary...', 
-            'message': f'正在为 {city} 加载景点数据'
-        }, room=session_id)
+class PlanRequestError(Exception):
+    """A planning request that cannot be served, with its HTTP error details."""
 
-    # read optional utility weights and transport modes
-    weights = data.get('weights', None)
-    transport_modes = data.get('transport_modes', None)  # Get user-selected transport modes
-    
-    try:
-        comparison_data = compare_transport_modes(
-            city, spots, cfg, 
-            days=days_int, 
-            weights=weights,
-            session_id=session_id,
-            transport_modes=transport_modes
-        )
-    except Exception as e:
-        return error_response(
-            f"Failed to compare transport modes: {str(e)}",
-            500,
-            "Planning error"
-        )
-    
-    # Send progress for weather calculation
-    if session_id:
-        socketio.emit('planning_progress', {
-            'progress': 90,
-            'stage': '获取天气信息...', 
-            'message': '正在为您准备最终建议'
-        }, room=session_id)
+    def __init__(self, reason: str, status_code: int = 400, message: str = "Error"):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.message = message
 
-    # 计算推荐模式的天气建议
+
+def _validate_plan_request(data) -> None:
+    """Cheap checks done before any planning work is accepted."""
+    if not data:
+        raise PlanRequestError("Request body must be JSON", 400, "Invalid request")
+    # Test required parameters; return errors if missing
+    if not data.get('city'):
+        raise PlanRequestError("Missing required parameter: 'city'", 400, "Validation error")
+    if not data.get('start_date'):
+        raise PlanRequestError("Missing required parameter: 'start_date'", 400, "Validation error")
+
+
+def _recommended_weather_advice(city: str, start_date, comparison_data: dict) -> Optional[str]:
+    """Weather advice for the recommended itinerary, or None if unavailable."""
     weather_msg = None
     if comparison_data['recommended_mode'] and comparison_data['recommended_data']:
         # We wrap the date parsing and itinerary reconstruction, plus the weather advice call, in a try-except block
@@ -768,7 +1185,7 @@ def plan_itinerary():
             weather_msg = weather_advice(recommended_itinerary, start_date_obj)
         except ValueError as e:
             # If date format is invalid, return an error here and exit
-            return error_response(
+            raise PlanRequestError(
                 f"Invalid date format: {str(e)}. Expected YYYY-MM-DD",
                 400,
                 "Date parsing error"
@@ -778,21 +1195,311 @@ def plan_itinerary():
             weather_msg = None
             app.logger.warning(f"Weather advice generation failed: {str(e)}")
 
+    return weather_msg
+
+
+def _plan_request(data: dict) -> dict:
+    """
+    Plan one /plan_itinerary request body and return the response data
+    (transport mode comparison plus weather advice). Raises
+    PlanRequestError for requests that cannot be planned.
+
+    With PLANNER_DEBUG or "debug": true in the body the request is traced;
+    the trace is logged and returned as `debug`.
+    """
+    if not (PLANNER_DEBUG or (isinstance(data, dict) and data.get('debug') is True)):
+        return _plan_traced_request(data, NULL_TRACE)
+
+    trace = PlanTrace()
+    with trace.phase('total'):
+        result = _plan_traced_request(data, trace)
+    trace_data = trace.to_dict()
+    log_plan_trace(logger, trace_data, {'city': data.get('city')})
+    result['debug'] = trace_data
+    return result
+
+
+def _plan_traced_request(data: dict, trace) -> dict:
+    _validate_plan_request(data)
+
+    city = data.get('city')
+    start_date = data.get('start_date')
+    session_id = data.get('session_id')  # Get session ID from request
+    
+    logger.info(f"Planning itinerary for {city}, start_date={start_date}, days={data.get('days', 3)}")
+
+    # Load spots for the city using the consolidated function
+    # data_version fingerprints the city data; refreshed data invalidates cached plans
+    with trace.phase('load_spots'):
+        spots, data_version = _load_city_spots(city)
+
+    if not spots:
+        raise PlanRequestError(f"No spot data found for city: {city}", 404, "City not found")
+
+    # 计算所有模式的比较数据；支持用户选择天数
+    try:
+        days_int = _parse_plan_days(data.get('days', 3))
+    except Exception as e:
+        raise PlanRequestError(str(e), 400, 'Invalid days value')
+
+    # Filter spots if user selected specific ones
+    with trace.phase('select_spots'):
+        spots, selection = _select_plan_spots(city, spots, data.get('selected_spots'), days_int)
+    if not spots:
+        raise PlanRequestError(
+            "None of the selected spots were found in the city data", 
+            400, 
+            "Validation error"
+        )
+    
+    # 配置评分标准
+    cfg = _default_score_config()
+
+    # Send initial progress
+    _emit_planning_progress(session_id, {
+        'progress': 5,
+        'stage': 'Start Planning Itinerary...', 
+        'message': f'正在为 {city} 加载景点数据'
+    })
+
+    # read optional utility weights and transport modes
+    weights = data.get('weights', None)
+    transport_modes = data.get('transport_modes', None)  # Get user-selected transport modes
+    
+    plan_key = _plan_cache_key(city, days_int, spots, transport_modes, weights, data_version, selection)
+    # a traced request plans for real; a cached plan would have nothing to show
+    comparison_data = None
+    if not trace.enabled:
+        comparison_data = plan_cache.get(plan_key)
+
+    if comparison_data is not None:
+        logger.info(f"Plan cache hit for {city} ({days_int} days)")
+    else:
+        try:
+            comparison_data = compare_transport_modes(
+                city, spots, cfg, 
+                days=days_int, 
+                weights=weights,
+                session_id=session_id,
+                transport_modes=transport_modes,
+                trace=trace.child('compare'),
+                selection=selection,
+            )
+        except Exception as e:
+            raise PlanRequestError(
+                f"Failed to compare transport modes: {str(e)}",
+                500,
+                "Planning error"
+            )
+        # don't pin transient per-mode failures for the whole TTL
+        if not any(m.get('error') for m in comparison_data['modes'].values()):
+            with trace.phase('cache_store'):
+                plan_cache.set(plan_key, comparison_data, ttl=PLAN_CACHE_TTL)
+    
+    # Send progress for weather calculation
+    _emit_planning_progress(session_id, {
+        'progress': 90,
+        'stage': '获取天气信息...', 
+        'message': '正在为您准备最终建议'
+    })
+
+    # 计算推荐模式的天气建议
+    with trace.phase('weather'):
+        weather_msg = _recommended_weather_advice(city, start_date, comparison_data)
+
     # Send completion progress (this is outside the inner try-except, but within the main try-block)
-    if session_id:
-        socketio.emit('planning_progress', {
-            'progress': 100,
-            'stage': '完成！', 
-            'message': '行程规划已生成'
-        }, room=session_id)
+    _emit_planning_progress(session_id, {
+        'progress': 100,
+        'stage': '完成！', 
+        'message': '行程规划已生成'
+    })
 
     # 返回比较结果 (this is outside the inner try-except, but within the main try-block)
-    response_data = {
+    return {
         'comparison': comparison_data,
         'weather_advice': weather_msg,
     }
 
+
+@app.route('/plan_itinerary', methods=['POST'])
+@rate_limit(limit=5, window=60)  # 5 requests per minute (expensive operation)
+def plan_itinerary():
+    """This function plans an itinerary"""
+    try:
+        response_data = _plan_request(request.json)
+    except PlanRequestError as e:
+        return error_response(e.reason, e.status_code, e.message)
+
     return success_response(response_data, "Transport modes compared successfully")
+
+
+def _run_plan_job(data: dict) -> dict:
+    try:
+        return _plan_request(data)
+    except PlanRequestError as e:
+        raise JobFailed(e.reason, e.status_code, e.message)
+
+
+register_handler('plan', _run_plan_job)
+
+
+@app.route('/api/plan_jobs', methods=['POST'])
+@rate_limit(limit=10, window=60)
+def submit_plan_job():
+    """
+    Queue a /plan_itinerary request body for background planning and return
+    its job id straight away (202). Poll /api/plan_jobs/<job_id> for status
+    and progress, then fetch /api/plan_jobs/<job_id>/result. planning_progress
+    events for the request's session_id carry the job_id.
+    """
+    data = request.json
+    try:
+        _validate_plan_request(data)
+        job_id = job_queue.submit('plan', data)
+    except PlanRequestError as e:
+        return error_response(e.reason, e.status_code, e.message)
+    except JobQueueFull as e:
+        return error_response(str(e), 503, "Planner busy")
+
+    return jsonify({
+        "status": "success",
+        "message": "Planning job queued",
+        "data": {
+            "job_id": job_id,
+            "status_url": f"/api/plan_jobs/{job_id}",
+            "result_url": f"/api/plan_jobs/{job_id}/result",
+        }
+    }), 202
+
+
+def _job_summary(job: dict) -> dict:
+    return {k: job.get(k) for k in ('id', 'status', 'progress', 'error', 'created_at', 'updated_at')}
+
+
+@app.route('/api/plan_jobs/<job_id>', methods=['GET'])
+def get_plan_job(job_id):
+    """Status and latest progress of a planning job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return error_response(f"No planning job {job_id}", 404, "Job not found")
+    return success_response(_job_summary(job), f"Job {job['status']}")
+
+
+@app.route('/api/plan_jobs/<job_id>/result', methods=['GET'])
+def get_plan_job_result(job_id):
+    """
+    Result of a finished planning job, in the same shape as /plan_itinerary.
+    Answers 202 with the job status while it is still queued or running.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return error_response(f"No planning job {job_id}", 404, "Job not found")
+    if job['status'] == JobStatus.DONE.value:
+        return success_response(job['result'], "Transport modes compared successfully")
+    if job['status'] == JobStatus.FAILED.value:
+        error = job.get('error') or {}
+        return error_response(error.get('reason', 'Planning failed'), error.get('code', 500), error.get('message', 'Planning error'))
+    return jsonify({
+        "status": "pending",
+        "message": f"Job {job['status']}",
+        "data": _job_summary(job),
+    }), 202
+
+
+@app.route('/api/plan_batch', methods=['POST'])
+@rate_limit(limit=2, window=60)  # one call can carry up to PLAN_BATCH_MAX_SPECS plans
+def plan_batch_route():
+    """
+    Plan many itineraries in one call.
+
+    Body: {"plans": [{"city", "days", "selected_spots", "transport_modes", "weights"}, ...]}
+    with the same per-plan fields as /plan_itinerary (no weather advice).
+    Plans run together on the planning pool; plans for the same city share
+    the loaded spots and distance matrices. The response is NDJSON: one
+    line per plan, {"index", "status", "data" | "reason"}, written as soon
+    as that plan finishes (cached plans come first).
+    """
+    data = request.json
+    if not data:
+        return error_response("Request body must be JSON", 400, "Invalid request")
+
+    plans = data.get('plans')
+    if not isinstance(plans, list) or not plans:
+        return error_response("'plans' must be a non-empty list", 400, "Validation error")
+    if len(plans) > PLAN_BATCH_MAX_SPECS:
+        return error_response(f"At most {PLAN_BATCH_MAX_SPECS} plans per batch", 400, "Validation error")
+
+    logger.info(f"Batch planning {len(plans)} itineraries")
+    cfg = _default_score_config()
+
+    def line(index, payload):
+        return json.dumps({"index": index, **payload}, ensure_ascii=False) + "\n"
+
+    def generate():
+        city_spots = {}  # city -> (spots, data version), loaded once per city
+        specs, pending = [], []  # pending: (cache key, weights) per spec
+        waiting = {}  # cache key -> indices of the identical plans it answers
+
+        for index, plan in enumerate(plans):
+            try:
+                if not isinstance(plan, dict) or not plan.get('city'):
+                    raise ValueError("Missing required parameter: 'city'")
+                city = plan['city']
+                days_int = _parse_plan_days(plan.get('days', 3))
+
+                if city.lower() not in city_spots:
+                    city_spots[city.lower()] = _load_city_spots(city)
+                all_spots, data_version = city_spots[city.lower()]
+                if not all_spots:
+                    raise ValueError(f"No spot data found for city: {city}")
+
+                spots, selection = _select_plan_spots(city, all_spots, plan.get('selected_spots'), days_int)
+                if not spots:
+                    raise ValueError("None of the selected spots were found in the city data")
+            except Exception as e:
+                yield line(index, {"status": "error", "reason": str(e)})
+                continue
+
+            transport_modes = plan.get('transport_modes')
+            weights = plan.get('weights')
+            plan_key = _plan_cache_key(city, days_int, spots, transport_modes, weights, data_version, selection)
+            cached_plan = plan_cache.get(plan_key)
+            if cached_plan is not None:
+                yield line(index, {"status": "success", "data": {"comparison": cached_plan}})
+                continue
+
+            if plan_key in waiting:
+                waiting[plan_key].append(index)
+                continue
+            waiting[plan_key] = [index]
+            specs.append(PlanSpec(city, spots, days_int, _resolve_transport_modes(transport_modes),
+                                  selection=selection))
+            pending.append((plan_key, weights))
+
+        if not specs:
+            return
+
+        try:
+            for k, outcomes in plan_batch(
+                specs, cfg,
+                starts=PLANNER_STARTS,
+                strategy=PLANNER_STRATEGY,
+                time_budget_ms=PLANNER_TIME_BUDGET_MS,
+            ):
+                plan_key, weights = pending[k]
+                spec = specs[k]
+                comparison_data = _summarize_mode_outcomes(spec.modes, outcomes, spec.distances, weights)
+                if not any(m.get('error') for m in comparison_data['modes'].values()):
+                    plan_cache.set(plan_key, comparison_data, ttl=PLAN_CACHE_TTL)
+                for index in waiting[plan_key]:
+                    yield line(index, {"status": "success", "data": {"comparison": comparison_data}})
+        except Exception as e:
+            logger.error(f"Batch planning failed: {e}")
+            yield line(None, {"status": "error", "reason": f"Batch planning failed: {str(e)}"})
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 # ===== Error handlers =====
 @app.errorhandler(400)
 def bad_request(e):
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Planner benchmark over the real city datasets.
+
+Samples spot sets of increasing size from data/spots_<city>.json (Berlin,
+with 7,135 spots, by default) and plans them for every combination of
+spot count, trip length and transport mode. Each case records wall time,
+search trials per second, time per planner phase, peak Python memory and
+the final score. The report is JSON so that runs before and after a
+planner change can be diffed or plotted.
+
+Usage:
+    python scripts/benchmark_planner.py                        # full sweep, report on stdout
+    python scripts/benchmark_planner.py --output before.json
+    python scripts/benchmark_planner.py --sizes 10,100 --days 1,3 --modes walk
+    python scripts/benchmark_planner.py --strategy anneal --time-budget-ms 300
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from agent.constraints import ScoreConfig
+from agent.geometry import TransportMode
+from agent.instrumentation import PlanTrace
+from agent.models import Spot
+from agent.planner import SearchStrategy, plan_itinerary_soft_constraints
+
+DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+DEFAULT_SIZES = [10, 20, 50, 100, 200, 500, 1000, 2000]
+DEFAULT_DAYS = [1, 3, 7, 14]
+DEFAULT_MODES = [TransportMode.WALK, TransportMode.TRANSIT, TransportMode.TAXI]
+
+
+def score_config() -> ScoreConfig:
+    """Same weights the web app plans with."""
+    return ScoreConfig(
+        max_daily_minutes={
+            TransportMode.WALK: 240,
+            TransportMode.TRANSIT: 300,
+            TransportMode.TAXI: 360,
+        },
+        exceed_minute_penalty=1.5,
+        one_spot_day_penalty=15.0,
+        min_spots_per_day=2,
+    )
+
+
+def load_spots(city: str) -> list:
+    with open(DATA_DIR / f'spots_{city}.json', encoding='utf-8') as f:
+        return [Spot(**s) for s in json.load(f)]
+
+
+def sample_spots(spots: list, n: int, seed: int) -> list:
+    """The same n spots for a given seed, whatever the mode or trip length."""
+    if n >= len(spots):
+        return list(spots)
+    return random.Random(seed).sample(spots, n)
+
+
+def run_case(city, spots, days, mode, cfg, strategy, trials, time_budget_ms, seed, measure_memory=True) -> dict:
+    """
+    Plan one case from scratch (distance matrix included) and measure it.
+    Peak memory is taken in a second run under tracemalloc so that memory
+    tracing does not slow down the timed one.
+    """
+    trace = PlanTrace()
+    start = time.perf_counter()
+    itinerary, score, reasons = plan_itinerary_soft_constraints(
+        city, spots, days, cfg, mode,
+        trials=trials, strategy=strategy, time_budget_ms=time_budget_ms, seed=seed,
+        trace=trace,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    peak_kb = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            plan_itinerary_soft_constraints(
+                city, spots, days, cfg, mode,
+                trials=trials, strategy=strategy, time_budget_ms=time_budget_ms, seed=seed,
+            )
+            peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+    # the rate of the search loop itself, without setup and finishing
+    search_ms = trace.timings.get('search', 0.0)
+    iterations = trace.counters.get('iterations', 0)
+    trials_per_second = round(iterations / (search_ms / 1000), 1) if search_ms > 0 else None
+
+    return {
+        'spots': len(spots),
+        'days': days,
+        'mode': mode.value,
+        'wall_ms': round(wall_ms, 2),
+        'phases_ms': {name: round(ms, 2) for name, ms in trace.timings.items()},
+        'trials': iterations,
+        'accepted': trace.counters.get('accepted', 0),
+        'trials_per_second': trials_per_second,
+        'peak_memory_kb': round(peak_kb, 1) if peak_kb is not None else None,
+        'score': round(score, 4),
+        'penalties': len(reasons),
+        'planned_spots': sum(len(day.spots) for day in itinerary.days),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmark(city, sizes, days_list, modes, strategy, trials, time_budget_ms, seed,
+                  repeats=1, measure_memory=True, log=None) -> dict:
+    """Run the whole sweep; returns the report as a dict."""
+    all_spots = load_spots(city)
+    cfg = score_config()
+    results = []
+
+    for n in sizes:
+        spots = sample_spots(all_spots, n, seed)
+        for days in days_list:
+            for mode in modes:
+                runs = [
+                    run_case(city, spots, days, mode, cfg, strategy, trials, time_budget_ms, seed,
+                             measure_memory=measure_memory and r == 0)
+                    for r in range(repeats)
+                ]
+                # best wall time of the repeats; everything else is deterministic
+                case = min(runs, key=lambda c: c['wall_ms'])
+                case['peak_memory_kb'] = runs[0]['peak_memory_kb']
+                if repeats > 1:
+                    case['wall_ms_runs'] = [c['wall_ms'] for c in runs]
+                results.append(case)
+                if log is not None:
+                    log(case)
+
+    return {
+        'meta': {
+            'city': city,
+            'available_spots': len(all_spots),
+            'strategy': strategy.value,
+            'trials': trials if strategy == SearchStrategy.HILL_CLIMB else None,
+            'time_budget_ms': time_budget_ms if strategy == SearchStrategy.ANNEAL else None,
+            'seed': seed,
+            'repeats': repeats,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the itinerary planner on a real city dataset.")
+    parser.add_argument('--city', default='berlin', help="dataset to sample from (data/spots_<city>.json)")
+    parser.add_argument('--sizes', type=_int_list, default=DEFAULT_SIZES, help="comma separated spot counts")
+    parser.add_argument('--days', type=_int_list, default=DEFAULT_DAYS, help="comma separated trip lengths")
+    parser.add_argument('--modes', default=','.join(m.value for m in DEFAULT_MODES),
+                        help="comma separated transport modes")
+    parser.add_argument('--strategy', choices=[s.value for s in SearchStrategy], default=SearchStrategy.HILL_CLIMB.value)
+    parser.add_argument('--trials', type=int, default=200, help="search trials per case (hill_climb)")
+    parser.add_argument('--time-budget-ms', type=float, default=300, help="search time per case (anneal)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=1, help="timed runs per case; the fastest is reported")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced run for peak memory")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    modes = [TransportMode(m.strip()) for m in args.modes.split(',') if m.strip()]
+
+    def log(case):
+        print(
+            f"{case['spots']:>5} spots {case['days']:>3} days {case['mode']:<8}"
+            f" {case['wall_ms']:>10.1f} ms  score {case['score']:.1f}",
+            file=sys.stderr,
+        )
+
+    report = run_benchmark(
+        args.city, args.sizes, args.days, modes,
+        strategy=SearchStrategy(args.strategy),
+        trials=args.trials,
+        time_budget_ms=args.time_budget_ms,
+        seed=args.seed,
+        repeats=max(1, args.repeats),
+        measure_memory=not args.no_memory,
+        log=log,
+    )
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        print(f"Wrote {len(report['results'])} cases to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,32 +9,75 @@
 5. 无效数据
 """
 import json
+import sys
 from pathlib import Path
 from collections import defaultdict
-import math
 from difflib import SequenceMatcher
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from agent.geometry import distances_from
+from agent.spatial import KM_PER_DEGREE, GridIndex
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """计算两个坐标点之间的距离（米）"""
-    R = 6371000  # 地球半径（米）
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+    return float(distances_from(lat1, lon1, [lat2], [lon2])[0]) * 1000
+
+def nearby_spot_pairs(spots, max_distance):
+    """
+    距离不超过 max_distance 米的景点对 {(i, j): 距离（米）}（i < j），以及每个景点是否有坐标。
+    通过网格空间索引只比较相邻网格内的景点，不再计算 n×n 距离矩阵。
+    """
+    has_coords = [bool(s.get('lat')) and bool(s.get('lon')) for s in spots]
+    rows = [i for i, ok in enumerate(has_coords) if ok]
+    pairs = {}
+    if len(rows) < 2:
+        return pairs, has_coords
+
+    lats = np.array([spots[i]['lat'] for i in rows], dtype=float)
+    lons = np.array([spots[i]['lon'] for i in rows], dtype=float)
+    index = GridIndex(lats, lons)
+    # 索引按平面投影计算距离，可能略小于球面距离：放宽搜索半径，再用球面距离精确筛选
+    lat0 = np.radians(lats.mean())
+    slack = (np.pi * 6371.0088 / 180 / KM_PER_DEGREE) * max(1.0, np.cos(np.radians(lats)).max() / np.cos(lat0))
+    first, second, _ = index.pairs_within(max_distance / 1000 * slack * 1.01)
+    for a, b in zip(first.tolist(), second.tolist()):
+        i, j = rows[a], rows[b]
+        distance = calculate_distance(spots[i]['lat'], spots[i]['lon'], spots[j]['lat'], spots[j]['lon'])
+        if distance <= max_distance:
+            pairs[(i, j)] = distance
+    return pairs, has_coords
+
+def clean_name(name):
+    """去掉常见的前缀/后缀"""
+    return name.replace('北京', '').replace('故宫博物院-', '').replace('天坛公园-', '').strip()
 
 def name_similarity(name1, name2):
     """计算两个名称的相似度（0-1）"""
-    # 移除常见的前缀/后缀
-    clean1 = name1.replace('北京', '').replace('故宫博物院-', '').replace('天坛公园-', '').strip()
-    clean2 = name2.replace('北京', '').replace('故宫博物院-', '').replace('天坛公园-', '').strip()
-    
     # 使用SequenceMatcher计算相似度
-    return SequenceMatcher(None, clean1, clean2).ratio()
+    return SequenceMatcher(None, clean_name(name1), clean_name(name2)).ratio()
+
+def similar_name_pairs(spots, threshold):
+    """
+    名称相似度不低于 threshold 的景点对 {(i, j): 相似度}（i < j）。
+    仍需比较每一对名称，但先用长度和字符组成的上界（real_quick_ratio、quick_ratio）排除大部分，
+    结果与逐对计算 ratio() 相同。
+    """
+    names = [clean_name(s.get('name', '')) for s in spots]
+    pairs = {}
+    matcher = SequenceMatcher(None)
+    for j in range(1, len(spots)):
+        # seq2 的预处理只做一次
+        matcher.set_seq2(names[j])
+        for i in range(j):
+            matcher.set_seq1(names[i])
+            if (matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold):
+                similarity = matcher.ratio()
+                if similarity >= threshold:
+                    pairs[(i, j)] = similarity
+    return pairs
 
 def check_duplicate_spots(spots, city_name, threshold_name=0.8, threshold_distance=100):
     """
@@ -42,50 +85,39 @@ def check_duplicate_spots(spots, city_name, threshold_name=0.8, threshold_distan
     threshold_name: 名称相似度阈值（0-1）
     threshold_distance: 距离阈值（米）
     """
+    nearby, has_coords = nearby_spot_pairs(spots, threshold_distance)
+    similar = similar_name_pairs(spots, threshold_name)
+
     duplicates = []
-    
-    for i in range(len(spots)):
-        for j in range(i + 1, len(spots)):
-            spot1 = spots[i]
-            spot2 = spots[j]
-            
-            name1 = spot1.get('name', '')
-            name2 = spot2.get('name', '')
-            
-            # 检查名称相似度
-            similarity = name_similarity(name1, name2)
-            
-            # 检查坐标距离
-            lat1, lon1 = spot1.get('lat'), spot1.get('lon')
-            lat2, lon2 = spot2.get('lat'), spot2.get('lon')
-            
-            distance = None
-            if all([lat1, lon1, lat2, lon2]):
-                distance = calculate_distance(lat1, lon1, lat2, lon2)
-            
-            # 判断是否重复
-            is_duplicate = False
-            reason = []
-            
-            if similarity >= threshold_name:
-                is_duplicate = True
-                reason.append(f"名称相似度 {similarity:.2%}")
-            
-            if distance is not None and distance <= threshold_distance:
-                is_duplicate = True
-                reason.append(f"距离 {distance:.0f}米")
-            
-            if is_duplicate:
-                duplicates.append({
-                    'spot1': name1,
-                    'spot2': name2,
-                    'similarity': similarity,
-                    'distance': distance,
-                    'reason': ', '.join(reason),
-                    'index1': i,
-                    'index2': j
-                })
-    
+    for i, j in sorted(nearby.keys() | similar.keys()):
+        spot1 = spots[i]
+        spot2 = spots[j]
+
+        name1 = spot1.get('name', '')
+        name2 = spot2.get('name', '')
+
+        similarity = similar[(i, j)] if (i, j) in similar else name_similarity(name1, name2)
+
+        distance = nearby.get((i, j))
+        if distance is None and has_coords[i] and has_coords[j]:
+            distance = calculate_distance(spot1['lat'], spot1['lon'], spot2['lat'], spot2['lon'])
+
+        reason = []
+        if similarity >= threshold_name:
+            reason.append(f"名称相似度 {similarity:.2%}")
+        if (i, j) in nearby:
+            reason.append(f"距离 {distance:.0f}米")
+
+        duplicates.append({
+            'spot1': name1,
+            'spot2': name2,
+            'similarity': similarity,
+            'distance': distance,
+            'reason': ', '.join(reason),
+            'index1': i,
+            'index2': j
+        })
+
     return duplicates
 
 def check_description_quality(spots, city_name):
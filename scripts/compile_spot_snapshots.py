@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compile data/spots_<city>.json files into binary snapshots
+(data/snapshots/spots_<city>.snap) that the server memory-maps instead of
+parsing the JSON (see agent/spot_snapshot.py).
+
+A snapshot records the size, mtime and MD5 of the JSON it was built from;
+the server ignores snapshots whose source has changed since, so re-run
+this after editing the data.
+
+Usage:
+    python scripts/compile_spot_snapshots.py              # every city
+    python scripts/compile_spot_snapshots.py berlin kyoto
+"""
+import argparse
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.cache import data_version_for_spots
+from agent.spot_snapshot import write_snapshot
+from agent.spot_store import SNAPSHOT_DIR, city_key, parse_spots
+
+DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+
+def compile_city(source: Path, output_dir: Path) -> Path:
+    """Compile one city file; returns the snapshot path."""
+    stat = os.stat(source)
+    raw = source.read_bytes()
+    spots = parse_spots(raw)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    target = output_dir / f"{source.stem}.snap"
+    write_snapshot(
+        str(target), spots,
+        data_version=data_version_for_spots([s.model_dump() for s in spots]),
+        source={
+            'file': source.name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'md5': hashlib.md5(raw).hexdigest(),
+        },
+    )
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile city spot JSON files into binary snapshots.")
+    parser.add_argument('cities', nargs='*', help="cities to compile (default: all)")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--output-dir', type=Path, help=f"default: <data-dir>/{SNAPSHOT_DIR}")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output_dir or args.data_dir / SNAPSHOT_DIR
+
+    if args.cities:
+        sources = [args.data_dir / f"spots_{city_key(c)}.json" for c in args.cities]
+    else:
+        sources = sorted(args.data_dir.glob('spots_*.json'))
+
+    failed = 0
+    for source in sources:
+        try:
+            target = compile_city(source, output_dir)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Failed to compile {source}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"{source.name}: {source.stat().st_size / 1024:.0f} KB -> "
+              f"{target.name}: {target.stat().st_size / 1024:.0f} KB")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Tests for the batch distance kernels in agent.geometry.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.models import Spot
+from agent.geometry import distance, distance_matrix, distances_from, pairwise_distances
+
+LATS = [39.9163, 39.8822, 31.2304, 48.8584]
+LONS = [116.3972, 116.4066, 121.4737, 2.2945]
+
+
+def test_known_distances():
+    # Paris -> London is roughly 344 km
+    assert float(distances_from(48.8566, 2.3522, [51.5074], [-0.1278])[0]) == pytest.approx(343.5, abs=1.0)
+    # one degree of longitude shrinks with latitude
+    at_equator = float(distances_from(0.0, 0.0, [0.0], [1.0])[0])
+    at_sixty = float(distances_from(60.0, 0.0, [60.0], [1.0])[0])
+    assert at_sixty == pytest.approx(at_equator / 2, rel=1e-3)
+
+
+def test_distance_matrix_is_symmetric_with_zero_diagonal():
+    km = distance_matrix(LATS, LONS)
+    assert km.shape == (4, 4)
+    assert np.array_equal(km, km.T)
+    assert np.all(np.diag(km) == 0.0)
+
+
+def test_batch_functions_agree_with_scalar_distance():
+    spots = [Spot(name=str(i), lat=lat, lon=lon, category="outdoor")
+             for i, (lat, lon) in enumerate(zip(LATS, LONS))]
+    km = distance_matrix(LATS, LONS)
+    cross = pairwise_distances(LATS[:2], LONS[:2], LATS, LONS)
+    assert cross.shape == (2, 4)
+    for i, a in enumerate(spots):
+        row = distances_from(a.lat, a.lon, LATS, LONS)
+        for j, b in enumerate(spots):
+            assert km[i][j] == pytest.approx(distance(a, b))
+            assert row[j] == pytest.approx(distance(a, b))
+            if i < 2:
+                assert cross[i][j] == pytest.approx(distance(a, b))
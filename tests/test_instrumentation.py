@@ -0,0 +1,81 @@
+"""
+Tests for planner instrumentation (PlanTrace / NULL_TRACE).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.geometry import TransportMode
+from agent.instrumentation import NULL_TRACE, PlanTrace
+from agent.planner import (
+    SearchStrategy,
+    plan_itinerary_multistart,
+    plan_itinerary_soft_constraints,
+    plan_modes_concurrently,
+)
+from tests.test_planner_search import CFG, make_spots
+
+
+def test_null_trace_records_nothing():
+    with NULL_TRACE.phase("x"):
+        NULL_TRACE.count("y")
+        NULL_TRACE.point(1, 2.0)
+    assert NULL_TRACE.child("z") is NULL_TRACE
+    assert NULL_TRACE.to_dict() is None
+
+
+def test_hill_climb_trace():
+    trace = PlanTrace()
+    _, score, _ = plan_itinerary_soft_constraints(
+        "test", make_spots(30), 3, CFG, TransportMode.WALK, trials=150, trace=trace,
+    )
+    data = trace.to_dict()
+
+    assert {"distances", "initial", "search", "route_finish", "materialize", "score"} <= set(data["timings_ms"])
+    counters = data["counters"]
+    assert counters["iterations"] == 150
+    assert counters["accepted"] + counters["rejected"] == 150
+
+    points = data["score_trace"]["points"]
+    assert points[0][0] == 0
+    assert len(points) == counters["accepted"] + 1
+    scores = [p[2] for p in points]
+    assert all(b < a for a, b in zip(scores, scores[1:]))
+
+
+def test_anneal_trace_counts_moves():
+    trace = PlanTrace()
+    plan_itinerary_soft_constraints(
+        "test", make_spots(30), 3, CFG, TransportMode.WALK,
+        strategy=SearchStrategy.ANNEAL, time_budget_ms=30, trace=trace,
+    )
+    counters = trace.to_dict()["counters"]
+    assert counters["iterations"] > 0
+    assert counters["accepted"] + counters["rejected"] == counters["iterations"]
+    assert counters["accepted_uphill"] <= counters["accepted"]
+
+
+def test_tracing_does_not_change_the_plan():
+    spots = make_spots(25)
+    plain = plan_itinerary_soft_constraints("test", spots, 3, CFG, TransportMode.TRANSIT, trials=100)
+    traced = plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.TRANSIT, trials=100, trace=PlanTrace(),
+    )
+    assert traced[1] == plain[1]
+
+
+def test_worker_traces_come_back():
+    spots = make_spots(20)
+    modes = [TransportMode.WALK, TransportMode.TAXI]
+
+    trace = PlanTrace()
+    plan_modes_concurrently("test", spots, 2, CFG, modes, max_workers=2, trials=50, trace=trace)
+    children = trace.to_dict()["children"]
+    assert set(children) == {"walk", "taxi"}
+    assert children["walk"]["counters"]["iterations"] == 50
+
+    trace = PlanTrace()
+    plan_itinerary_multistart("test", spots, 2, CFG, TransportMode.WALK, starts=2, max_workers=2,
+                              trials=50, trace=trace)
+    assert set(trace.to_dict()["children"]) == {"start_0", "start_1"}
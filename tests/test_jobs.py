@@ -0,0 +1,246 @@
+"""
+Tests for the background job queue (memory and inline backends, and leases).
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.jobs import (
+    InlineJobQueue,
+    JobFailed,
+    JobQueue,
+    JobQueueFull,
+    JobStatus,
+    MemoryJobQueue,
+    create_job_queue,
+    current_job,
+    register_handler,
+)
+import agent.jobs as jobs
+
+
+def _double(payload):
+    current_job().report({'progress': 50})
+    return {'value': payload['value'] * 2}
+
+
+def _reject(payload):
+    raise JobFailed("bad input", 422, "Validation error")
+
+
+register_handler('test-double', _double)
+register_handler('test-reject', _reject)
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in (JobStatus.DONE.value, JobStatus.FAILED.value):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+class FakeRedis:
+    """The few Redis commands RedisJobQueue uses, without expiry."""
+
+    class connection_pool:
+        connection_kwargs = {'socket_timeout': 5}
+
+    def __init__(self):
+        self.values, self.lists, self.zsets = {}, {}, {}
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def set(self, key, value, px=None):
+        self.values[key] = value
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    def rpop(self, key):
+        return self.lists[key].pop()
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.get(key, {})
+        for member in [m for m, score in zset.items() if float(low) <= score <= float(high)]:
+            del zset[member]
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """A WATCH/MULTI pipeline on FakeRedis; nothing else writes, so EXEC always succeeds."""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, key):
+        pass
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def multi(self):
+        pass
+
+    def setex(self, key, ttl, value):
+        self.commands.append((key, ttl, value))
+
+    def execute(self):
+        for command in self.commands:
+            self.client.setex(*command)
+        self.commands = []
+
+
+@pytest.mark.parametrize("queue_cls", [MemoryJobQueue, InlineJobQueue])
+def test_job_runs_and_reports_progress(queue_cls):
+    queue = queue_cls()
+    job_id = queue.submit('test-double', {'value': 21})
+    job = wait_for(queue, job_id)
+    assert job['status'] == JobStatus.DONE.value
+    assert job['result'] == {'value': 42}
+    assert job['progress'] == {'progress': 50}
+    assert current_job() is None
+
+
+def test_failed_job_keeps_error_details():
+    queue = InlineJobQueue()
+    job = queue.get(queue.submit('test-reject', {}))
+    assert job['status'] == JobStatus.FAILED.value
+    assert job['error'] == {'reason': "bad input", 'code': 422, 'message': "Validation error"}
+
+
+def test_unknown_kind_and_missing_job():
+    queue = InlineJobQueue()
+    with pytest.raises(ValueError):
+        queue.submit('no-such-kind', {})
+    assert queue.get('missing') is None
+
+
+def test_submit_refuses_when_queue_is_full(monkeypatch):
+    release = threading.Event()
+    register_handler('test-block', lambda payload: release.wait(5))
+    monkeypatch.setattr(jobs, 'JOB_MAX_PENDING', 2)
+    queue = MemoryJobQueue(max_workers=1)
+    ids = [queue.submit('test-block', {}) for _ in range(2)]
+    with pytest.raises(JobQueueFull):
+        queue.submit('test-block', {})
+    release.set()
+    for job_id in ids:
+        assert wait_for(queue, job_id)['status'] == JobStatus.DONE.value
+
+
+def test_factory_falls_back_to_memory(monkeypatch):
+    import agent.cache
+    monkeypatch.setattr(agent.cache, 'get_cache_client', lambda: None)
+    assert create_job_queue('inline').backend == 'inline'
+    assert create_job_queue('memory').backend == 'memory'
+    assert create_job_queue('redis').backend == 'memory'
+    monkeypatch.delenv('PLAN_JOB_BACKEND', raising=False)
+    assert create_job_queue().backend == 'memory'
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoLeases(JobQueue):
+        def pending_count(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        NoLeases()
+
+
+def test_redis_pop_returns_before_the_socket_times_out():
+    queue = jobs.RedisJobQueue(FakeRedis(), max_workers=0)
+    assert queue._pop_timeout < 5
+
+
+def test_redis_pending_count_includes_running_jobs(monkeypatch):
+    client = FakeRedis()
+    queue = jobs.RedisJobQueue(client, max_workers=0)
+    queue.submit('test-double', {'value': 1})
+    queue.submit('test-double', {'value': 2})
+    assert queue.pending_count() == 2
+
+    # a worker pops a job and takes its lease
+    running = client.rpop(queue.QUEUE_KEY)
+    queue._renew_lease(running)
+    assert queue.pending_count() == 2
+    queue._drop_lease(running)
+    assert queue.pending_count() == 1
+
+    # a job whose lease ran out no longer counts
+    monkeypatch.setattr(jobs, 'JOB_LEASE', -1)
+    queue._renew_lease(client.rpop(queue.QUEUE_KEY))
+    assert queue.pending_count() == 0
+
+
+@pytest.mark.parametrize("make_queue", [
+    lambda: InlineJobQueue(),
+    lambda: jobs.RedisJobQueue(FakeRedis(), max_workers=0),
+])
+def test_conditional_update_leaves_finished_jobs_alone(make_queue):
+    queue = make_queue()
+    now = time.time()
+    queue._save({'id': 'job', 'kind': 'test-double', 'status': JobStatus.DONE.value,
+                 'progress': None, 'created_at': now, 'updated_at': now}, {})
+    queue._update('job', only_if=JobStatus.RUNNING.value, status=JobStatus.FAILED.value)
+    assert queue.get('job')['status'] == JobStatus.DONE.value
+    queue._update('job', only_if=JobStatus.DONE.value, progress={'seen': True})
+    assert queue.get('job')['progress'] == {'seen': True}
+
+
+def test_running_job_without_a_live_worker_fails(monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_LEASE', 0.2)
+    release = threading.Event()
+    register_handler('test-slow', lambda payload: release.wait(5))
+    queue = MemoryJobQueue(max_workers=1)
+    job_id = queue.submit('test-slow', {})
+    # a live worker keeps renewing its lease
+    time.sleep(0.5)
+    assert queue.get(job_id)['status'] == JobStatus.RUNNING.value
+    release.set()
+    assert wait_for(queue, job_id)['status'] == JobStatus.DONE.value
+
+    # a job left running by a worker that died
+    queue._save({'id': 'orphan', 'kind': 'test-slow', 'status': JobStatus.RUNNING.value,
+                 'progress': None, 'created_at': time.time(), 'updated_at': time.time()}, {})
+    job = queue.get('orphan')
+    assert job['status'] == JobStatus.FAILED.value
+    assert job['error']['reason'] == "The worker running this job stopped"
@@ -0,0 +1,50 @@
+"""
+Tests for plan cache keys and the in-process plan cache fallback.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cache import PlanCache, cache_key_for_plan, data_version_for_spots
+
+
+def test_plan_key_is_canonical():
+    a = cache_key_for_plan("Kyoto", 3, ["b", "a", "c"], modes=["walk", "taxi"],
+                           weights=[0.5, 0.2, 0.3], data_version="v1")
+    b = cache_key_for_plan("kyoto", 3, ["c", "a", "b"], modes=["walk", "taxi"],
+                           weights=[0.50000001, 0.2, 0.3], data_version="v1")
+    assert a == b
+
+
+def test_plan_key_changes_with_request_and_data():
+    base = dict(modes=["walk"], weights=[0.5, 0.2, 0.3], data_version="v1")
+    key = cache_key_for_plan("kyoto", 3, ["a", "b"], **base)
+    assert cache_key_for_plan("kyoto", 4, ["a", "b"], **base) != key
+    assert cache_key_for_plan("kyoto", 3, ["a"], **base) != key
+    assert cache_key_for_plan("kyoto", 3, ["a", "b"], **dict(base, modes=["taxi"])) != key
+    assert cache_key_for_plan("kyoto", 3, ["a", "b"], **dict(base, data_version="v2")) != key
+
+
+def test_data_version_tracks_content():
+    spots = [{"name": "a", "lat": 1.0, "lon": 2.0}]
+    assert data_version_for_spots(spots) == data_version_for_spots([dict(spots[0])])
+    assert data_version_for_spots(spots) != data_version_for_spots([{"name": "a", "lat": 1.0, "lon": 2.5}])
+
+
+def test_local_plan_cache_ttl_and_eviction():
+    plans = PlanCache(max_entries=2)
+    plans.set("plan:a", {"x": [1]}, ttl=60)
+    hit = plans.get("plan:a")
+    assert hit == {"x": [1]}
+    hit["x"].append(2)  # callers get their own copy
+    assert plans.get("plan:a") == {"x": [1]}
+
+    plans.set("plan:b", {}, ttl=60)
+    plans.set("plan:c", {}, ttl=60)
+    assert plans.get("plan:a") is None  # least recently used is evicted
+
+    plans.set("plan:d", {}, ttl=0)
+    time.sleep(0.01)
+    assert plans.get("plan:d") is None
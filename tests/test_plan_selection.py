@@ -0,0 +1,38 @@
+"""
+Tests for how /plan_itinerary picks the spots to plan with.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app reads these at import; nothing here calls Supabase or the Places API
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:1')
+os.environ.setdefault('SUPABASE_SERVICE_KEY', 'test')
+os.environ.setdefault('GOOGLE_PLACES_API_KEY', 'test')
+
+import app
+
+
+def test_small_city_is_planned_whole():
+    spots = app.spot_store.spots('paris')
+    assert 0 < len(spots) <= app.PLANNER_ALL_SPOTS_MAX
+    for days in (1, 2):
+        planned, selection = app._select_plan_spots('paris', spots, None, days)
+        assert planned == spots
+        assert selection is None
+
+
+def test_large_city_gets_a_candidate_selection():
+    spots = app.spot_store.spots('kyoto')
+    planned, selection = app._select_plan_spots('kyoto', spots, [], 2)
+    assert selection.visits == 2 * app.PLANNER_SPOTS_PER_DAY
+    assert selection.visits < len(planned) < len(spots)
+
+
+def test_selected_subset_is_kept():
+    spots = app.spot_store.spots('paris')
+    names = [s.name for s in spots[:3]]
+    planned, selection = app._select_plan_spots('paris', spots, names, 1)
+    assert [s.name for s in planned] == names
+    assert selection is None
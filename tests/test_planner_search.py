@@ -0,0 +1,418 @@
+"""
+Tests for the planner's search loop and its incremental scoring.
+"""
+import sys
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import agent.parallel as parallel
+import agent.planner as planner
+from agent.models import Spot
+from agent.geometry import TransportMode
+from agent.constraints import ScoreConfig, IncrementalScorer, PrizeCollectingScorer, score_itinerary
+from agent.planner import (
+    plan_itinerary_soft_constraints,
+    plan_itinerary_multistart,
+    plan_modes_concurrently,
+    build_clustered_itinerary,
+    plan_batch,
+    PlanSpec,
+    SearchStrategy,
+    CandidateSelection,
+    narrow_candidates,
+    _initial_day_paths,
+    _materialize_itinerary,
+    _move_one_spot,
+    _swap_spots_between_days,
+    _exchange_spot,
+    _MoveProposer,
+)
+from agent.instrumentation import PlanTrace
+from agent.travel_matrix import DistanceMatrix, TravelMatrix
+from agent.routing import RouteOptimizer
+
+
+def make_spots(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [
+        Spot(
+            name=f"spot-{i}",
+            lat=31.0 + rng.random() * 0.4,
+            lon=121.2 + rng.random() * 0.5,
+            category="outdoor",
+            duration_minutes=60,
+        )
+        for i in range(n)
+    ]
+
+
+CFG = ScoreConfig(
+    max_daily_minutes={
+        TransportMode.WALK: 240,
+        TransportMode.TRANSIT: 300,
+        TransportMode.TAXI: 360,
+    },
+    exceed_minute_penalty=1.5,
+    one_spot_day_penalty=15.0,
+    min_spots_per_day=2,
+)
+
+
+@pytest.mark.parametrize("mode", list(TransportMode))
+def test_incremental_delta_matches_full_rescore(mode):
+    spots = make_spots(12)
+    matrix = TravelMatrix(spots, mode)
+    router = RouteOptimizer(matrix)
+    day_paths = _initial_day_paths(spots, 4, matrix, router)
+    scorer = IncrementalScorer(day_paths, CFG, mode, matrix)
+
+    def full_score(paths):
+        return score_itinerary(_materialize_itinerary("test", spots, paths, matrix), CFG, mode)[0]
+
+    assert scorer.score == pytest.approx(full_score(day_paths))
+
+    rng = random.Random(3)
+    for step in range(50):
+        move = _move_one_spot if step % 2 else _swap_spots_between_days
+        before = [p[:] for p in day_paths]
+        changes = move(day_paths, router, rng)
+        assert day_paths == before
+
+        delta, updates = scorer.evaluate(changes)
+        candidate = [changes.get(d, p) for d, p in enumerate(day_paths)]
+        assert delta == pytest.approx(full_score(candidate) - full_score(day_paths))
+
+        day_paths = candidate
+        scorer.commit(updates)
+        assert scorer.score == pytest.approx(full_score(day_paths))
+
+
+def test_prize_delta_matches_full_rescore():
+    spots = make_spots(30)
+    matrix = TravelMatrix(spots, TransportMode.WALK)
+    router = RouteOptimizer(matrix)
+    prizes = [random.Random(i).random() for i in range(30)]
+    day_paths = [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    scorer = PrizeCollectingScorer(day_paths, CFG, TransportMode.WALK, matrix, prizes, 30.0, 0.02)
+    neighbours = [[k for k in range(30) if k != i] for i in range(30)]
+
+    def full_score(paths):
+        penalty = score_itinerary(_materialize_itinerary("test", spots, paths, matrix), CFG, TransportMode.WALK)[0]
+        minutes = sum(matrix.path_minutes(p) for p in paths)
+        return penalty + 0.02 * minutes - 30.0 * sum(prizes[k] for p in paths for k in p)
+
+    rng = random.Random(5)
+    for _ in range(50):
+        changes = _exchange_spot(day_paths, router, rng, neighbours)
+        delta, updates = scorer.evaluate(changes)
+        candidate = [changes.get(d, p) for d, p in enumerate(day_paths)]
+        assert delta == pytest.approx(full_score(candidate) - full_score(day_paths))
+        assert sum(map(len, candidate)) == 10
+        assert len({k for p in candidate for k in p}) == 10
+        day_paths = candidate
+        scorer.commit(updates)
+    assert scorer.score == pytest.approx(full_score(day_paths))
+
+
+def test_selection_plans_the_requested_visits():
+    spots = make_spots(60)
+    # only the even spots are worth visiting
+    prizes = [1.0 if i % 2 == 0 else 0.0 for i in range(60)]
+    itin, score, reasons = plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.TAXI, trials=300,
+        selection=CandidateSelection(visits=12, prizes=prizes),
+    )
+    planned = [s.name for d in itin.days for s in d.spots]
+    assert len(planned) == len(set(planned)) == 12
+    assert all(int(name.split("-")[1]) % 2 == 0 for name in planned)
+    assert score == pytest.approx(score_itinerary(itin, CFG, TransportMode.TAXI)[0])
+
+
+def test_narrow_candidates_keeps_the_best_spots():
+    spots = make_spots(500)
+    prizes = [random.Random(i).random() for i in range(500)]
+    pool = narrow_candidates(spots, prizes, visits=10)
+    assert len(pool) == 80
+    assert pool == sorted(set(pool))
+    best = sorted(range(500), key=lambda i: -prizes[i])[:10]
+    assert set(best) <= set(pool)
+    assert narrow_candidates(spots[:50], prizes[:50], visits=10) == list(range(50))
+
+
+def test_steered_moves_target_days_with_a_neighbour(monkeypatch):
+    monkeypatch.setattr(planner, "STEER_PROBABILITY", 1.0)
+    spots = make_spots(40)
+    distances = DistanceMatrix(spots)
+    matrix = distances.for_mode(TransportMode.WALK)
+    neighbours = distances.neighbor_lists(5)
+    router = RouteOptimizer(matrix, neighbors=neighbours)
+    day_paths = _initial_day_paths(spots, 4, matrix, router)
+    rng = random.Random(7)
+    moves = _MoveProposer(day_paths, len(spots), rng, neighbours)
+
+    for _ in range(100):
+        before = [p[:] for p in day_paths]
+        changes = _move_one_spot(day_paths, router, rng, neighbours, moves.day_of)
+        assert day_paths == before
+        (src, _), (dst, new_path) = changes.items()
+        moved = next(k for k in new_path if k not in day_paths[dst])
+        near_days = {moves.day_of[k] for k in neighbours[moved]} - {src}
+        # steering only falls back to a random day when no neighbour lives elsewhere
+        assert dst in near_days or not near_days
+
+
+def test_move_proposer_tracks_days():
+    spots = make_spots(40)
+    distances = DistanceMatrix(spots)
+    matrix = distances.for_mode(TransportMode.WALK)
+    neighbours = distances.neighbor_lists(8)
+    router = RouteOptimizer(matrix, neighbors=neighbours)
+    day_paths = [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9, 10]]
+    moves = _MoveProposer(day_paths, len(spots), random.Random(11), neighbours, exchange=True)
+
+    for _ in range(200):
+        changes = moves(day_paths, router)
+        moves.apply(day_paths, changes)
+        expected = [-1] * len(spots)
+        for d, path in enumerate(day_paths):
+            for k in path:
+                expected[k] = d
+        assert moves.day_of == expected
+    assert sum(map(len, day_paths)) == 11
+
+
+def test_steering_raises_acceptance(monkeypatch):
+    spots = make_spots(200)
+
+    def accepted():
+        trace = PlanTrace()
+        plan_itinerary_soft_constraints("test", spots, 7, CFG, TransportMode.WALK, trials=400, trace=trace)
+        return trace.counters["accepted"]
+
+    steered = accepted()
+    monkeypatch.setattr(planner, "STEER_PROBABILITY", 0.0)
+    assert steered > accepted()
+
+
+def test_plan_keeps_every_spot():
+    spots = make_spots(15)
+    itin, score, reasons = plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.TRANSIT, trials=100
+    )
+    planned = sorted(s.name for d in itin.days for s in d.spots)
+    assert planned == sorted(s.name for s in spots)
+    assert score == pytest.approx(score_itinerary(itin, CFG, TransportMode.TRANSIT)[0])
+
+
+def test_single_day_plan():
+    spots = make_spots(5)
+    itin, _, _ = plan_itinerary_soft_constraints("test", spots, 1, CFG, TransportMode.WALK, trials=20)
+    assert len(itin.days) == 1
+    assert len(itin.days[0].spots) == 5
+
+
+def test_anneal_respects_time_budget():
+    spots = make_spots(30)
+    start = time.perf_counter()
+    itin, score, _ = plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.WALK,
+        strategy=SearchStrategy.ANNEAL, time_budget_ms=100,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    assert elapsed_ms < 1000
+    assert sorted(s.name for d in itin.days for s in d.spots) == sorted(s.name for s in spots)
+    assert score == pytest.approx(score_itinerary(itin, CFG, TransportMode.WALK)[0])
+
+
+def test_anneal_not_worse_than_start():
+    spots = make_spots(30)
+    _, hill_score, _ = plan_itinerary_soft_constraints("test", spots, 3, CFG, TransportMode.WALK, trials=0)
+    _, anneal_score, _ = plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.WALK,
+        strategy=SearchStrategy.ANNEAL, time_budget_ms=50,
+    )
+    assert anneal_score <= hill_score + 1e-6
+
+
+def test_multistart_not_worse_than_single_start():
+    spots = make_spots(30)
+    _, single, _ = plan_itinerary_soft_constraints("test", spots, 3, CFG, TransportMode.WALK, trials=100)
+    itin, multi, _ = plan_itinerary_multistart(
+        "test", spots, 3, CFG, TransportMode.WALK, starts=3, max_workers=2, trials=100
+    )
+    assert multi <= single + 1e-6
+    assert sorted(s.name for d in itin.days for s in d.spots) == sorted(s.name for s in spots)
+
+
+def test_multistart_serial_matches_pool():
+    spots = make_spots(20)
+    serial = plan_itinerary_multistart("test", spots, 2, CFG, TransportMode.TAXI, starts=3, max_workers=1, trials=50)
+    pooled = plan_itinerary_multistart("test", spots, 2, CFG, TransportMode.TAXI, starts=3, max_workers=2, trials=50)
+    assert serial[1] == pooled[1]
+    assert [[s.name for s in d.spots] for d in serial[0].days] == [[s.name for s in d.spots] for d in pooled[0].days]
+
+
+def test_callers_share_one_pool_and_cap_their_tasks():
+    spots = make_spots(20)
+    plan_itinerary_multistart("test", spots, 2, CFG, TransportMode.WALK, starts=2, max_workers=2, trials=30)
+    pool = parallel.get_process_pool()
+    plan_modes_concurrently("test", spots, 2, CFG, [TransportMode.WALK, TransportMode.TAXI],
+                            max_workers=3, trials=30)
+    assert parallel.get_process_pool() is pool
+
+    limiter = parallel.TaskLimiter([("slow", time.sleep, (0.2,), {}), ("fast", time.sleep, (0,), {})], 1)
+    assert [key for key, _ in limiter.as_completed()] == ["slow", "fast"]
+
+
+def test_plan_batch_yields_before_submitting_every_spec(monkeypatch):
+    pool = parallel.get_process_pool()
+    submitted = []
+
+    class CountingPool:
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args[0])
+            return pool.submit(fn, *args, **kwargs)
+
+    monkeypatch.setattr(parallel, 'get_process_pool', lambda: CountingPool())
+    specs = [PlanSpec(f"city-{i}", make_spots(12, seed=i), 2, [TransportMode.WALK]) for i in range(8)]
+    batch = plan_batch(specs, CFG, max_workers=2, trials=30)
+    index, outcomes = next(batch)
+    assert len(submitted) < len(specs)
+    assert f"city-{index}" in submitted
+    rest = dict(batch)
+    assert sorted([index, *rest]) == list(range(len(specs)))
+    assert len(submitted) == len(specs)
+
+
+def test_concurrent_plans_in_one_process_are_reproducible():
+    spots = make_spots(40)
+
+    def plan(seed):
+        itin, score, _ = plan_itinerary_soft_constraints(
+            "test", spots, 3, CFG, TransportMode.WALK, trials=300, seed=seed,
+        )
+        return score, [[s.name for s in d.spots] for d in itin.days]
+
+    expected = {seed: plan(seed) for seed in range(4)}
+
+    random.seed(42)
+    state = random.getstate()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(plan, [seed for seed in range(4) for _ in range(3)]))
+    assert results == [expected[seed] for seed in range(4) for _ in range(3)]
+    # the module-level generator is left alone
+    assert random.getstate() == state
+
+
+def test_plan_batch_yields_every_spec_and_shares_distances():
+    spots_a, spots_b = make_spots(15, seed=1), make_spots(12, seed=2)
+    modes = [TransportMode.WALK, TransportMode.TAXI]
+    specs = [
+        PlanSpec("a", spots_a, 2, modes),
+        PlanSpec("b", spots_b, 3, modes),
+        PlanSpec("a", list(spots_a), 3, [TransportMode.TRANSIT]),
+    ]
+    serial = dict(plan_batch(specs, CFG, max_workers=1, trials=30))
+    pooled = dict(plan_batch(specs, CFG, max_workers=2, trials=30))
+
+    assert specs[0].distances is specs[2].distances
+    assert specs[0].distances is not specs[1].distances
+    assert sorted(serial) == sorted(pooled) == [0, 1, 2]
+    for index, spec in enumerate(specs):
+        assert set(pooled[index]) == set(spec.modes)
+        for mode in spec.modes:
+            assert pooled[index][mode][1] == serial[index][mode][1]
+
+
+def test_improvements_stream_decreasing_scores():
+    spots = make_spots(30)
+    seen = []
+    itin, score, _ = plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.WALK, trials=300, seed=0,
+        on_improvement=lambda itinerary, s: seen.append((itinerary, s)),
+        improvement_interval_ms=0,
+    )
+    scores = [s for _, s in seen]
+    assert len(scores) > 1
+    assert all(b < a for a, b in zip(scores, scores[1:]))
+    assert score <= scores[-1] + 1e-6
+    assert all(sum(len(d.spots) for d in i.days) == len(spots) for i, _ in seen)
+
+    throttled = []
+    plan_itinerary_soft_constraints(
+        "test", spots, 3, CFG, TransportMode.WALK, trials=300, seed=0,
+        on_improvement=lambda itinerary, s: throttled.append(s),
+        improvement_interval_ms=60_000,
+    )
+    assert len(throttled) == 1  # only the starting itinerary
+
+
+def test_concurrent_modes_forward_improvements():
+    spots = make_spots(20)
+    modes = [TransportMode.WALK, TransportMode.TAXI]
+    seen = []
+    outcomes = plan_modes_concurrently(
+        "test", spots, 2, CFG, modes, max_workers=2, trials=100,
+        on_improvement=lambda mode, itinerary, s: seen.append((mode, s)),
+        improvement_interval_ms=0,
+    )
+    assert set(outcomes) == set(modes)
+    for mode in modes:
+        scores = [s for m, s in seen if m == mode]
+        assert scores
+        assert all(b < a for a, b in zip(scores, scores[1:]))
+
+
+def test_concurrent_modes_forward_selection_improvements():
+    spots = make_spots(80)
+    prizes = [random.Random(i).random() for i in range(80)]
+    modes = [TransportMode.WALK, TransportMode.TAXI]
+    seen = []
+    plan_modes_concurrently(
+        "test", spots, 3, CFG, modes, max_workers=2, trials=300,
+        on_improvement=lambda mode, itinerary, s: seen.append((mode, itinerary, s)),
+        improvement_interval_ms=0, selection=CandidateSelection(visits=9, prizes=prizes),
+    )
+    taxi = [(itinerary, s) for mode, itinerary, s in seen if mode == TransportMode.TAXI]
+    # the taxi plans stay within the limits, so their penalty ties at 0
+    assert len(taxi) > 2
+    assert all(s == 0.0 for _, s in taxi)
+    for mode, itinerary, s in seen:
+        assert s == pytest.approx(score_itinerary(itinerary, CFG, mode)[0])
+
+
+@pytest.mark.parametrize("n,days", [(20, 3), (7, 3), (30, 7), (2, 3)])
+def test_clustered_days_are_balanced(n, days):
+    spots = make_spots(n)
+    itin = build_clustered_itinerary("test", spots, days)
+    sizes = [len(d.spots) for d in itin.days]
+    assert len(sizes) == days
+    assert sum(sizes) == n
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_clustered_starts_follow_the_seed():
+    spots = make_spots(40)
+    matrix = TravelMatrix(spots, TransportMode.WALK)
+
+    def split(seed):
+        return sorted(sorted(path) for path in _initial_day_paths(spots, 4, matrix, initial="cluster", seed=seed))
+
+    assert split(3) == split(3)
+    assert len({str(split(seed)) for seed in range(6)}) > 1
+
+
+def test_clustered_days_are_compact():
+    # two well separated neighbourhoods must end up on different days
+    spots = make_spots(6) + [
+        Spot(name=f"far-{i}", lat=31.9 + i * 0.01, lon=122.0, category="museum") for i in range(6)
+    ]
+    itin = build_clustered_itinerary("test", spots, 2)
+    for day in itin.days:
+        assert len({s.name.startswith("far-") for s in day.spots}) == 1
@@ -0,0 +1,107 @@
+"""
+Tests for intra-day route improvement (2-opt / Or-opt).
+"""
+import sys
+import os
+import random
+from itertools import permutations
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from agent.models import Spot, DayPlan, Itinerary
+from agent.geometry import TransportMode
+from agent.travel_matrix import TravelMatrix
+from agent.routing import RouteOptimizer, exact_open_path, improve_itinerary_routes
+
+
+def make_matrix(n: int, seed: int = 7) -> TravelMatrix:
+    rng = random.Random(seed)
+    spots = [
+        Spot(name=f"s{i}", lat=35.0 + rng.random() * 0.2, lon=135.7 + rng.random() * 0.2, category="temple")
+        for i in range(n)
+    ]
+    return TravelMatrix(spots, TransportMode.WALK)
+
+
+@pytest.mark.parametrize("n", [3, 8, 12, 40])
+def test_improve_never_lengthens_and_keeps_spots(n):
+    matrix = make_matrix(n)
+    router = RouteOptimizer(matrix)
+    rng = random.Random(n)
+    for _ in range(5):
+        path = list(range(n))
+        rng.shuffle(path)
+        improved = router.improve(path)
+        assert sorted(improved) == list(range(n))
+        assert matrix.path_km(improved) <= matrix.path_km(path) + 1e-9
+
+
+def test_improve_beats_nearest_neighbour_on_average():
+    total_nn = total_ls = 0.0
+    for seed in range(10):
+        matrix = make_matrix(30, seed)
+        router = RouteOptimizer(matrix)
+        nn = matrix.nearest_neighbor_order(list(range(30)))
+        total_nn += matrix.path_km(nn)
+        total_ls += matrix.path_km(router.improve(nn))
+    assert total_ls < total_nn
+
+
+def test_insert_and_remove_repair():
+    matrix = make_matrix(20)
+    router = RouteOptimizer(matrix)
+    path = router.improve(list(range(10)))
+
+    grown = router.insert(path, 15)
+    assert sorted(grown) == sorted(path + [15])
+
+    shrunk = router.remove(grown, grown.index(3))
+    assert sorted(shrunk) == sorted(p for p in grown if p != 3)
+
+    assert router.insert([], 4) == [4]
+    assert router.remove([4], 0) == []
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 7])
+def test_exact_open_path_matches_brute_force(n):
+    matrix = make_matrix(12, seed=n)
+    nodes = [2, 9, 4, 11, 0, 7, 5][:n]
+    best = min(matrix.path_km(list(p)) for p in permutations(nodes))
+    path = exact_open_path(matrix.km, nodes)
+    assert sorted(path) == sorted(nodes)
+    assert matrix.path_km(path) == pytest.approx(best)
+
+
+def test_finish_is_exact_for_small_routes_and_memoized():
+    matrix = make_matrix(12)
+    router = RouteOptimizer(matrix, exact_max_spots=8)
+    path = [5, 1, 9, 3, 7, 0, 11]
+    best = min(matrix.path_km(list(p)) for p in permutations(path))
+
+    finished = router.finish(path)
+    assert matrix.path_km(finished) == pytest.approx(best)
+    # any ordering of the same spots hits the memo
+    assert router.finish(path[::-1]) == finished
+    assert len(router._exact) == 1
+
+
+def test_improve_itinerary_routes_updates_distances():
+    matrix = make_matrix(10)
+    spots = matrix.spots
+    itin = Itinerary(
+        city="kyoto",
+        days=[
+            DayPlan(day=1, spots=spots[:5], total_distance_km=0.0),
+            DayPlan(day=2, spots=spots[5:], total_distance_km=0.0),
+        ],
+    )
+    before = [matrix.path_km(list(range(5))), matrix.path_km(list(range(5, 10)))]
+
+    improve_itinerary_routes(itin)
+
+    assert sorted(s.name for s in itin.days[0].spots) == sorted(s.name for s in spots[:5])
+    for day, old in zip(itin.days, before):
+        assert day.total_distance_km <= round(old, 2) + 0.01
+        assert day.total_distance_km == round(matrix.path_km(matrix.indices_of(day.spots)), 2)
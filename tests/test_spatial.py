@@ -0,0 +1,107 @@
+"""
+Tests for the grid spatial index.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.spatial import GridIndex
+
+
+def make_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # a dense centre plus sparse outskirts, like real city data
+    centre = rng.normal((52.52, 13.40), 0.01, size=(n // 2, 2))
+    outskirts = rng.uniform((52.35, 13.10), (52.65, 13.75), size=(n - n // 2, 2))
+    points = np.vstack((centre, outskirts))
+    return points[:, 0], points[:, 1]
+
+
+def brute_force(index, lat, lon):
+    query = index._project([lat], [lon])[0]
+    return np.hypot(*(index.points - query).T)
+
+
+@pytest.mark.parametrize("cell_km", [None, 0.2, 5.0])
+def test_nearest_matches_brute_force(cell_km):
+    lats, lons = make_points(400)
+    index = GridIndex(lats, lons, cell_km)
+    for lat, lon in [(52.52, 13.40), (52.40, 13.70), (53.0, 14.0)]:
+        found, km = index.nearest(lat, lon, 7)
+        expected = np.sort(brute_force(index, lat, lon))[:7]
+        assert km == pytest.approx(expected)
+        assert np.all(np.diff(km) >= 0)
+
+
+def test_within_matches_brute_force():
+    lats, lons = make_points(400)
+    index = GridIndex(lats, lons)
+    found, km = index.within(52.52, 13.40, 1.5)
+    d = brute_force(index, 52.52, 13.40)
+    assert sorted(found.tolist()) == sorted(np.flatnonzero(d <= 1.5).tolist())
+    assert np.all(km <= 1.5)
+
+
+def test_neighbor_lists_match_brute_force():
+    lats, lons = make_points(300, seed=1)
+    index = GridIndex(lats, lons)
+    near, km = index.neighbor_lists(5)
+    assert near.shape == km.shape == (300, 5)
+    for i in range(300):
+        d = brute_force(index, lats[i], lons[i])
+        d[i] = np.inf
+        assert km[i] == pytest.approx(np.sort(d)[:5])
+        assert i not in near[i]
+
+
+def test_small_sets_are_padded():
+    index = GridIndex([52.5, 52.51, 52.52], [13.4, 13.4, 13.4])
+    near, km = index.neighbor_lists(4)
+    assert (near[:, 2:] == -1).all()
+    assert np.isinf(km[:, 2:]).all()
+    assert len(index.nearest(52.5, 13.4, 10)[0]) == 3
+    assert len(GridIndex([], []).nearest(52.5, 13.4, 3)[0]) == 0
+
+
+@pytest.mark.parametrize("cell_km", [None, 0.2, 50.0])
+def test_in_bbox_matches_brute_force(cell_km):
+    lats, lons = make_points(400)
+    index = GridIndex(lats, lons, cell_km)
+    for box in [(52.50, 13.35, 52.54, 13.45), (52.0, 13.0, 53.0, 14.0), (52.7, 13.0, 52.8, 13.1)]:
+        south, west, north, east = box
+        expected = np.flatnonzero((lats >= south) & (lats <= north) & (lons >= west) & (lons <= east))
+        assert index.in_bbox(*box).tolist() == expected.tolist()
+    assert len(index.in_bbox(52.6, 13.3, 52.5, 13.4)) == 0
+
+
+def test_pairs_within_matches_brute_force():
+    lats, lons = make_points(300, seed=2)
+    index = GridIndex(lats, lons)
+    i, j, km = index.pairs_within(0.3)
+    expected = [
+        (a, b) for a in range(300) for b in range(a + 1, 300)
+        if np.hypot(*(index.points[a] - index.points[b])) <= 0.3
+    ]
+    assert list(zip(i.tolist(), j.tolist())) == expected
+    assert np.all(km <= 0.3)
+    assert len(GridIndex([52.5], [13.4]).pairs_within(1.0)[0]) == 0
+
+
+def test_far_away_queries_stay_fast():
+    lats, lons = make_points(2000, seed=3)
+    # small cells put Paris hundreds of rings away from the data
+    index = GridIndex(np.append(lats, 48.0), np.append(lons, 11.0), cell_km=0.1)
+    start = time.perf_counter()
+    for lat, lon in [(48.85, 2.35), (0.0, 0.0), (52.0, 11.0)]:
+        found, km = index.nearest(lat, lon, 20)
+        assert km == pytest.approx(np.sort(brute_force(index, lat, lon))[:20])
+        found, km = index.within(lat, lon, 20000.0)
+        assert len(found) == len(index)
+    near, km = index.neighbor_lists(3)
+    assert km[-1] == pytest.approx(np.sort(brute_force(index, 48.0, 11.0))[1:4])
+    assert time.perf_counter() - start < 2.0
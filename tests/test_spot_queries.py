@@ -0,0 +1,115 @@
+"""
+Tests for the /api/spots query parameters: spatial queries, paging,
+field projection and the streamed listing.
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app reads these at import; nothing here calls Supabase or the Places API
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:1')
+os.environ.setdefault('SUPABASE_SERVICE_KEY', 'test')
+os.environ.setdefault('GOOGLE_PLACES_API_KEY', 'test')
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def spots_view(monkeypatch):
+    """GET /api/spots/<city>?<query> without the rate limit; returns (status, parsed body)."""
+    monkeypatch.setattr(app, '_fetch_spots_from_places_api', lambda city, query=None: [])
+    view = app.app.view_functions['get_spots'].__wrapped__
+
+    def get(city, query=''):
+        with app.app.test_request_context(f'/api/spots/{city}?{query}'):
+            response = app.app.make_response(view(city))
+            return response.status_code, json.loads(response.get_data())
+
+    return get
+
+
+def test_near_returns_nearest_first(spots_view):
+    status, body = spots_view('berlin', 'near=52.52,13.40&k=5')
+    assert status == 200
+    distances = [s['distance_m'] for s in body['data']['spots']]
+    assert len(distances) == 5
+    assert distances == sorted(distances)
+
+    status, body = spots_view('berlin', 'near=52.52,13.40&radius=300')
+    assert status == 200
+    assert all(s['distance_m'] <= 300 for s in body['data']['spots'])
+
+
+def test_far_away_queries_are_answered_quickly(spots_view):
+    start = time.perf_counter()
+    for query in ('near=48.85,2.35&k=20', 'near=0,0', 'near=48.85,2.35&radius=50000'):
+        status, body = spots_view('berlin', query)
+        assert status == 200
+    assert time.perf_counter() - start < 2.0
+    assert body['data']['spots'] == []
+
+
+@pytest.mark.parametrize("query", [
+    'k=3', 'near=1', 'near=52,13&bbox=1,2,3,4', 'bbox=13.4,52.5,13.3,52.6',
+    'near=52,13&k=0', 'near=52,13&radius=-1', 'near=52,13&radius=50001', 'bbox=1,2,3,4&radius=3',
+])
+def test_invalid_spatial_queries(spots_view, query):
+    status, body = spots_view('berlin', query)
+    assert status == 400
+    assert body['status'] == 'error'
+
+
+def test_listing_is_streamed_with_the_page_envelope(spots_view, monkeypatch):
+    monkeypatch.setattr(app, 'SPOTS_STREAM_CHUNK', 7)
+    monkeypatch.setattr(app, '_fetch_spots_from_places_api', lambda city, query=None: [])
+    view = app.app.view_functions['get_spots'].__wrapped__
+    with app.app.test_request_context('/api/spots/paris'):
+        response = app.app.make_response(view('paris'))
+        assert response.is_streamed
+        body = json.loads(response.get_data())
+
+    data = body['data']
+    expected = app.spot_store.client_dicts('paris', app._spots_by_popularity('paris'))
+    assert body['status'] == 'success'
+    assert data['spots'] == expected
+    assert (data['total'], data['offset'], data['next_offset']) == (len(expected), 0, None)
+
+    status, tail = spots_view('paris', 'offset=10&fields=name')
+    assert tail['data']['spots'] == [{'name': s['name']} for s in expected[10:]]
+    assert tail['data']['offset'] == 10
+
+
+def test_pages_cover_the_listing(spots_view):
+    _, full = spots_view('berlin')
+    names, offset = [], 0
+    while offset is not None:
+        status, body = spots_view('berlin', f'offset={offset}&limit=500')
+        assert status == 200
+        assert body['data']['total'] == full['data']['total']
+        names += [s['name'] for s in body['data']['spots']]
+        offset = body['data']['next_offset']
+    assert names == [s['name'] for s in full['data']['spots']]
+
+    _, past = spots_view('berlin', 'offset=100000&limit=10')
+    assert past['data']['spots'] == [] and past['data']['next_offset'] is None
+
+
+def test_fields_projection(spots_view):
+    _, body = spots_view('berlin', 'limit=5&fields=name,lat,lon')
+    assert all(set(s) == {'name', 'lat', 'lon'} for s in body['data']['spots'])
+    _, body = spots_view('berlin', 'near=52.52,13.40&k=3&fields=name,distance_m')
+    assert all(set(s) == {'name', 'distance_m'} for s in body['data']['spots'])
+
+
+@pytest.mark.parametrize("query", [
+    'limit=0', 'limit=501', 'limit=x', 'offset=-1', 'fields=', 'fields=name,bogus',
+])
+def test_invalid_page_parameters(spots_view, query):
+    status, body = spots_view('berlin', query)
+    assert status == 400
+    assert body['message'] == "Invalid spot query"
@@ -0,0 +1,91 @@
+"""
+Tests for compiled spot snapshots and their use by the spot store.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from agent.spot_snapshot import SpotSnapshot, write_snapshot
+from agent.spot_store import SpotStore, parse_spots
+from scripts.compile_spot_snapshots import compile_city
+
+SPOTS = [
+    {"name": "Pergamon", "lat": 52.5212, "lon": 13.3969, "category": "museum", "rating": 4.7,
+     "description": "Antiquities", "city": "Berlin",
+     "nearby_foods": [{"name": "Café", "category": "cafe", "distance": 120.0}]},
+    {"name": "Tiergarten", "lat": 52.5145, "lon": 13.3501, "category": "outdoor", "city": "Berlin"},
+    {"name": "天坛", "lat": 39.8822, "lon": 116.4066, "category": "temple", "duration_minutes": 30,
+     "rating": 4.0, "nearby_shops": []},
+]
+
+
+def write_city(tmp_path, spots, city="berlin"):
+    path = tmp_path / f"spots_{city}.json"
+    path.write_text(json.dumps(spots, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def test_round_trip(tmp_path):
+    spots = parse_spots(json.dumps(SPOTS).encode())
+    path = str(tmp_path / "berlin.snap")
+    write_snapshot(path, spots, "v1", {"size": 1})
+
+    snapshot = SpotSnapshot(path)
+    assert len(snapshot) == 3
+    assert snapshot.data_version == "v1"
+    assert snapshot.lats.tolist() == [s.lat for s in spots]
+    assert not snapshot.lats.flags.writeable
+    assert snapshot.spots() == spots
+
+
+def test_rejects_ratings_it_cannot_store(tmp_path):
+    spots = parse_spots(json.dumps([dict(SPOTS[0], rating=4.25)]).encode())
+    with pytest.raises(ValueError):
+        write_snapshot(str(tmp_path / "x.snap"), spots, "v1", {})
+
+
+def test_store_prefers_a_current_snapshot(tmp_path):
+    source = write_city(tmp_path, SPOTS)
+    compile_city(source, tmp_path / "snapshots")
+    from_json = SpotStore(str(tmp_path), str(tmp_path / "none")).get("berlin")
+
+    entry = SpotStore(str(tmp_path)).get("berlin")
+    assert list(entry.spots) == list(from_json.spots)
+    assert entry.data_version == from_json.data_version
+    assert entry.content_hash == from_json.content_hash
+    # coordinates are views of the mapped file
+    assert not entry.lats.flags.writeable
+
+
+def test_store_ignores_stale_and_corrupt_snapshots(tmp_path):
+    source = write_city(tmp_path, SPOTS)
+    snapshot = compile_city(source, tmp_path / "snapshots")
+    write_city(tmp_path, SPOTS[:2])
+
+    entry = SpotStore(str(tmp_path)).get("berlin")
+    assert [s.name for s in entry.spots] == ["Pergamon", "Tiergarten"]
+    assert entry.lats.flags.writeable  # parsed from the JSON
+
+    snapshot.write_bytes(b"garbage")
+    assert len(SpotStore(str(tmp_path)).get("berlin")) == 2
+
+
+def test_details_are_decoded_on_demand(tmp_path):
+    spots = parse_spots(json.dumps(SPOTS, ensure_ascii=False).encode())
+    path = str(tmp_path / "berlin.snap")
+    write_snapshot(path, spots, "v1", {})
+
+    snapshot = SpotSnapshot(path)
+    lean = snapshot.spots(details=False)
+    assert [s.name for s in lean] == [s.name for s in spots]
+    assert all(s.description is None and s.nearby_foods is None for s in lean)
+    assert snapshot.details(0) == {
+        "description": "Antiquities",
+        "nearby_foods": [{"name": "Café", "category": "cafe", "distance": 120.0}],
+        "nearby_shops": None,
+    }
+    assert snapshot.details(2)["nearby_shops"] == []
@@ -0,0 +1,133 @@
+"""
+Tests for the in-memory city spot store.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cache import data_version_for_spots
+from agent.spot_store import SpotStore, parse_spots
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+SPOTS = [
+    {"name": "A", "lat": 52.5, "lon": 13.4, "category": "museum", "rating": 4.5},
+    {"name": "B", "lat": 52.51, "lon": 13.38, "category": "temple", "duration_minutes": 30},
+]
+
+
+def write(path, spots):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(spots, f)
+
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_loads_once_and_fills_defaults(tmp_path):
+    write(tmp_path / 'spots_berlin.json', SPOTS)
+    store = SpotStore(str(tmp_path))
+
+    entry = store.get('Berlin')
+    assert [s.name for s in entry.spots] == ["A", "B"]
+    assert [s.duration_minutes for s in entry.spots] == [90, 30]
+    assert entry.lats.tolist() == [52.5, 52.51]
+    assert entry.data_version == data_version_for_spots([s.model_dump() for s in entry.spots])
+
+    assert store.get('berlin') is entry
+    spots = store.spots('berlin')
+    spots.pop()
+    assert len(store.get('berlin')) == 2
+
+
+def test_details_are_kept_aside(tmp_path):
+    spots = [dict(SPOTS[0], description="Old masters", nearby_foods=[{"name": "Café"}]), SPOTS[1]]
+    write(tmp_path / 'spots_berlin.json', spots)
+    store = SpotStore(str(tmp_path))
+
+    entry = store.get('berlin')
+    assert entry.spots[0].description is None
+    assert entry.spots[0].nearby_foods is None
+    # the fingerprint still covers the details
+    full = parse_spots(json.dumps(spots).encode())
+    assert entry.data_version == data_version_for_spots([s.model_dump() for s in full])
+
+    dicts = store.client_dicts('berlin', list(reversed(entry.spots)))
+    assert dicts[1]["description"] == "Old masters"
+    assert dicts[1]["nearby_foods"] == [{"name": "Café"}]
+    assert dicts[0]["description"] is None
+    # spots the store doesn't know are passed through
+    other = entry.spots[0].model_copy(update={"name": "Elsewhere", "description": "Own"})
+    assert store.client_dicts('berlin', [other])[0]["description"] == "Own"
+
+
+def test_spatial_index_rows_are_spots(tmp_path):
+    write(tmp_path / 'spots_berlin.json', SPOTS)
+    entry = SpotStore(str(tmp_path)).get('berlin')
+
+    rows, km = entry.index.nearest(52.509, 13.381, 1)
+    assert entry.spots[rows[0]].name == "B"
+    assert entry.index.in_bbox(52.49, 13.39, 52.505, 13.41).tolist() == [0]
+    assert entry.index is entry.index
+
+
+def test_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / 'spots_berlin.json'
+    write(path, SPOTS)
+    store = SpotStore(str(tmp_path))
+    first = store.get('berlin')
+
+    # same content, new mtime: the parsed spots are kept
+    bump_mtime(path)
+    touched = store.get('berlin')
+    assert touched.spots is first.spots
+    assert touched.mtime_ns != first.mtime_ns
+
+    write(path, SPOTS + [{"name": "C", "lat": 52.4, "lon": 13.5, "category": "outdoor"}])
+    bump_mtime(path)
+    changed = store.get('berlin')
+    assert [s.name for s in changed.spots] == ["A", "B", "C"]
+    assert changed.data_version != first.data_version
+
+
+def test_broken_file_keeps_the_previous_data(tmp_path):
+    path = tmp_path / 'spots_berlin.json'
+    write(path, SPOTS)
+    store = SpotStore(str(tmp_path))
+    first = store.get('berlin')
+
+    path.write_text('[{"name": "broken"', encoding='utf-8')
+    assert store.get('berlin').spots is first.spots
+    assert SpotStore(str(tmp_path)).get('berlin') is None
+
+    write(path, SPOTS[:1])
+    bump_mtime(path)
+    assert [s.name for s in store.get('berlin').spots] == ["A"]
+
+
+def test_bad_records_are_skipped(tmp_path):
+    records = [SPOTS[0], ["not", "a", "record"], {"name": "no coordinates"}, None, SPOTS[1]]
+    write(tmp_path / 'spots_berlin.json', records)
+    entry = SpotStore(str(tmp_path)).get('berlin')
+    assert [s.name for s in entry.spots] == ["A", "B"]
+
+    write(tmp_path / 'spots_paris.json', [None, {"name": "x"}])
+    write(tmp_path / 'spots_rome.json', {"name": "x"})
+    assert SpotStore(str(tmp_path)).get('paris') is None
+    assert SpotStore(str(tmp_path)).get('rome') is None
+
+
+def test_missing_city(tmp_path):
+    store = SpotStore(str(tmp_path))
+    assert store.get('atlantis') is None
+    assert store.spots('atlantis') == []
+
+
+def test_preload_bundled_data():
+    store = SpotStore(DATA_DIR)
+    assert 'berlin' in store.cities()
+    assert store.preload(['london', 'kyoto']) == len(store.get('london')) + len(store.get('kyoto'))
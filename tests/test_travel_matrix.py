@@ -0,0 +1,82 @@
+"""
+Tests for the precomputed travel matrix used by the planner.
+"""
+import sys
+import os
+import pickle
+from copy import deepcopy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from agent.models import Spot
+from agent.geometry import TransportMode, distance, travel_cost_minutes, mode_speed_and_wait
+from agent.travel_matrix import DistanceMatrix, TravelMatrix
+
+
+SPOTS = [
+    Spot(name="A", lat=31.2304, lon=121.4737, category="outdoor"),
+    Spot(name="B", lat=31.2397, lon=121.4998, category="museum"),
+    Spot(name="C", lat=31.2243, lon=121.4768, category="temple"),
+    Spot(name="D", lat=31.1880, lon=121.4370, category="food"),
+]
+
+
+@pytest.mark.parametrize("mode", list(TransportMode))
+def test_matrix_matches_scalar_geometry(mode):
+    matrix = TravelMatrix(SPOTS, mode)
+    for i, a in enumerate(SPOTS):
+        for j, b in enumerate(SPOTS):
+            assert matrix.km_rows[i][j] == pytest.approx(distance(a, b))
+            if i != j:
+                assert matrix.minutes_rows[i][j] == pytest.approx(travel_cost_minutes(a, b, mode))
+
+
+def test_index_of_survives_copies():
+    matrix = TravelMatrix(SPOTS, TransportMode.WALK)
+    assert matrix.index_of(deepcopy(SPOTS[2])) == 2
+
+
+def test_path_totals():
+    matrix = TravelMatrix(SPOTS, TransportMode.TAXI)
+    path = [0, 2, 1]
+    expected = distance(SPOTS[0], SPOTS[2]) + distance(SPOTS[2], SPOTS[1])
+    assert matrix.path_km(path) == pytest.approx(expected)
+    assert matrix.path_km([3]) == 0.0
+    assert matrix.path_minutes([]) == 0.0
+
+
+def test_modes_share_one_distance_matrix():
+    distances = DistanceMatrix(SPOTS)
+    walk = distances.for_mode(TransportMode.WALK)
+    taxi = distances.for_mode(TransportMode.TAXI)
+
+    assert walk.km is taxi.km is distances.km
+    assert distances.for_mode(TransportMode.WALK) is walk
+    for mode in TransportMode:
+        speed, wait = mode_speed_and_wait(mode)
+        matrix = distances.for_mode(mode)
+        assert np.allclose(matrix.minutes, distances.km / speed * 60 + wait)
+
+
+def test_distance_matrix_pickles_compactly():
+    distances = DistanceMatrix(SPOTS)
+    distances.for_mode(TransportMode.TRANSIT)
+    restored = pickle.loads(pickle.dumps(distances))
+    assert np.array_equal(restored.km, distances.km)
+    assert restored.km_rows == distances.km_rows
+    assert restored.index_of(SPOTS[3]) == 3
+
+
+def test_neighbor_lists_follow_distances():
+    distances = DistanceMatrix(SPOTS)
+    lists = distances.neighbor_lists(2)
+    for i, near in enumerate(lists):
+        others = sorted((j for j in range(len(SPOTS)) if j != i), key=lambda j: distances.km[i, j])
+        assert near == others[:2]
+    assert distances.neighbor_lists(2) is lists
+    assert distances.neighbor_lists(10) == [
+        sorted((j for j in range(4) if j != i), key=lambda j: distances.km[i, j]) for i in range(4)
+    ]